@@ -0,0 +1,222 @@
+import asyncio
+import json
+import logging
+import os
+import time
+from collections import Counter, deque
+from typing import Any, Deque, Dict, List, Tuple
+
+from persistence import atomic_write_json
+
+logger = logging.getLogger(__name__)
+
+# сколько часов почасовых счётчиков держать в памяти
+COUNTER_HOURS = 48
+
+
+class ActivityLog:
+    """Who opened which city and vacancy: cheap events from handlers, written in batches.
+
+    `emit` only appends to a bounded ring buffer (the oldest events are
+    dropped if the writer falls behind) and bumps per-hour counters, so the
+    stats screen never reads the file. A background task writes the buffer
+    to a size-rotated JSONL file every `flush_interval` seconds, in a worker
+    thread.
+
+    In sharded mode every shard has its own log; `share()` makes each flush
+    also dump the counters to a small JSON file, and `load_peers()` reads
+    the other shards' dumps so the counters cover the whole bot.
+    """
+
+    def __init__(
+        self,
+        path: str = "activity.jsonl",
+        capacity: int = 10000,
+        flush_interval: float = 5.0,
+        max_bytes: int = 5 * 1024 * 1024,
+        backup_count: int = 5,
+    ):
+        self.path = path
+        self.flush_interval = flush_interval
+        self.max_bytes = max_bytes
+        self.backup_count = backup_count
+        self._buffer: Deque[Dict[str, Any]] = deque(maxlen=capacity)
+        # час (unix time // 3600) -> счётчик (вид, ключ)
+        self._hours: Dict[int, Counter] = {}
+        self.emitted = 0
+        self.dropped = 0
+        self.written = 0
+        # свой дамп счётчиков и дампы других шардов (см. share)
+        self.counters_path: str | None = None
+        self.peer_paths: List[str] = []
+        self._peers: List[Dict[str, Any]] = []
+        self._wake: asyncio.Event | None = None
+        self._task: asyncio.Task | None = None
+        self._lock: asyncio.Lock | None = None
+
+    # ==Запись событий==
+    def emit(self, kind: str, user_id: int, key: Any = None, **fields: Any):
+        """Record one event; `key` is what the per-hour counters count (city name, job id)."""
+        now = time.time()
+        if len(self._buffer) == self._buffer.maxlen:
+            self.dropped += 1
+        event = {"ts": round(now, 3), "ev": kind, "uid": user_id}
+        event.update(fields)
+        self._buffer.append(event)
+        self.emitted += 1
+        hour = int(now // 3600)
+        counter = self._hours.get(hour)
+        if counter is None:
+            counter = self._hours[hour] = Counter()
+            for old in [h for h in self._hours if h <= hour - COUNTER_HOURS]:
+                del self._hours[old]
+        counter[(kind, key)] += 1
+        # половина буфера — пишем, не дожидаясь таймера
+        if self._wake is not None and len(self._buffer) * 2 >= self._buffer.maxlen:
+            self._wake.set()
+
+    # ==Счётчики==
+    def _window(self, hours: int) -> List[Counter]:
+        current = int(time.time() // 3600)
+        counters = [c for h, c in self._hours.items() if h > current - hours]
+        for peer in self._peers:
+            counters += [c for h, c in peer["hours"].items() if h > current - hours]
+        return counters
+
+    def count(self, kind: str, hours: int = 24) -> int:
+        return sum(n for counter in self._window(hours) for (k, _), n in counter.items() if k == kind)
+
+    def top(self, kind: str, hours: int = 24, limit: int = 10) -> List[Tuple[Any, int]]:
+        total: Counter = Counter()
+        for counter in self._window(hours):
+            for (k, key), n in counter.items():
+                if k == kind:
+                    total[key] += n
+        return total.most_common(limit)
+
+    def hourly(self, kind: str, hours: int = 6) -> List[Tuple[int, int]]:
+        """[(hour start as unix time, events)] for the last `hours` hours, oldest first."""
+        current = int(time.time() // 3600)
+        sources = [self._hours] + [peer["hours"] for peer in self._peers]
+        return [
+            (h * 3600, sum(n for hours_ in sources for (k, _), n in hours_.get(h, Counter()).items() if k == kind))
+            for h in range(current - hours + 1, current + 1)
+        ]
+
+    # ==Общие счётчики шардов==
+    def share(self, counters_path: str, peer_paths: List[str]):
+        """Dump own counters to `counters_path` on every flush; count `peer_paths` dumps too."""
+        self.counters_path = counters_path
+        self.peer_paths = peer_paths
+
+    @property
+    def shards(self) -> int:
+        """Processes whose counters are included: 1 unless sharded."""
+        return 1 + len(self._peers)
+
+    def _counters_snapshot(self) -> Dict[str, Any]:
+        return {
+            "hours": {str(h): [[k, key, n] for (k, key), n in c.items()] for h, c in self._hours.items()},
+            "stats": self.stats(),
+        }
+
+    async def load_peers(self):
+        """Re-read the other shards' dumps (as of their last flush, up to `flush_interval` old)."""
+        if self.peer_paths:
+            self._peers = await asyncio.to_thread(self._read_peers)
+
+    def _read_peers(self) -> List[Dict[str, Any]]:
+        peers = []
+        for path in self.peer_paths:
+            try:
+                with open(path, encoding="utf-8") as f:
+                    data = json.load(f)
+                hours = {int(h): Counter({(k, key): n for k, key, n in items}) for h, items in data["hours"].items()}
+                peers.append({"hours": hours, "stats": data["stats"]})
+            except FileNotFoundError:
+                # шард ещё ничего не записал
+                continue
+            except Exception:
+                logger.exception("Failed to read activity counters %s", path)
+        return peers
+
+    # ==Фоновая запись==
+    def start(self):
+        """Start the background writer. Must be called from a running event loop."""
+        if self._task is not None:
+            return
+        self._wake = asyncio.Event()
+        self._lock = asyncio.Lock()
+        self._task = asyncio.create_task(self._run(), name="activity-writer")
+
+    async def _run(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._wake.wait(), self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wake.clear()
+            # shield: отмена при остановке не должна обрывать начатую запись
+            await asyncio.shield(self.flush())
+
+    async def flush(self):
+        if not self._buffer:
+            return
+        batch = list(self._buffer)
+        self._buffer.clear()
+        try:
+            if self._lock is None:
+                self._write(batch)
+            else:
+                async with self._lock:
+                    await asyncio.to_thread(self._write, batch)
+            self.written += len(batch)
+        except Exception:
+            logger.exception("Failed to write %d activity events to %s", len(batch), self.path)
+        if self.counters_path is not None:
+            try:
+                await asyncio.to_thread(atomic_write_json, self.counters_path, self._counters_snapshot())
+            except Exception:
+                logger.exception("Failed to write activity counters to %s", self.counters_path)
+
+    def _write(self, batch: List[Dict[str, Any]]):
+        data = "".join(json.dumps(event, ensure_ascii=False, separators=(",", ":")) + "\n" for event in batch)
+        try:
+            size = os.path.getsize(self.path)
+        except OSError:
+            size = 0
+        if size and size + len(data) > self.max_bytes:
+            self._rotate()
+        with open(self.path, "a", encoding="utf-8") as f:
+            f.write(data)
+
+    def _rotate(self):
+        # как RotatingFileHandler: activity.jsonl -> .1 -> .2 ... старший удаляется
+        for i in range(self.backup_count - 1, 0, -1):
+            source = f"{self.path}.{i}"
+            if os.path.exists(source):
+                os.replace(source, f"{self.path}.{i + 1}")
+        if self.backup_count > 0:
+            os.replace(self.path, f"{self.path}.1")
+        else:
+            os.remove(self.path)
+
+    async def close(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.flush()
+
+    def stats(self) -> Dict[str, int]:
+        return {"emitted": self.emitted, "written": self.written, "buffered": len(self._buffer), "dropped": self.dropped}
+
+    def total_stats(self) -> Dict[str, int]:
+        """stats() summed with the other shards' (as of their last dump)."""
+        total = Counter(self.stats())
+        for peer in self._peers:
+            total.update(peer["stats"])
+        return dict(total)
@@ -0,0 +1,99 @@
+"""Per-callback dispatch cost: old F.data.startswith chain vs CallbackRouter trie.
+
+The "before" side rebuilds the filter chain obrabotchik.py used to register
+(same order, same MagicFilter objects) and resolves filters one by one like
+aiogram does, without aiogram's per-handler async overhead, so it is a lower
+bound for the old cost. The "after" side is the real `callbacks` router from
+obrabotchik.py (resolve only: parsing + typed argument decoding).
+
+    python benchmarks/bench_callbacks.py [iterations]
+"""
+import os
+import sys
+import timeit
+from types import SimpleNamespace
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from magic_filter import F  # noqa: E402
+from obrabotchik import callbacks  # noqa: E402
+
+# порядок как в старом obrabotchik.py
+OLD_FILTERS = [
+    F.data.startswith("manage_city:"),
+    F.data.startswith("admin_jobs:"),
+    F.data.startswith("admin_job:"),
+    F.data.startswith("admin_city_rename:"),
+    F.data.startswith("admin_city_delete:"),
+    F.data.startswith("admin_job_edit_title:"),
+    F.data.startswith("admin_job_edit_desc:"),
+    F.data.startswith("admin_job_edit_url:"),
+    F.data.startswith("admin_job_delete:"),
+    F.data.startswith("city:"),
+    F.data == "back:cities",
+    F.data.startswith("job:"),
+    F.data == "back:cities",
+    F.data.startswith("back:jobs:"),
+    F.data.startswith("admin_city:"),
+    F.data == "roles_menu",
+    F.data.startswith("role:"),
+    F.data == "roles:list_admins",
+    F.data.startswith("roles:manage_user:"),
+    F.data.startswith("roles:toggle:"),
+    F.data == "dev_menu",
+    F.data == "dev:restart",
+    F.data == "dev:stop",
+    F.data == "dev:logs_tail",
+    F.data == "dev:logs_download",
+    F.data == "dev:loglevel",
+    F.data.startswith("dev:loglevel:set:"),
+    F.data == "admin_back_to_city",
+    F.data == "admin_back_to_title",
+    F.data == "admin_back_to_desc",
+    F.data == "admin_back",
+]
+
+OLD_SAMPLE = [
+    "city:Махачкала", "job:Махачкала:3", "back:jobs:Махачкала", "back:cities",
+    "admin_job:Махачкала:3", "roles:toggle:admin:123456789", "dev:loglevel:set:DEBUG", "admin_back",
+]
+NEW_SAMPLE = [
+    "city:1", "job:3:0", "back:jobs:1:0", "back:cities",
+    "admin_job:3:0", "roles:toggle:admin:123456789", "dev:loglevel:set:DEBUG", "admin_back",
+]
+
+
+def old_dispatch(event):
+    for i, flt in enumerate(OLD_FILTERS):
+        if flt.resolve(event):
+            return i
+    return None
+
+
+def main():
+    iterations = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    router = callbacks
+    old_events = [SimpleNamespace(data=d) for d in OLD_SAMPLE]
+    for event in old_events:
+        assert old_dispatch(event) is not None, event.data
+    for data in NEW_SAMPLE:
+        assert router.resolve(data) is not None, data
+
+    def run_old():
+        for event in old_events:
+            old_dispatch(event)
+
+    def run_new():
+        for data in NEW_SAMPLE:
+            router.resolve(data)
+
+    per_call = len(NEW_SAMPLE) * iterations
+    old_ns = min(timeit.repeat(run_old, number=iterations, repeat=3)) / per_call * 1e9
+    new_ns = min(timeit.repeat(run_new, number=iterations, repeat=3)) / per_call * 1e9
+    print(f"filter chain ({len(OLD_FILTERS)} filters): {old_ns:8.0f} ns/callback")
+    print(f"trie router  ({len(router.routes)} routes):  {new_ns:8.0f} ns/callback")
+    print(f"speedup: x{old_ns / new_ns:.1f}")
+
+
+if __name__ == "__main__":
+    main()
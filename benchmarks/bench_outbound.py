@@ -0,0 +1,96 @@
+"""Outbound pacing against the fake Bot API: raw session vs OutboundScheduler.
+
+Fires a burst of sendMessage calls to a few chats plus callback answers at
+a local FakeBotAPI that enforces Telegram-like flood limits, once with a
+plain session and once with outbound.OutboundScheduler installed. Reports
+calls that failed with 429, total time and how long callback answers took
+while the burst was queued.
+
+    python benchmarks/bench_outbound.py [--messages 200] [--chats 5]
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from aiogram import Bot  # noqa: E402
+from aiogram.client.session.aiohttp import AiohttpSession  # noqa: E402
+from aiogram.client.telegram import TelegramAPIServer  # noqa: E402
+from aiogram.exceptions import TelegramRetryAfter  # noqa: E402
+
+from fake_bot_api import FakeBotAPI  # noqa: E402
+from outbound import OutboundScheduler  # noqa: E402
+
+
+async def run_once(base: str, args, paced: bool):
+    session = AiohttpSession(api=TelegramAPIServer.from_base(base))
+    scheduler = None
+    if paced:
+        scheduler = OutboundScheduler(global_rate=args.global_rate, chat_rate=args.chat_rate, chat_burst=args.chat_burst)
+        session.middleware(scheduler)
+    bot = Bot(token="42:BENCH", session=session)
+    failed = 0
+    answer_times = []
+
+    async def send(i: int):
+        nonlocal failed
+        try:
+            await bot.send_message(1000 + i % args.chats, f"msg {i}")
+        except TelegramRetryAfter:
+            failed += 1
+
+    async def answer(i: int):
+        nonlocal failed
+        await asyncio.sleep(0.05 * i)
+        started = time.perf_counter()
+        try:
+            await bot.answer_callback_query(str(i))
+        except TelegramRetryAfter:
+            failed += 1
+        answer_times.append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(send(i) for i in range(args.messages)), *(answer(i) for i in range(args.answers)))
+    elapsed = time.perf_counter() - started
+    await bot.session.close()
+    return failed, elapsed, answer_times, scheduler
+
+
+async def main_async(args):
+    results = []
+    for paced in (False, True):
+        api = FakeBotAPI(chat_rate=args.api_chat_rate, global_rate=args.api_global_rate, retry_after=1)
+        base = await api.start()
+        try:
+            results.append((paced, await run_once(base, args, paced), api.stats()))
+        finally:
+            await api.stop()
+    for paced, (failed, elapsed, answer_times, scheduler), api_stats in results:
+        label = "OutboundScheduler" if paced else "raw session      "
+        print(f"{label}: failed={failed:4d}  429 from API={api_stats['rejected_429']:4d}  "
+              f"total={elapsed:6.2f}s  callback answer p50={statistics.median(answer_times) * 1000:7.1f}ms "
+              f"max={max(answer_times) * 1000:7.1f}ms")
+        if scheduler is not None:
+            print(f"  scheduler: {scheduler.stats()}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--messages", type=int, default=200)
+    parser.add_argument("--chats", type=int, default=5)
+    parser.add_argument("--answers", type=int, default=20)
+    parser.add_argument("--global-rate", type=float, default=25.0, help="scheduler: calls/s in total")
+    parser.add_argument("--chat-rate", type=float, default=10.0, help="scheduler: calls/s per chat")
+    parser.add_argument("--chat-burst", type=float, default=3.0)
+    parser.add_argument("--api-global-rate", type=float, default=30.0, help="fake API: 429 above this")
+    parser.add_argument("--api-chat-rate", type=float, default=10.0, help="fake API: 429 above this per chat")
+    asyncio.run(main_async(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,349 @@
+"""Micro-benchmarks for the catalog hot paths, with JSON output for regression checks.
+
+For every catalog size (`CITIESxVACANCIES`, vacancies spread evenly over the
+cities) a synthetic jobs.json is written to a temporary directory and the
+following are timed:
+
+  jobservice.*  — load, full save, add/update/delete/rename with write-behind on
+  keyboards.*   — Keyboards.cities/jobs/admin construction, KeyboardCache hit
+  roles.*       — permissions() / is_admin() / has_admin_access() lookups
+  search.*      — SearchIndex build, uncached and cached queries (rare and common words)
+  inline.*      — InlineResults pages: cold city (articles built), warm query
+  handler.*     — choose_city / choose_job / admin_list_jobs from obrabotchik.py,
+                  called through callbacks.dispatch with stub CallbackQuery objects
+
+    python benchmarks/bench_suite.py [--sizes 10x100,500x10000,5000x100000] [--output results.json]
+    python benchmarks/bench_suite.py --compare baseline.json   # ratio to an earlier run, >1 = slower now
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Any, Callable, Dict, List
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, ROOT)
+
+DEFAULT_SIZES = "10x100,500x10000,5000x100000"
+# в каталоге тестов роли: столько пользователей с каждой ролью
+ROLE_USERS = 1000
+SHIFTS = ("Дневная", "Ночная")
+SCHEDULES = ("полный", "гибкий", "сменный")
+
+
+# ==Синтетические данные==
+def parse_size(value: str):
+    cities, vacancies = value.lower().split("x")
+    return int(cities), int(vacancies)
+
+
+def make_catalog(cities: int, vacancies: int) -> Dict[str, List[Dict]]:
+    catalog = {f"Город {c}": [] for c in range(cities)}
+    names = list(catalog)
+    for j in range(vacancies):
+        c = j % cities
+        # смена и график делят каталог на половины и трети: поиск по частым, но не сплошным словам
+        desc = "Описание вакансии. " * 8 + f"{SHIFTS[j % 2]} смена, {SCHEDULES[j % 3]} график."
+        catalog[names[c]].append({"title": f"Вакансия {j}", "desc": desc, "url": f"https://example.com/{c}/{j}"})
+    return catalog
+
+
+def write_files(cities: int, vacancies: int):
+    with open("jobs.json", "w", encoding="utf-8") as f:
+        json.dump(make_catalog(cities, vacancies), f, ensure_ascii=False)
+    with open("admins.json", "w", encoding="utf-8") as f:
+        json.dump({
+            "admins": list(range(1, ROLE_USERS + 1)),
+            "super_admins": list(range(ROLE_USERS + 1, 2 * ROLE_USERS + 1)),
+            "developers": [1],
+        }, f)
+
+
+# ==Заглушки aiogram==
+class StubMessage:
+    __slots__ = ("text", "reply_markup")
+
+    async def edit_text(self, text, reply_markup=None, **kwargs):
+        self.text = text
+        self.reply_markup = reply_markup
+
+    async def answer(self, text, reply_markup=None, **kwargs):
+        self.text = text
+        self.reply_markup = reply_markup
+
+
+class StubUser:
+    __slots__ = ("id",)
+
+    def __init__(self, uid: int):
+        self.id = uid
+
+
+class StubCallback:
+    """Just the CallbackQuery surface the catalog handlers touch."""
+    __slots__ = ("data", "message", "from_user")
+
+    def __init__(self, data: str, uid: int = 1):
+        self.data = data
+        self.message = StubMessage()
+        self.from_user = StubUser(uid)
+
+    async def answer(self, *args, **kwargs):
+        pass
+
+
+class StubState:
+    __slots__ = ("data",)
+
+    def __init__(self):
+        self.data = {}
+
+    async def update_data(self, **kwargs):
+        self.data.update(kwargs)
+        return self.data
+
+
+# ==Замеры==
+def measure(fn: Callable[[], Any], number: int, repeat: int) -> Dict[str, float]:
+    """Per-call time in microseconds over `repeat` runs of `number` calls."""
+    runs = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        for _ in range(number):
+            fn()
+        runs.append((time.perf_counter() - started) / number * 1e6)
+    return {"min_us": min(runs), "median_us": statistics.median(runs), "number": number, "repeat": repeat}
+
+
+def measure_async(loop: asyncio.AbstractEventLoop, make_coro: Callable[[], Any], number: int, repeat: int):
+    async def batch():
+        for _ in range(number):
+            await make_coro()
+
+    runs = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        loop.run_until_complete(batch())
+        runs.append((time.perf_counter() - started) / number * 1e6)
+    return {"min_us": min(runs), "median_us": statistics.median(runs), "number": number, "repeat": repeat}
+
+
+class Cycle:
+    """Endless round-robin over sample arguments, so one hot key does not hide misses."""
+
+    def __init__(self, items: List[Any]):
+        self.items = items
+        self.i = -1
+
+    def next(self):
+        self.i = (self.i + 1) % len(self.items)
+        return self.items[self.i]
+
+
+def bench_size(cities: int, vacancies: int, quick: bool) -> List[Dict[str, Any]]:
+    write_files(cities, vacancies)
+    import obrabotchik
+    from keyboards import KeyboardCache, Keyboards, PAGE_SIZE
+    from services import Jobservice, Perm, encode_id
+    from storage import JsonCatalogStorage
+    from search import SearchIndex
+    from inline import InlineResults
+
+    scale = 0.2 if quick else 1.0
+    n = lambda base: max(1, int(base * scale))  # noqa: E731
+    heavy_repeat = 3 if vacancies >= 10000 else 5
+    results = []
+
+    def record(name: str, stats: Dict[str, float]):
+        stats.update(name=name, cities=cities, vacancies=vacancies)
+        results.append(stats)
+        print(f"  {name:<28} {stats['median_us']:12.1f} us  (min {stats['min_us']:.1f})", flush=True)
+
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    try:
+        # --Jobservice--
+        record("jobservice.load", measure(lambda: Jobservice(storage=JsonCatalogStorage("jobs.json")), 1, heavy_repeat))
+        js = Jobservice(storage=JsonCatalogStorage("jobs.json"))
+        record("jobservice.save_all", measure(js.save_jobs, 1, heavy_repeat))
+
+        # правки — как в боте: с отложенной записью, диск не трогаем (задержка больше замера)
+        async def enable_write_behind():
+            js.start_write_behind(3600)
+        loop.run_until_complete(enable_write_behind())
+        city_names = js.get_cities()
+        city_cycle = Cycle(city_names)
+        record("jobservice.add_job", measure(
+            lambda: js.add_job(city_cycle.next(), "Новая", "Описание", "https://example.com/new"), n(2000), 3))
+        job_ids = Cycle([job_id for city in city_names[:50] for job_id, _ in js.get_job_items(city)])
+        record("jobservice.update_job_by_id", measure(
+            lambda: js.update_job_by_id(job_ids.next(), title="Изменено"), n(2000), 3))
+        # удаляем только что добавленные вакансии, каталог остаётся исходного размера
+        added = Cycle([job_id for city in city_names for job_id, job in js.get_job_items(city) if job["title"] == "Новая"])
+        record("jobservice.delete_job_by_id", measure(lambda: js.delete_job_by_id(added.next()), 1, min(len(added.items), n(2000))))
+        renames = Cycle(city_names[-20:])
+
+        # туда и обратно: два переименования на замер
+        def rename():
+            city = renames.next()
+            js.rename_city(city, city + "*")
+            js.rename_city(city + "*", city)
+        record("jobservice.rename_city", measure(rename, n(100), 3))
+
+        # --Клавиатуры--
+        page_items = js.get_city_items(0, PAGE_SIZE)
+        first_city = city_names[0]
+        job_items = js.get_job_items(first_city, 0, PAGE_SIZE)
+        first_city_id = js.get_city_id(first_city)
+        record("keyboards.cities", measure(lambda: Keyboards.cities(page_items, 0, 10), n(5000), 5))
+        record("keyboards.jobs", measure(lambda: Keyboards.jobs(first_city_id, job_items, 0, 10), n(5000), 5))
+        record("keyboards.admin", measure(lambda: Keyboards.admin(page_items, True, True, 0, 10), n(5000), 5))
+        cache = KeyboardCache(js)
+        pages = Cycle(list(range(min(50, -(-cities // PAGE_SIZE)))))
+        record("keyboards.cache_cities", measure(lambda: cache.cities(pages.next()), n(20000), 5))
+
+        # --Роли--
+        uids = Cycle(list(range(1, 3 * ROLE_USERS)))
+        record("roles.permissions", measure(lambda: js.permissions(uids.next()), n(100000), 5))
+        record("roles.is_admin", measure(lambda: js.is_admin(uids.next()), n(100000), 5))
+        record("roles.has_admin_access", measure(lambda: js.has_admin_access(uids.next()), n(100000), 5))
+
+        # --Поиск--
+        index = SearchIndex(js)
+        record("search.build", measure(index.rebuild, 1, heavy_repeat))
+        queries = Cycle([f"вакансия {j}" for j in range(0, vacancies, max(1, vacancies // 200))])
+
+        def uncached(query: str):
+            # первая страница /search по свежему запросу: подсчёт и ранжирование
+            index._cache.clear()
+            index.page(query, 0, PAGE_SIZE)
+        record("search.query_uncached", measure(lambda: uncached(queries.next()), n(2000), 5))
+        record("search.query_cached", measure(lambda: index.page(queries.next(), 0, PAGE_SIZE), n(20000), 5))
+        # слова, которые есть в каждой вакансии: совпадает весь каталог
+        record("search.common_uncached", measure(lambda: uncached("вакансия"), n(200), 5))
+        record("search.common_multi_uncached", measure(lambda: uncached("описание вакансии"), n(200), 5))
+        # частые слова: половина и треть каталога, пересечение — шестая часть
+        record("search.frequent_uncached", measure(lambda: uncached("ночная"), n(200), 5))
+        record("search.frequent_multi_uncached", measure(lambda: uncached("ночная смена гибкий график"), n(50), 5))
+        record("search.frequent_multi_page10", measure(
+            lambda: index.page("ночная смена гибкий график", 10 * PAGE_SIZE, PAGE_SIZE), n(2000), 5))
+
+        # каталог заменён целиком: на цикле — только снимок, индекс строится в потоке
+        on_loop = []
+
+        async def reload_index():
+            started = time.perf_counter()
+            index.on_change("reload", None)
+            on_loop.append((time.perf_counter() - started) * 1e6)
+            await index._rebuilding
+        record("search.reload_total", measure_async(loop, reload_index, 1, heavy_repeat))
+        record("search.reload_on_loop", {"min_us": min(on_loop), "median_us": statistics.median(on_loop),
+                                         "number": 1, "repeat": len(on_loop)})
+
+        inline = InlineResults(js, index)
+
+        def inline_cold():
+            # сброс кэша статей, как после правки каталога
+            inline._version = None
+            inline.page(city_cycle.next())
+        record("inline.page_cold", measure(inline_cold, n(500), 5))
+        inline_queries = Cycle([f"{city}: вакансия" for city in city_names[:50]])
+        record("inline.page_warm", measure(lambda: inline.page(inline_queries.next(), "20"), n(20000), 5))
+        loop.run_until_complete(js.close())
+
+        # --Хендлеры целиком: callbacks.dispatch -> хендлер -> клавиатура из кэша--
+        obrabotchik.jobs_service = js = Jobservice(storage=JsonCatalogStorage("jobs.json"))
+        obrabotchik.keyboards_cache = KeyboardCache(js)
+        dispatch = obrabotchik.callbacks.dispatch
+        city_data = Cycle([f"city:{encode_id(cid)}" for cid, _ in js.get_city_items(0, 200)])
+        job_data = Cycle([
+            f"job:{encode_id(job_id)}:0" for city in js.get_cities()[:50] for job_id, _ in js.get_job_items(city, 0, PAGE_SIZE)
+        ])
+        admin_data = Cycle([f"admin_jobs:{encode_id(cid)}:0" for cid, _ in js.get_city_items(0, 200)])
+        state = StubState()
+        # хендлер должен дойти до экрана, а не ответить "не найдено"
+        for sample, data in ((city_data, {}), (job_data, {}), (admin_data, {"state": state, "perms": Perm.DEVELOPER})):
+            probe = StubCallback(sample.items[0])
+            loop.run_until_complete(dispatch(probe, **data))
+            assert probe.message.reply_markup is not None, sample.items[0]
+        record("handler.choose_city", measure_async(
+            loop, lambda: dispatch(StubCallback(city_data.next())), n(5000), 5))
+        record("handler.choose_job", measure_async(
+            loop, lambda: dispatch(StubCallback(job_data.next())), n(5000), 5))
+        record("handler.admin_list_jobs", measure_async(
+            loop, lambda: dispatch(StubCallback(admin_data.next()), state=state, perms=Perm.DEVELOPER), n(5000), 5))
+    finally:
+        loop.close()
+        asyncio.set_event_loop(None)
+    return results
+
+
+def git_revision() -> str | None:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True, text=True, check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(results: List[Dict[str, Any]], baseline_file: str):
+    with open(baseline_file, "r", encoding="utf-8") as f:
+        baseline = {(r["name"], r["cities"], r["vacancies"]): r for r in json.load(f)["results"]}
+    print(f"\nvs {baseline_file} (median, >1.00 = slower now):")
+    for r in results:
+        old = baseline.get((r["name"], r["cities"], r["vacancies"]))
+        if old is None:
+            continue
+        ratio = r["median_us"] / old["median_us"] if old["median_us"] else float("inf")
+        flag = "  <-- slower" if ratio > 1.2 else ""
+        print(f"  {r['cities']}x{r['vacancies']:<8} {r['name']:<28} x{ratio:5.2f}{flag}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", default=DEFAULT_SIZES, help="comma-separated CITIESxVACANCIES")
+    parser.add_argument("--output", help="write results as JSON here")
+    parser.add_argument("--compare", help="earlier --output file to compare against")
+    parser.add_argument("--quick", action="store_true", help="fewer iterations (noisier)")
+    args = parser.parse_args()
+    sizes = [parse_size(s) for s in args.sizes.split(",")]
+
+    results = []
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory(prefix="bench-suite-") as workdir:
+        # obrabotchik при импорте открывает jobs.json/admins.json в текущем каталоге
+        os.chdir(workdir)
+        try:
+            for cities, vacancies in sizes:
+                print(f"{cities} cities x {vacancies} vacancies", flush=True)
+                results.extend(bench_size(cities, vacancies, args.quick))
+        finally:
+            os.chdir(cwd)
+
+    report = {
+        "meta": {
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "revision": git_revision(),
+            "date": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "quick": args.quick,
+        },
+        "results": results,
+    }
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2, ensure_ascii=False)
+        print(f"\nwritten to {args.output}")
+    if args.compare:
+        compare(results, args.compare)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,180 @@
+"""Local stand-in for the Telegram Bot API, for load and rate-limit tests.
+
+Serves /bot<token>/<method> like api.telegram.org for the methods this bot
+uses (getUpdates, sendMessage, editMessageText, answerCallbackQuery,
+deleteMessage, getChat, sendDocument, ...), with an optional response
+latency and Telegram-like flood control:
+more than `chat_rate` calls per second to one chat (or `global_rate` in
+total) is answered with 429 and parameters.retry_after. Point the bot at it
+with TELEGRAM_API_BASE = "http://127.0.0.1:8081". Updates for getUpdates are
+taken from `FakeBotAPI.updates`; `listeners` see every answered call
+(benchmarks/loadtest.py uses both).
+
+    python benchmarks/fake_bot_api.py --port 8081 --latency 30
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import time
+from collections import defaultdict, deque
+from typing import Any, Callable, Deque, Dict, List
+
+from aiohttp import web
+
+BOOL_METHODS = {
+    "answercallbackquery", "answerinlinequery", "deletemessage", "deletewebhook", "setwebhook",
+    "setmycommands", "sendchataction",
+}
+
+
+class FakeBotAPI:
+    def __init__(self, latency: float = 0.0, chat_rate: float | None = None, global_rate: float | None = None,
+                 retry_after: int = 1):
+        self.latency = latency
+        self.chat_rate = chat_rate
+        self.global_rate = global_rate
+        self.retry_after = retry_after
+        self.calls: Dict[str, int] = defaultdict(int)
+        self.rejected = 0
+        self.log: Deque[Dict[str, Any]] = deque(maxlen=100000)
+        self._chat_hits: Dict[Any, Deque[float]] = defaultdict(deque)
+        self._global_hits: Deque[float] = deque()
+        self._message_ids = itertools.count(1)
+        self._runner: web.AppRunner | None = None
+        # апдейты для getUpdates (нагрузочный тест кладёт сюда свои)
+        self.updates: "asyncio.Queue[dict]" = asyncio.Queue()
+        # вызываются с (method, params, result) после каждого успешного ответа
+        self.listeners: List[Callable[[str, Dict[str, Any], Any], None]] = []
+
+    # ==Флуд-контроль==
+    @staticmethod
+    def _over(hits: Deque[float], rate: float, now: float) -> bool:
+        while hits and hits[0] <= now - 1.0:
+            hits.popleft()
+        return len(hits) >= rate
+
+    def _flooded(self, chat_id: Any) -> bool:
+        now = time.monotonic()
+        if self.global_rate is not None and self._over(self._global_hits, self.global_rate, now):
+            return True
+        if chat_id is not None and self.chat_rate is not None and self._over(self._chat_hits[chat_id], self.chat_rate, now):
+            return True
+        self._global_hits.append(now)
+        if chat_id is not None:
+            self._chat_hits[chat_id].append(now)
+        return False
+
+    # ==Ответы==
+    def _message(self, params: Dict[str, Any]) -> Dict[str, Any]:
+        chat_id = params.get("chat_id") or 1
+        try:
+            chat_id = int(chat_id)
+        except (TypeError, ValueError):
+            pass
+        return {
+            "message_id": int(params.get("message_id") or next(self._message_ids)),
+            "date": int(time.time()),
+            "chat": {"id": chat_id, "type": "private" if isinstance(chat_id, int) and chat_id > 0 else "supergroup"},
+            "text": params.get("text") or "",
+        }
+
+    def _result(self, method: str, params: Dict[str, Any]) -> Any:
+        if method in BOOL_METHODS:
+            return True
+        if method == "senddocument":
+            message = self._message(params)
+            message["document"] = {"file_id": f"doc{message['message_id']}", "file_unique_id": f"u{message['message_id']}"}
+            return message
+        if method == "getme":
+            return {"id": 42, "is_bot": True, "first_name": "FakeBot", "username": "fake_bot"}
+        if method == "getchat":
+            chat_id = params.get("chat_id")
+            if isinstance(chat_id, str) and chat_id.startswith("@"):
+                return {"id": abs(hash(chat_id)) % 10**9, "type": "private", "username": chat_id[1:], "first_name": "User"}
+            return {"id": int(chat_id), "type": "private", "username": f"user{chat_id}", "first_name": "User"}
+        return self._message(params)
+
+    async def _get_updates(self, params: Dict[str, Any]) -> Any:
+        timeout = float(params.get("timeout") or 0)
+        updates = []
+        try:
+            updates.append(await asyncio.wait_for(self.updates.get(), timeout=timeout or 0.01))
+        except asyncio.TimeoutError:
+            return []
+        while not self.updates.empty() and len(updates) < 100:
+            updates.append(self.updates.get_nowait())
+        return updates
+
+    async def handle(self, request: web.Request) -> web.Response:
+        method = request.match_info["method"].lower()
+        if request.content_type == "application/json":
+            params = await request.json()
+        else:
+            params = {k: v for k, v in (await request.post()).items() if isinstance(v, str)}
+        self.calls[method] += 1
+        if method == "getupdates":
+            return web.json_response({"ok": True, "result": await self._get_updates(params)})
+        chat_id = params.get("chat_id")
+        if not method.startswith("get") and self._flooded(chat_id):
+            self.rejected += 1
+            return web.json_response({
+                "ok": False, "error_code": 429,
+                "description": f"Too Many Requests: retry after {self.retry_after}",
+                "parameters": {"retry_after": self.retry_after},
+            }, status=429)
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        self.log.append({"t": time.monotonic(), "method": method, "chat_id": chat_id})
+        result = self._result(method, params)
+        for listener in self.listeners:
+            listener(method, params, result)
+        return web.json_response({"ok": True, "result": result})
+
+    def app(self) -> web.Application:
+        app = web.Application()
+        app.router.add_post("/bot{token}/{method}", self.handle)
+        app.router.add_get("/bot{token}/{method}", self.handle)
+        return app
+
+    async def start(self, host: str = "127.0.0.1", port: int = 0) -> str:
+        """Start serving; returns the base URL for TELEGRAM_API_BASE / TelegramAPIServer.from_base."""
+        self._runner = web.AppRunner(self.app())
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, host, port)
+        await site.start()
+        port = site._server.sockets[0].getsockname()[1]
+        return f"http://{host}:{port}"
+
+    async def stop(self):
+        if self._runner is not None:
+            await self._runner.cleanup()
+
+    def stats(self) -> Dict[str, Any]:
+        return {"calls": dict(self.calls), "rejected_429": self.rejected}
+
+
+async def _serve(args):
+    api = FakeBotAPI(latency=args.latency / 1000, chat_rate=args.chat_rate, global_rate=args.global_rate)
+    base = await api.start(args.host, args.port)
+    print(f"fake Bot API on {base}")
+    try:
+        while True:
+            await asyncio.sleep(10)
+            print(json.dumps(api.stats(), ensure_ascii=False))
+    finally:
+        await api.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8081)
+    parser.add_argument("--latency", type=float, default=0.0, help="ms per call")
+    parser.add_argument("--chat-rate", type=float, default=None, help="calls/s per chat before 429")
+    parser.add_argument("--global-rate", type=float, default=None, help="calls/s in total before 429")
+    asyncio.run(_serve(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,280 @@
+"""End-to-end load test: simulated users tapping through bot.py against the fake Bot API.
+
+Starts benchmarks/fake_bot_api.py in this process and the real bot.py
+(polling mode) as a subprocess pointed at it through TELEGRAM_API_BASE, in
+a temporary directory with a synthetic catalog. Every simulated user
+repeats the session  /start -> city -> job -> back  and taps the buttons
+the bot actually sent it, with a think time between steps. Latency of a
+step is from the moment the update is handed to getUpdates until the
+bot's reply (sendMessage / editMessageText) for that chat arrives.
+
+    python benchmarks/loadtest.py --users 200 --duration 30 --think 1000 [--unpaced] [--output load.json]
+
+By default the bot keeps its outbound limits (OUT_* in config.py), so the
+result shows what Telegram's limits allow; --unpaced lifts them to
+measure the bot's own capacity.
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import os
+import random
+import signal
+import subprocess
+import sys
+import tempfile
+import time
+from collections import defaultdict
+from typing import Any, Dict, List
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.abspath(os.path.join(BENCH_DIR, ".."))
+sys.path.insert(0, BENCH_DIR)
+
+from fake_bot_api import FakeBotAPI  # noqa: E402
+
+TOKEN = "42:LOADTEST"
+FIRST_USER_ID = 100000
+REPLY_METHODS = ("sendmessage", "editmessagetext")
+# сколько сообщений в чат отправляет бот на каждом шаге
+EXPECTED_REPLIES = {"start": 2, "city": 1, "job": 1, "back": 1}
+
+# bot.py со своим config.py: настоящий config плюс переопределения нагрузочного теста
+BOOTSTRAP = (
+    "import runpy, sys; sys.path[:0] = sys.argv[1:3]; "
+    "runpy.run_path(sys.argv[2] + '/bot.py', run_name='__main__')"
+)
+CONFIG_OVERRIDE = '''\
+_path = {config!r}
+exec(compile(open(_path, encoding="utf-8").read(), _path, "exec"))
+API_TOKEN = {token!r}
+TELEGRAM_API_BASE = {base!r}
+RUN_MODE = "polling"
+CATALOG_BACKEND = "json"
+'''
+UNPACED_OVERRIDE = '''\
+OUT_GLOBAL_RATE = 1e6
+OUT_CHAT_RATE = 1e6
+OUT_CHAT_BURST = 1e6
+OUT_GROUP_RATE = 1e6
+'''
+
+
+def write_workdir(workdir: str, base: str, cities: int, jobs_per_city: int, unpaced: bool):
+    catalog = {
+        f"Город {c}": [
+            {"title": f"Вакансия {c}-{j}", "desc": "Описание вакансии. " * 8, "url": f"https://example.com/{c}/{j}"}
+            for j in range(jobs_per_city)
+        ]
+        for c in range(cities)
+    }
+    with open(os.path.join(workdir, "jobs.json"), "w", encoding="utf-8") as f:
+        json.dump(catalog, f, ensure_ascii=False)
+    with open(os.path.join(workdir, "admins.json"), "w", encoding="utf-8") as f:
+        json.dump({"admins": [], "super_admins": [], "developers": []}, f)
+    config_dir = os.path.join(workdir, "config")
+    os.makedirs(config_dir)
+    with open(os.path.join(config_dir, "config.py"), "w", encoding="utf-8") as f:
+        f.write(CONFIG_OVERRIDE.format(config=os.path.join(ROOT, "config.py"), token=TOKEN, base=base))
+        if unpaced:
+            f.write(UNPACED_OVERRIDE)
+    return config_dir
+
+
+# ==Пользователи==
+class SimUser:
+    def __init__(self, uid: int):
+        self.uid = uid
+        self.buttons: List[str] = []
+        self.remaining = 0
+        self.done: asyncio.Future | None = None
+
+    def expect(self, replies: int) -> asyncio.Future:
+        self.remaining = replies
+        self.done = asyncio.get_running_loop().create_future()
+        return self.done
+
+    def replied(self, markup: Any):
+        if isinstance(markup, str):
+            markup = json.loads(markup)
+        if isinstance(markup, dict) and "inline_keyboard" in markup:
+            self.buttons = [b["callback_data"] for row in markup["inline_keyboard"] for b in row if "callback_data" in b]
+        self.remaining -= 1
+        if self.remaining <= 0 and self.done is not None and not self.done.done():
+            self.done.set_result(time.perf_counter())
+
+    def pick(self, prefix: str) -> str | None:
+        choices = [data for data in self.buttons if data.startswith(prefix)]
+        return random.choice(choices) if choices else None
+
+
+class LoadTest:
+    def __init__(self, api: FakeBotAPI, args):
+        self.api = api
+        self.args = args
+        self.users = {FIRST_USER_ID + i: SimUser(FIRST_USER_ID + i) for i in range(args.users)}
+        self.update_ids = itertools.count(1)
+        self.latencies: Dict[str, List[float]] = defaultdict(list)
+        self.timeouts = 0
+        self.lost_buttons = 0
+        api.listeners.append(self._on_call)
+
+    def _on_call(self, method: str, params: Dict[str, Any], result: Any):
+        if method not in REPLY_METHODS:
+            return
+        try:
+            user = self.users.get(int(params.get("chat_id")))
+        except (TypeError, ValueError):
+            return
+        if user is not None:
+            user.replied(params.get("reply_markup"))
+
+    def _update(self, user: SimUser, step: str, data: str | None) -> Dict[str, Any]:
+        update_id = next(self.update_ids)
+        chat = {"id": user.uid, "type": "private"}
+        sender = {"id": user.uid, "is_bot": False, "first_name": "Load"}
+        now = int(time.time())
+        if data is None:
+            return {"update_id": update_id, "message": {
+                "message_id": update_id, "date": now, "chat": chat, "from": sender, "text": "/start",
+                "entities": [{"type": "bot_command", "offset": 0, "length": 6}],
+            }}
+        return {"update_id": update_id, "callback_query": {
+            "id": str(update_id), "from": sender, "chat_instance": "load", "data": data,
+            "message": {"message_id": update_id, "date": now, "chat": chat, "from": {"id": 42, "is_bot": True, "first_name": "Bot"}, "text": "menu"},
+        }}
+
+    async def _step(self, user: SimUser, step: str, data: str | None = None) -> bool:
+        done = user.expect(EXPECTED_REPLIES[step])
+        started = time.perf_counter()
+        await self.api.updates.put(self._update(user, step, data))
+        try:
+            finished = await asyncio.wait_for(done, self.args.timeout)
+        except asyncio.TimeoutError:
+            self.timeouts += 1
+            return False
+        self.latencies[step].append(finished - started)
+        return True
+
+    async def _think(self):
+        await asyncio.sleep(self.args.think / 1000 * random.uniform(0.5, 1.5))
+
+    async def _session(self, user: SimUser) -> bool:
+        if not await self._step(user, "start"):
+            return False
+        for step, prefix in (("city", "city:"), ("job", "job:"), ("back", "back:jobs:")):
+            await self._think()
+            data = user.pick(prefix)
+            if data is None:
+                self.lost_buttons += 1
+                return False
+            if not await self._step(user, step, data):
+                return False
+        return True
+
+    async def _user_loop(self, user: SimUser, deadline: float):
+        # пользователи приходят не разом, а в течение первой «мысли»
+        await asyncio.sleep(random.uniform(0, self.args.think / 1000))
+        while time.perf_counter() < deadline:
+            await self._session(user)
+            await self._think()
+
+    async def run(self) -> float:
+        started = time.perf_counter()
+        deadline = started + self.args.duration
+        await asyncio.gather(*(self._user_loop(user, deadline) for user in self.users.values()))
+        return time.perf_counter() - started
+
+
+def percentile(values: List[float], q: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(q / 100 * (len(ordered) - 1))))]
+
+
+def summary(values: List[float]) -> Dict[str, float]:
+    return {
+        "count": len(values),
+        "p50_ms": round(percentile(values, 50) * 1000, 1),
+        "p95_ms": round(percentile(values, 95) * 1000, 1),
+        "p99_ms": round(percentile(values, 99) * 1000, 1),
+        "max_ms": round(max(values, default=0.0) * 1000, 1),
+    }
+
+
+async def wait_ready(api: FakeBotAPI, bot: subprocess.Popen, timeout: float = 30):
+    deadline = time.monotonic() + timeout
+    while api.calls["getupdates"] == 0:
+        if bot.poll() is not None:
+            raise RuntimeError(f"bot.py exited with code {bot.returncode}")
+        if time.monotonic() > deadline:
+            raise RuntimeError("bot.py did not start polling in time")
+        await asyncio.sleep(0.1)
+
+
+async def main_async(args):
+    api = FakeBotAPI(latency=args.api_latency / 1000)
+    base = await api.start()
+    with tempfile.TemporaryDirectory(prefix="loadtest-") as workdir:
+        config_dir = write_workdir(workdir, base, args.cities, args.jobs, args.unpaced)
+        log_path = os.path.join(workdir, "bot.out")
+        with open(log_path, "wb") as log:
+            bot = subprocess.Popen([sys.executable, "-c", BOOTSTRAP, config_dir, ROOT], cwd=workdir, stdout=log, stderr=log)
+        try:
+            await wait_ready(api, bot)
+            test = LoadTest(api, args)
+            elapsed = await test.run()
+        finally:
+            # SIGINT — обычная плавная остановка бота
+            bot.send_signal(signal.SIGINT)
+            try:
+                await asyncio.to_thread(bot.wait, 60)
+            except subprocess.TimeoutExpired:
+                bot.kill()
+            await api.stop()
+            if bot.returncode not in (0, -signal.SIGINT):
+                with open(log_path, "r", encoding="utf-8", errors="replace") as f:
+                    print(f.read()[-3000:], file=sys.stderr)
+
+    all_steps = [v for values in test.latencies.values() for v in values]
+    taps = sum(len(test.latencies[step]) for step in ("city", "job", "back"))
+    report = {
+        "users": args.users, "duration_s": round(elapsed, 1), "think_ms": args.think,
+        "api_latency_ms": args.api_latency, "unpaced": args.unpaced,
+        "catalog": {"cities": args.cities, "jobs_per_city": args.jobs},
+        "steps_per_s": round(len(all_steps) / elapsed, 1),
+        "taps_per_s": round(taps / elapsed, 1),
+        "timeouts": test.timeouts, "lost_buttons": test.lost_buttons,
+        "api": api.stats(),
+        "latency": {"all": summary(all_steps), **{step: summary(test.latencies[step]) for step in EXPECTED_REPLIES}},
+    }
+    print(f"users={args.users} duration={elapsed:.1f}s think={args.think}ms api_latency={args.api_latency}ms "
+          f"{'unpaced' if args.unpaced else 'paced'}")
+    print(f"throughput: {report['steps_per_s']} steps/s, {report['taps_per_s']} taps/s; "
+          f"timeouts={test.timeouts} lost_buttons={test.lost_buttons} 429={report['api']['rejected_429']}")
+    for name, stats in report["latency"].items():
+        print(f"  {name:<6} n={stats['count']:<7} p50={stats['p50_ms']:8.1f}ms  p95={stats['p95_ms']:8.1f}ms  "
+              f"p99={stats['p99_ms']:8.1f}ms  max={stats['max_ms']:8.1f}ms")
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2, ensure_ascii=False)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--users", type=int, default=100)
+    parser.add_argument("--duration", type=float, default=30.0, help="seconds")
+    parser.add_argument("--think", type=float, default=1000.0, help="ms between taps (±50%%)")
+    parser.add_argument("--timeout", type=float, default=10.0, help="seconds before a step counts as lost")
+    parser.add_argument("--api-latency", type=float, default=30.0, help="ms per fake Bot API call")
+    parser.add_argument("--cities", type=int, default=200)
+    parser.add_argument("--jobs", type=int, default=20, help="vacancies per city")
+    parser.add_argument("--unpaced", action="store_true", help="lift the bot's outbound rate limits")
+    parser.add_argument("--output", help="write the report as JSON here")
+    asyncio.run(main_async(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
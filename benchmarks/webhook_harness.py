@@ -0,0 +1,162 @@
+"""Webhook throughput without Telegram: POSTs synthetic updates to a local webhook server.
+
+Runs the bot's real dispatcher (bot.create_dispatcher) behind webhook.build_app on
+127.0.0.1, in a temporary directory with a synthetic catalog. Bot API calls
+go to an in-process fake session that answers after `--api-latency` ms,
+standing in for the Telegram round-trip. Reports how fast POSTs are
+accepted and how long it takes until every update has been handled.
+
+    python benchmarks/webhook_harness.py --handling workers --updates 2000 --concurrency 50 --api-latency 30
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+import tempfile
+import time
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, ROOT)
+
+from aiohttp import ClientSession, web  # noqa: E402
+from aiogram import Bot  # noqa: E402
+from aiogram.client.session.base import BaseSession  # noqa: E402
+from aiogram.methods import EditMessageText, SendMessage  # noqa: E402
+from aiogram.types import Chat, Message  # noqa: E402
+
+SECRET = "harness-secret"
+PATH = "/webhook"
+
+
+class FakeSession(BaseSession):
+    """Answers the Bot API methods the catalog screens use, after a fixed delay."""
+
+    def __init__(self, latency: float):
+        super().__init__()
+        self.latency = latency
+        self.calls = 0
+
+    async def make_request(self, bot, method, timeout=None):
+        self.calls += 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        if isinstance(method, (SendMessage, EditMessageText)):
+            chat_id = getattr(method, "chat_id", None) or 1
+            return Message(message_id=1, date=int(time.time()), chat=Chat(id=chat_id, type="private"), text=method.text)
+        if method.__returning__ is bool:
+            return True
+        raise RuntimeError(f"fake session: unsupported method {type(method).__name__}")
+
+    async def stream_content(self, *args, **kwargs):
+        yield b""
+
+    async def close(self):
+        pass
+
+
+def write_catalog(cities: int, jobs_per_city: int):
+    catalog = {
+        f"Город {c}": [
+            {"title": f"Вакансия {c}-{j}", "desc": "Описание " * 10, "url": f"https://example.com/{c}/{j}"}
+            for j in range(jobs_per_city)
+        ]
+        for c in range(cities)
+    }
+    with open("jobs.json", "w", encoding="utf-8") as f:
+        json.dump(catalog, f, ensure_ascii=False)
+    with open("admins.json", "w", encoding="utf-8") as f:
+        json.dump({"admins": [], "super_admins": [], "developers": []}, f)
+
+
+def synthetic_update(update_id: int, users: int) -> dict:
+    uid = 100000 + update_id % users
+    chat = {"id": uid, "type": "private"}
+    user = {"id": uid, "is_bot": False, "first_name": "Load"}
+    now = int(time.time())
+    if update_id % 2:
+        return {"update_id": update_id, "message": {
+            "message_id": update_id, "date": now, "chat": chat, "from": user, "text": "/start",
+        }}
+    return {"update_id": update_id, "callback_query": {
+        "id": str(update_id), "from": user, "chat_instance": "harness", "data": "cities:0",
+        "message": {"message_id": update_id, "date": now, "chat": chat, "text": "menu"},
+    }}
+
+
+async def run(args):
+    from webhook import build_app
+    from bot import create_dispatcher
+    from fsm_storage import SqliteFSMStorage
+
+    handled = 0
+    done = asyncio.Event()
+
+    async def count(handler, event, data):
+        nonlocal handled
+        try:
+            return await handler(event, data)
+        finally:
+            handled += 1
+            if handled >= args.updates:
+                done.set()
+
+    session = FakeSession(args.api_latency / 1000)
+    bot = Bot(token="42:HARNESS", session=session)
+    dp = create_dispatcher(SqliteFSMStorage("fsm.db"))
+    dp.update.outer_middleware(count)
+    app = build_app(dp, bot, path=PATH, secret=SECRET, handling=args.handling, workers=args.workers)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+    port = site._server.sockets[0].getsockname()[1]
+    url = f"http://127.0.0.1:{port}{PATH}"
+
+    payloads = [json.dumps(synthetic_update(i, args.users)).encode() for i in range(1, args.updates + 1)]
+    queue: "asyncio.Queue[bytes]" = asyncio.Queue()
+    for payload in payloads:
+        queue.put_nowait(payload)
+    headers = {"Content-Type": "application/json", "X-Telegram-Bot-Api-Secret-Token": SECRET}
+
+    async def client(http: ClientSession):
+        while not queue.empty():
+            payload = queue.get_nowait()
+            async with http.post(url, data=payload, headers=headers) as response:
+                assert response.status == 200, response.status
+                await response.read()
+
+    started = time.perf_counter()
+    async with ClientSession() as http:
+        await asyncio.gather(*(client(http) for _ in range(args.concurrency)))
+    posted = time.perf_counter() - started
+    await asyncio.wait_for(done.wait(), timeout=300)
+    finished = time.perf_counter() - started
+    await runner.cleanup()
+
+    print(f"handling={args.handling} updates={args.updates} concurrency={args.concurrency} "
+          f"api_latency={args.api_latency}ms")
+    print(f"accepted: {posted:7.2f} s  {args.updates / posted:9.0f} updates/s")
+    print(f"handled:  {finished:7.2f} s  {args.updates / finished:9.0f} updates/s  (api calls: {session.calls})")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--handling", choices=("background", "inline", "workers"), default="background")
+    parser.add_argument("--updates", type=int, default=1000)
+    parser.add_argument("--concurrency", type=int, default=40, help="parallel POSTs (Telegram's max_connections)")
+    parser.add_argument("--workers", type=int, default=8)
+    parser.add_argument("--users", type=int, default=200)
+    parser.add_argument("--api-latency", type=float, default=0.0, help="fake Bot API round-trip, ms")
+    parser.add_argument("--cities", type=int, default=50)
+    parser.add_argument("--jobs-per-city", type=int, default=20)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as workdir:
+        os.chdir(workdir)
+        write_catalog(args.cities, args.jobs_per_city)
+        asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    main()
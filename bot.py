@@ -1,33 +1,145 @@
 import asyncio
 import logging
 import os
-from logging.handlers import RotatingFileHandler
+import sys
+from typing import Tuple
 from aiogram import Bot, Dispatcher
-from aiogram.fsm.storage.memory import MemoryStorage
-from config import API_TOKEN
-from obrabotchik import router
-
-async def main():
-    logging.basicConfig(
-        level=logging.INFO,
-        format="%(asctime)s %(levelname)s [%(name)s] %(message)s",
+from aiogram.client.session.aiohttp import AiohttpSession
+from aiogram.client.telegram import TelegramAPIServer
+from aiogram.fsm.storage.base import BaseStorage
+from config import (
+    API_TOKEN, PERSIST_DELAY, LOG_JSON, FSM_DB, FSM_TTL, RUN_MODE, SHARD_WORKERS,
+    WEBHOOK_URL, WEBHOOK_HOST, WEBHOOK_PORT, WEBHOOK_PATH, WEBHOOK_SECRET,
+    WEBHOOK_HANDLING, WEBHOOK_WORKERS, WEBHOOK_BACKLOG, WEBHOOK_MAX_CONNECTIONS,
+    UPDATE_CONCURRENCY, UPDATE_BACKLOG, UPDATE_OVERFLOW, TELEGRAM_API_BASE,
+    OUT_GLOBAL_RATE, OUT_CHAT_RATE, OUT_CHAT_BURST, OUT_GROUP_RATE, WATCH_FILES, WATCH_INTERVAL, CATALOG_BACKEND,
+    DRAIN_TIMEOUT, OFFSET_FILE, METRICS_HOST, METRICS_PORT,
+)
+from fsm_storage import SqliteFSMStorage
+from webhook import run_webhook
+from sharding import run_master
+from scheduler import UpdateScheduler
+from outbound import OutboundScheduler
+from watcher import FileWatcher, watch_jobservice
+from lifecycle import Lifecycle
+from logsetup import setup_logging
+from obrabotchik import router, jobs_service, profiles, activity, search_index
+from middlewares import PermissionsMiddleware, ProfileObserverMiddleware, LogContextMiddleware, HandlerNameMiddleware
+from metrics import UpdateMetricsMiddleware, ApiMetricsMiddleware, start_metrics_server
+
+def create_bot(global_rate: float = OUT_GLOBAL_RATE) -> Tuple[Bot, OutboundScheduler]:
+    """Bot whose API calls go through the outbound rate limiter (and TELEGRAM_API_BASE, if set)."""
+    session = AiohttpSession(api=TelegramAPIServer.from_base(TELEGRAM_API_BASE)) if TELEGRAM_API_BASE else AiohttpSession()
+    outbound = OutboundScheduler(
+        global_rate=global_rate, chat_rate=OUT_CHAT_RATE, chat_burst=OUT_CHAT_BURST, group_rate=OUT_GROUP_RATE,
     )
-    logs_dir = os.path.join(os.path.dirname(__file__), "logs")
-    os.makedirs(logs_dir, exist_ok=True)
-    log_path = os.path.join(logs_dir, "bot.log")
-    file_handler = RotatingFileHandler(log_path, maxBytes=1_000_000, backupCount=3, encoding="utf-8")
-    file_handler.setFormatter(logging.Formatter("%(asctime)s %(levelname)s [%(name)s] %(message)s"))
-    root_logger = logging.getLogger()
-    if not any(isinstance(h, RotatingFileHandler) and getattr(h, 'baseFilename', '') == file_handler.baseFilename for h in root_logger.handlers):
-        root_logger.addHandler(file_handler)
+    session.middleware(outbound)
+    # внутри планировщика: время самого запроса, без ожидания токена
+    session.middleware(ApiMetricsMiddleware())
+    return Bot(token=API_TOKEN, session=session), outbound
+
+class BotDispatcher(Dispatcher):
+    """Dispatcher whose shutdown first waits for the update scheduler's queue.
+
+    Dispatcher registers its FSM-storage close as the first shutdown
+    handler, so the drain cannot simply be another handler.
+    """
+
+    async def emit_shutdown(self, *args, **kwargs):
+        scheduler = self.get("scheduler")
+        if scheduler is not None:
+            await scheduler.on_shutdown()
+        await super().emit_shutdown(*args, **kwargs)
+
+def create_dispatcher(storage: BaseStorage, lifecycle: Lifecycle | None = None) -> Dispatcher:
+    """Dispatcher with the bot's middlewares and router (also used by benchmarks)."""
+    dp = BotDispatcher(storage=storage)
+    lifecycle = lifecycle if lifecycle is not None else Lifecycle()
+    # хендлеры dev:restart / dev:stop получают его аргументом `lifecycle`
+    dp["lifecycle"] = lifecycle
+    # самая внешняя: апдейт считается принятым, когда планировщик поставил его в очередь
+    dp.update.outer_middleware(lifecycle)
+    scheduler = UpdateScheduler(UPDATE_CONCURRENCY, UPDATE_BACKLOG, UPDATE_OVERFLOW, DRAIN_TIMEOUT)
+    # доступен хендлерам как аргумент `scheduler`
+    dp["scheduler"] = scheduler
+    # очередь дожидается BotDispatcher.emit_shutdown, до закрытия FSM-хранилища
+    dp.update.outer_middleware(scheduler)
+    dp.update.outer_middleware(LogContextMiddleware())
+    # внутри LogContextMiddleware: имя хендлера берётся из контекста логов
+    dp.update.outer_middleware(UpdateMetricsMiddleware())
+    dp.update.outer_middleware(PermissionsMiddleware(jobs_service))
+    dp.update.outer_middleware(ProfileObserverMiddleware(profiles))
+    router.message.middleware(HandlerNameMiddleware())
+    router.callback_query.middleware(HandlerNameMiddleware())
+    router.inline_query.middleware(HandlerNameMiddleware())
+    dp.include_router(router)
+    return dp
+
+LOGS_DIR = os.path.join(os.path.dirname(__file__), "logs")
+
+async def poll_until_stopped(dp: Dispatcher, bot: Bot, lifecycle: Lifecycle):
+    """Polling until Ctrl+C/SIGTERM or a lifecycle request; then drain and confirm the offset."""
+    # getUpdates не работает, пока установлен вебхук (например, после запуска в режиме webhook)
+    await bot.delete_webhook()
+    await lifecycle.skip_handled(bot)
+    # апдейты и так уходят в очередь планировщика; без задач на апдейт
+    # заполненная очередь притормаживает сам getUpdates
+    polling = asyncio.create_task(dp.start_polling(bot, handle_as_tasks=False, close_bot_session=False))
+    requested = asyncio.create_task(lifecycle.wait())
+    try:
+        await asyncio.wait({polling, requested}, return_when=asyncio.FIRST_COMPLETED)
+        if requested.done():
+            # ждёт и shutdown диспетчера: очередь планировщика, закрытие FSM
+            await dp.stop_polling()
+        await polling
+        await lifecycle.ack(bot)
+    finally:
+        requested.cancel()
+        await bot.session.close()
+
+async def main() -> str:
+    """Run the bot; returns "restart" or "stop"."""
+    listener = setup_logging(LOGS_DIR, json_logs=LOG_JSON)
     logging.getLogger("aiogram").setLevel(logging.INFO)
     logger = logging.getLogger("bot")
-    bot = Bot(token=API_TOKEN)
-    storage = MemoryStorage()
-    dp = Dispatcher(storage=storage)
-    dp.include_router(router)
+    bot, outbound = create_bot()
+    # закрывается (с дозаписью очереди) самим Dispatcher при остановке
+    storage = SqliteFSMStorage(FSM_DB, ttl=FSM_TTL, flush_delay=PERSIST_DELAY)
+    lifecycle = Lifecycle(OFFSET_FILE)
+    dp = create_dispatcher(storage, lifecycle)
+    dp["outbound"] = outbound
+    jobs_service.start_write_behind(PERSIST_DELAY)
+    activity.start()
+    # индекс поиска — до первого апдейта, а не на первом /search
+    search_index.rebuild()
+    watcher = FileWatcher(WATCH_INTERVAL)
+    if WATCH_FILES:
+        # каталог в SQLite руками не правят — следим только за jobs.json
+        watch_jobservice(watcher, jobs_service, catalog=CATALOG_BACKEND == "json").start()
+    metrics_runner = await start_metrics_server(METRICS_HOST, METRICS_PORT) if METRICS_PORT else None
     logger.info("Bot started")
-    await dp.start_polling(bot)
+    try:
+        if RUN_MODE == "webhook":
+            await run_webhook(
+                dp, bot, url=WEBHOOK_URL, host=WEBHOOK_HOST, port=WEBHOOK_PORT, path=WEBHOOK_PATH,
+                secret=WEBHOOK_SECRET, handling=WEBHOOK_HANDLING, workers=WEBHOOK_WORKERS,
+                backlog=WEBHOOK_BACKLOG, max_connections=WEBHOOK_MAX_CONNECTIONS, until=lifecycle.wait(),
+            )
+        else:
+            await poll_until_stopped(dp, bot, lifecycle)
+    finally:
+        await watcher.stop()
+        if metrics_runner is not None:
+            await metrics_runner.cleanup()
+        await activity.close()
+        await jobs_service.close()
+        logger.info("Bot stopped (%s), pending writes flushed", lifecycle.action or "stop")
+        listener.stop()
+    return lifecycle.action or "stop"
 
 if __name__ == "__main__":
-    asyncio.run(main())
\ No newline at end of file
+    if RUN_MODE == "sharded":
+        asyncio.run(run_master(SHARD_WORKERS, LOGS_DIR, json_logs=LOG_JSON))
+    elif asyncio.run(main()) == "restart":
+        # всё уже дописано и закрыто — заменяем процесс новым
+        os.execv(sys.executable, [sys.executable, *sys.argv])
\ No newline at end of file
@@ -0,0 +1,110 @@
+import inspect
+import logging
+from typing import Any, Callable, Dict, Tuple
+from services import decode_id
+from logsetup import bind_log_context
+
+logger = logging.getLogger(__name__)
+
+SEPARATOR = ":"
+
+
+def b36(value: str) -> int:
+    """Argument type for catalog ids written with services.encode_id."""
+    decoded = decode_id(value)
+    if decoded is None:
+        raise ValueError(f"invalid id: {value!r}")
+    return decoded
+
+
+class CallbackRoute:
+    __slots__ = ("path", "handler", "arg_types", "params", "name")
+
+    def __init__(self, path: Tuple[str, ...], handler: Callable, arg_types: Tuple[Callable[[str], Any], ...]):
+        self.path = path
+        self.handler = handler
+        self.arg_types = arg_types
+        self.name = handler.__name__
+        # какие данные aiogram (state, bot, ...) handler хочет получить по имени
+        self.params = tuple(
+            name for name, p in inspect.signature(handler).parameters.items()
+            if p.kind in (p.KEYWORD_ONLY, p.POSITIONAL_OR_KEYWORD)
+        )[1 + len(arg_types):]
+
+    @property
+    def namespace(self) -> str:
+        return self.path[0]
+
+    @property
+    def action(self) -> str:
+        return SEPARATOR.join(self.path[1:])
+
+
+class _Node:
+    __slots__ = ("children", "route")
+
+    def __init__(self):
+        self.children: Dict[str, "_Node"] = {}
+        self.route: CallbackRoute | None = None
+
+
+class CallbackRouter:
+    """Parses callback_data once and dispatches through a token trie.
+
+    `callbacks.route("job", args=(b36, int))` handles "job:<id>:<page>" and
+    calls `handler(callback, job_id, page, **injected)`. The deepest registered
+    path wins, the remaining tokens are the arguments.
+    """
+
+    def __init__(self):
+        self._root = _Node()
+        self.routes: Dict[Tuple[str, ...], CallbackRoute] = {}
+
+    def route(self, *path: str, args: Tuple[Callable[[str], Any], ...] = ()):
+        def decorator(handler: Callable) -> Callable:
+            self.add(path, handler, args)
+            return handler
+        return decorator
+
+    def add(self, path: Tuple[str, ...], handler: Callable, args: Tuple[Callable[[str], Any], ...] = ()):
+        if path in self.routes:
+            raise ValueError(f"callback route already registered: {SEPARATOR.join(path)}")
+        node = self._root
+        for token in path:
+            node = node.children.setdefault(token, _Node())
+        node.route = CallbackRoute(path, handler, tuple(args))
+        self.routes[path] = node.route
+
+    def resolve(self, data: str) -> Tuple[CallbackRoute, tuple] | None:
+        """(route, decoded args) for callback_data, None if nothing matches."""
+        tokens = data.split(SEPARATOR)
+        node = self._root
+        found, depth = None, 0
+        for i, token in enumerate(tokens):
+            node = node.children.get(token)
+            if node is None:
+                break
+            if node.route is not None:
+                found, depth = node.route, i + 1
+        if found is None:
+            return None
+        raw = tokens[depth:]
+        if len(raw) != len(found.arg_types):
+            return None
+        try:
+            args = tuple(convert(value) for convert, value in zip(found.arg_types, raw))
+        except ValueError:
+            return None
+        return found, args
+
+    async def dispatch(self, callback, **data):
+        """aiogram callback_query handler: the only one the router needs."""
+        resolved = self.resolve(callback.data or "")
+        if resolved is None:
+            bind_log_context(handler="unknown_callback")
+            logger.warning("Unknown or stale callback_data=%r uid=%s", callback.data, callback.from_user.id)
+            return await callback.answer("⚠ Кнопка устарела, откройте меню заново", show_alert=True)
+        route, args = resolved
+        bind_log_context(handler=route.name)
+        kwargs = {name: data[name] for name in route.params if name in data}
+        return await route.handler(callback, *args, **kwargs)
@@ -0,0 +1,159 @@
+import csv
+import io
+import json
+import logging
+import os
+from typing import Dict, Iterable, Iterator, List, Set, TextIO, Tuple
+
+from services import is_valid_http_url
+
+logger = logging.getLogger(__name__)
+
+FIELDS = ("city", "title", "desc", "url")
+FORMATS = {".csv": "csv", ".jsonl": "jsonl", ".ndjson": "jsonl"}
+# карточка вакансии — одно сообщение, а у Telegram предел 4096 символов
+MAX_LENGTH = {"city": 100, "title": 200, "desc": 3500, "url": 2048}
+# сколько ошибок держать в отчёте: дальше только считаем
+MAX_REPORTED_ERRORS = 10000
+
+
+def detect_format(filename: str | None) -> str | None:
+    """"csv" / "jsonl" by file extension, None if unsupported."""
+    return FORMATS.get(os.path.splitext(filename or "")[1].lower())
+
+
+# ==Импорт==
+def iter_rows(f: TextIO, fmt: str) -> Iterator[Tuple[int, Dict | None, str | None]]:
+    """(line number, raw row, None) or (line number, None, error) per record, read lazily."""
+    if fmt == "csv":
+        sample = f.read(4096)
+        f.seek(0)
+        try:
+            dialect = csv.Sniffer().sniff(sample, delimiters=",;\t")
+        except csv.Error:
+            dialect = csv.excel
+        reader = csv.DictReader(f, dialect=dialect)
+        missing = [field for field in FIELDS if field not in (reader.fieldnames or ())]
+        if missing:
+            yield 1, None, f"в заголовке нет колонок: {', '.join(missing)}"
+            return
+        while True:
+            try:
+                row = next(reader)
+            except StopIteration:
+                return
+            except csv.Error as e:
+                yield reader.line_num, None, f"ошибка CSV: {e}"
+                return
+            yield reader.line_num, row, None
+    elif fmt == "jsonl":
+        for line_no, line in enumerate(f, 1):
+            if not line.strip():
+                continue
+            try:
+                row = json.loads(line)
+            except json.JSONDecodeError as e:
+                yield line_no, None, f"не JSON: {e.msg}"
+                continue
+            if not isinstance(row, dict):
+                yield line_no, None, "строка должна быть объектом"
+                continue
+            yield line_no, row, None
+    else:
+        raise ValueError(f"unknown import format: {fmt!r}")
+
+
+def validate_row(row: Dict) -> Tuple[str, Dict]:
+    """Raw import row -> (city, job). Raises ValueError with a message for the report."""
+    values = {}
+    for field in FIELDS:
+        value = row.get(field)
+        if value is None:
+            value = ""
+        if not isinstance(value, str):
+            raise ValueError(f"{field}: ожидается строка")
+        value = value.strip()
+        if len(value) > MAX_LENGTH[field]:
+            raise ValueError(f"{field}: длиннее {MAX_LENGTH[field]} символов")
+        values[field] = value
+    if not values["city"]:
+        raise ValueError("пустой город")
+    if not values["title"]:
+        raise ValueError("пустое название")
+    if not is_valid_http_url(values["url"]):
+        raise ValueError(f"некорректная ссылка: {values['url'][:100]!r}")
+    return values["city"], {"title": values["title"], "desc": values["desc"], "url": values["url"]}
+
+
+class ImportResult:
+    """Outcome of parsing one uploaded file."""
+
+    def __init__(self):
+        self.items: List[Tuple[str, Dict]] = []
+        self.errors: List[Tuple[int, str]] = []
+        self.failed = 0
+        self.duplicates = 0
+
+
+def parse_import(path: str, fmt: str, existing: Set[Tuple[str, str, str]]) -> ImportResult:
+    """Stream `path` into valid (city, job) pairs and a per-row error list.
+
+    Runs in a worker thread: touches nothing but the file and the `existing`
+    set of (city, title, url) keys, which it extends with the accepted rows,
+    so repeated rows and rows already in the catalog count as duplicates.
+    """
+    result = ImportResult()
+    # utf-8-sig: Excel пишет CSV с BOM
+    with open(path, "r", encoding="utf-8-sig", errors="replace", newline="") as f:
+        for line_no, row, error in iter_rows(f, fmt):
+            if error is None:
+                try:
+                    city, job = validate_row(row)
+                except ValueError as e:
+                    error = str(e)
+            if error is not None:
+                result.failed += 1
+                if len(result.errors) < MAX_REPORTED_ERRORS:
+                    result.errors.append((line_no, error))
+                continue
+            key = (city, job["title"], job["url"])
+            if key in existing:
+                result.duplicates += 1
+                continue
+            existing.add(key)
+            result.items.append((city, job))
+    return result
+
+
+def error_report(errors: List[Tuple[int, str]]) -> bytes:
+    """Per-row report as CSV (line, error) to send back as a document."""
+    out = io.StringIO()
+    writer = csv.writer(out)
+    writer.writerow(("line", "error"))
+    writer.writerows(errors)
+    return out.getvalue().encode("utf-8-sig")
+
+
+# ==Экспорт==
+def write_export(path: str, catalog: Iterable[Tuple[str, List[Dict]]], fmt: str) -> int:
+    """Write the catalog row by row, in the import format. Returns the number of vacancies."""
+    count = 0
+    encoding = "utf-8-sig" if fmt == "csv" else "utf-8"
+    with open(path, "w", encoding=encoding, newline="") as f:
+        if fmt == "csv":
+            writer = csv.writer(f)
+            writer.writerow(FIELDS)
+            for city, vacancies in catalog:
+                for job in vacancies:
+                    writer.writerow((city, job.get("title", ""), job.get("desc", ""), job.get("url", "")))
+                    count += 1
+        elif fmt == "jsonl":
+            for city, vacancies in catalog:
+                for job in vacancies:
+                    row = {"city": city, "title": job.get("title", ""), "desc": job.get("desc", ""), "url": job.get("url", "")}
+                    f.write(json.dumps(row, ensure_ascii=False) + "\n")
+                    count += 1
+        else:
+            raise ValueError(f"unknown export format: {fmt!r}")
+    logger.info("Exported %d vacancies to %s", count, path)
+    return count
@@ -1,2 +1,73 @@
 API_TOKEN = ""
 #если разработчик: @BotFather
+
+# Хранилище каталога: "json" (jobs.json) или "sqlite" (CATALOG_DB).
+# Перенос существующего jobs.json в базу: python storage.py jobs.json jobs.db
+CATALOG_BACKEND = "json"
+CATALOG_DB = "jobs.db"
+
+# Задержка (сек) отложенной записи jobs.json/admins.json: пачка правок = одна запись
+PERSIST_DELAY = 0.5
+
+# Формат файла логов: False — текст, True — JSON-строки (handler, user_id, update_id, duration_ms)
+LOG_JSON = False
+
+# Состояния диалогов (FSM): переживают перезапуск, брошенные формы удаляются через FSM_TTL секунд
+FSM_DB = "fsm.db"
+FSM_TTL = 86400
+
+# Режим получения апдейтов: "polling", "webhook" или "sharded" (мастер + SHARD_WORKERS процессов, нужен CATALOG_BACKEND = "sqlite")
+RUN_MODE = "polling"
+SHARD_WORKERS = 4
+# Публичный адрес для setWebhook (https://example.com, без пути); пусто — вебхук уже настроен снаружи
+WEBHOOK_URL = ""
+WEBHOOK_HOST = "0.0.0.0"
+WEBHOOK_PORT = 8080
+WEBHOOK_PATH = "/webhook"
+# Проверяется в заголовке X-Telegram-Bot-Api-Secret-Token; пусто — без проверки
+WEBHOOK_SECRET = ""
+# Обработка апдейтов: "background" (задача на апдейт), "inline" (в запросе), "workers" (пул + очередь)
+WEBHOOK_HANDLING = "background"
+WEBHOOK_WORKERS = 8
+WEBHOOK_BACKLOG = 1000
+WEBHOOK_MAX_CONNECTIONS = 40
+
+# Обработка апдейтов: параллельно до UPDATE_CONCURRENCY (разные чаты), в одном чате — по порядку.
+# При UPDATE_BACKLOG ждущих апдейтов: "block" — ждать места, "drop_new" / "drop_oldest" — отбросить
+UPDATE_CONCURRENCY = 32
+UPDATE_BACKLOG = 1000
+UPDATE_OVERFLOW = "block"
+
+# Адрес Bot API: пусто — api.telegram.org; иначе свой сервер, например "http://127.0.0.1:8081"
+# (локальный telegram-bot-api или benchmarks/fake_bot_api.py для нагрузочных тестов)
+TELEGRAM_API_BASE = ""
+
+# Темп исходящих вызовов (в секунду): всего, в личный чат (с запасом OUT_CHAT_BURST), в группу
+OUT_GLOBAL_RATE = 25
+OUT_CHAT_RATE = 1.0
+OUT_CHAT_BURST = 3
+OUT_GROUP_RATE = 20 / 60
+
+# Подхватывать правки jobs.json/admins.json без перезапуска (watchfiles, если установлен, иначе опрос mtime)
+WATCH_FILES = True
+WATCH_INTERVAL = 0.5
+
+# Плавная остановка/перезапуск: сколько ждать очередь апдейтов (сек) и где хранить смещение getUpdates
+DRAIN_TIMEOUT = 30
+OFFSET_FILE = "offset.json"
+
+# Журнал активности (кто какие города/вакансии смотрит): JSONL с ротацией, запись пачками раз в N секунд
+ACTIVITY_LOG = "activity.jsonl"
+ACTIVITY_FLUSH_INTERVAL = 5.0
+
+# Инлайн-режим (@bot Москва: курьер): результатов на страницу (до 50) и сколько секунд Telegram кэширует ответ
+INLINE_PAGE_SIZE = 20
+INLINE_CACHE_TIME = 60
+
+# Импорт вакансий файлом (/import): предел размера — столько Bot API отдаёт ботам на скачивание
+IMPORT_MAX_BYTES = 20 * 1024 * 1024
+
+# Метрики в формате Prometheus на http://METRICS_HOST:METRICS_PORT/metrics; 0 — выключено.
+# В режиме sharded у каждого шарда свой порт: METRICS_PORT + номер шарда
+METRICS_HOST = "127.0.0.1"
+METRICS_PORT = 0
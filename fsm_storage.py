@@ -0,0 +1,217 @@
+import asyncio
+import json
+import logging
+import sqlite3
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Mapping, NamedTuple, Optional, Tuple
+
+from aiogram.fsm.state import State
+from aiogram.fsm.storage.base import BaseStorage, DefaultKeyBuilder, KeyBuilder, StateType, StorageKey
+
+logger = logging.getLogger(__name__)
+
+# как часто (сек) удалять из таблицы записи старше ttl
+SWEEP_INTERVAL = 3600.0
+
+
+class FSMRecord(NamedTuple):
+    state: str | None
+    data: Dict[str, Any]
+    updated: float
+
+
+EMPTY_RECORD = FSMRecord(None, {}, 0.0)
+
+
+class SqliteFSMStorage(BaseStorage):
+    """FSM state/data in SQLite with an LRU front cache, TTL expiry and batched write-behind.
+
+    The cache also remembers "no state" for idle users, so the get_state that
+    aiogram does on every update costs no query. Changes are queued and written
+    in one transaction per `flush_delay` from a worker thread; records not
+    changed for `ttl` seconds read as empty and are swept from the table.
+
+    Handlers keep catalog ids in the data (city_id, job_id, bulk_ids). Both
+    catalog storages persist ids and never reuse them, so a step resumed
+    after a restart acts on the same vacancy or finds it gone.
+    """
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS fsm (
+            key TEXT PRIMARY KEY,
+            state TEXT,
+            data TEXT NOT NULL,
+            updated REAL NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS idx_fsm_updated ON fsm(updated);
+    """
+
+    def __init__(
+        self,
+        db_file: str = 'fsm.db',
+        ttl: float = 86400.0,
+        cache_size: int = 1024,
+        flush_delay: float = 0.5,
+        key_builder: Optional[KeyBuilder] = None,
+    ):
+        self.db_file = db_file
+        self.ttl = ttl
+        self.cache_size = cache_size
+        self.flush_delay = flush_delay
+        self.key_builder = key_builder or DefaultKeyBuilder(with_bot_id=True, with_destiny=True)
+        # чтение — на потоке цикла, запись пачек — в рабочем потоке (WAL не блокирует чтение)
+        self.conn = self._connect()
+        self.conn.executescript(self.SCHEMA)
+        self._writer = self._connect()
+        self._cache: "OrderedDict[str, FSMRecord]" = OrderedDict()
+        # ключ -> (state, data в JSON, updated): ещё не записано / пишется прямо сейчас
+        self._pending: Dict[str, Tuple[str | None, str, float]] = {}
+        self._writing: Dict[str, Tuple[str | None, str, float]] = {}
+        self._event: Optional[asyncio.Event] = None
+        self._lock: Optional[asyncio.Lock] = None
+        self._task: Optional[asyncio.Task] = None
+        self._last_sweep = 0.0
+        self.hits = 0
+        self.misses = 0
+        self.writes = 0
+        self._sweep(self.conn)
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.db_file, isolation_level=None, check_same_thread=False)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        return conn
+
+    # ==Чтение==
+    def _expired(self, record: FSMRecord) -> bool:
+        return record.updated + self.ttl < time.time()
+
+    def _read(self, key: str) -> FSMRecord:
+        row = self._pending.get(key) or self._writing.get(key)
+        if row is None:
+            row = self.conn.execute("SELECT state, data, updated FROM fsm WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            return EMPTY_RECORD
+        state, data, updated = row
+        return FSMRecord(state, json.loads(data), updated)
+
+    def _remember(self, key: str, record: FSMRecord):
+        self._cache[key] = record
+        self._cache.move_to_end(key)
+        while len(self._cache) > self.cache_size:
+            # вытесняем только из кеша: несохранённое остаётся в _pending
+            self._cache.popitem(last=False)
+
+    def _get(self, key: str) -> FSMRecord:
+        record = self._cache.get(key)
+        if record is not None:
+            self.hits += 1
+            self._cache.move_to_end(key)
+        else:
+            self.misses += 1
+            record = self._read(key)
+            self._remember(key, record)
+        if record is not EMPTY_RECORD and self._expired(record):
+            return EMPTY_RECORD
+        return record
+
+    async def get_state(self, key: StorageKey) -> str | None:
+        return self._get(self.key_builder.build(key)).state
+
+    async def get_data(self, key: StorageKey) -> Dict[str, Any]:
+        return dict(self._get(self.key_builder.build(key)).data)
+
+    # ==Запись==
+    def _put(self, key: str, state: str | None, data: Dict[str, Any]):
+        record = FSMRecord(state, data, time.time())
+        # сериализуем сразу: ошибка видна в хендлере, а не в фоновой записи
+        self._pending[key] = (state, json.dumps(data, ensure_ascii=False), record.updated)
+        self._remember(key, EMPTY_RECORD if state is None and not data else record)
+        self._schedule()
+
+    async def set_state(self, key: StorageKey, state: StateType = None) -> None:
+        storage_key = self.key_builder.build(key)
+        record = self._get(storage_key)
+        self._put(storage_key, state.state if isinstance(state, State) else state, record.data)
+
+    async def set_data(self, key: StorageKey, data: Mapping[str, Any]) -> None:
+        storage_key = self.key_builder.build(key)
+        record = self._get(storage_key)
+        self._put(storage_key, record.state, dict(data))
+
+    def _schedule(self):
+        if self._task is None or self._task.done():
+            self._event = asyncio.Event()
+            self._lock = asyncio.Lock()
+            self._task = asyncio.create_task(self._run(), name=f"fsm:{self.db_file}")
+        self._event.set()
+
+    def _sweep(self, conn: sqlite3.Connection):
+        now = time.time()
+        if now - self._last_sweep < SWEEP_INTERVAL:
+            return
+        self._last_sweep = now
+        deleted = conn.execute("DELETE FROM fsm WHERE updated < ?", (now - self.ttl,)).rowcount
+        if deleted:
+            logger.info("Swept %d expired FSM records from %s", deleted, self.db_file)
+
+    def _write_batch(self, batch: Dict[str, Tuple[str | None, str, float]]):
+        upserts = [(key, state, data, updated) for key, (state, data, updated) in batch.items() if state is not None or data != "{}"]
+        deletes = [(key,) for key, (state, data, _) in batch.items() if state is None and data == "{}"]
+        with self._writer:
+            self._writer.execute("BEGIN")
+            if upserts:
+                self._writer.executemany(
+                    "INSERT INTO fsm (key, state, data, updated) VALUES (?, ?, ?, ?) "
+                    "ON CONFLICT(key) DO UPDATE SET state = excluded.state, data = excluded.data, updated = excluded.updated",
+                    upserts,
+                )
+            if deletes:
+                self._writer.executemany("DELETE FROM fsm WHERE key = ?", deletes)
+        self._sweep(self._writer)
+
+    async def _flush(self):
+        async with self._lock:
+            if not self._pending:
+                return
+            batch, self._pending = self._pending, {}
+            self._writing = batch
+            try:
+                await asyncio.to_thread(self._write_batch, batch)
+                self.writes += 1
+                logger.debug("Persisted %d FSM records (writes=%d)", len(batch), self.writes)
+            except Exception:
+                # возвращаем пачку, не затирая более свежие изменения
+                for key, row in batch.items():
+                    self._pending.setdefault(key, row)
+                logger.exception("Failed to persist FSM records to %s", self.db_file)
+            finally:
+                self._writing = {}
+
+    async def _run(self):
+        while True:
+            await self._event.wait()
+            await asyncio.sleep(self.flush_delay)
+            self._event.clear()
+            await asyncio.shield(self._flush())
+
+    async def flush(self):
+        if self._lock is not None:
+            await self._flush()
+
+    async def close(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.flush()
+        if self._pending:
+            # фоновая запись так и не удалась — последняя попытка синхронно
+            self._write_batch(self._pending)
+            self._pending = {}
+        self.conn.close()
+        self._writer.close()
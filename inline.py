@@ -0,0 +1,169 @@
+import logging
+from collections import OrderedDict
+from typing import Dict, List, Tuple
+
+from aiogram.types import InlineQueryResultArticle, InputTextMessageContent
+
+from keyboards import Keyboards
+
+logger = logging.getLogger(__name__)
+
+# Telegram принимает не больше 50 результатов за ответ
+MAX_RESULTS = 50
+# длина подписи под заголовком в списке результатов
+DESCRIPTION_LENGTH = 100
+
+
+def parse_inline_query(text: str) -> Tuple[str, str]:
+    """Split inline query text into (city filter, search words): "Москва: курьер" -> ("Москва", "курьер")."""
+    city, sep, words = text.partition(":")
+    if not sep:
+        return "", text.strip()
+    return city.strip(), words.strip()
+
+
+class InlineResults:
+    """Result pages for inline mode, built from a per-city cache of articles.
+
+    An article is made once per vacancy and catalog version: the first query
+    touching a city builds all of its articles, later queries only slice.
+    Matching ids come from SearchIndex, which ranks only up to the requested
+    page; with a city filter the city's own vacancies are ranked and the
+    article list of every (city, words) pair is kept in an LRU, so the next
+    pages cost one slice. Everything is dropped when Jobservice.version
+    changes.
+    """
+
+    def __init__(self, jobs_service, search_index, page_size: int = 20, cache_size: int = 256):
+        self.jobs_service = jobs_service
+        self.search_index = search_index
+        self.page_size = min(page_size, MAX_RESULTS)
+        self.cache_size = cache_size
+        self._version = None
+        # город -> {job_id: статья} в порядке каталога
+        self._cities: Dict[str, Dict[int, InlineQueryResultArticle]] = {}
+        # город без учёта регистра -> настоящее имя
+        self._city_names: Dict[str, str] | None = None
+        self._queries: "OrderedDict[Tuple[str, str], List[InlineQueryResultArticle]]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def _check_version(self):
+        version = self.jobs_service.version
+        if version != self._version:
+            self._cities.clear()
+            self._queries.clear()
+            self._city_names = None
+            self._version = version
+
+    # ==Статьи==
+    @staticmethod
+    def _article(job_id: int, job: Dict, city: str) -> InlineQueryResultArticle:
+        desc = job.get("desc") or ""
+        short = desc if len(desc) <= DESCRIPTION_LENGTH else desc[:DESCRIPTION_LENGTH - 1].rstrip() + "…"
+        return InlineQueryResultArticle(
+            id=str(job_id),
+            title=job["title"],
+            description=f"📍 {city}\n{short}",
+            input_message_content=InputTextMessageContent(message_text=f"💼 {job['title']}\n📍 {city}\n\n{desc}"),
+            reply_markup=Keyboards.job_share(job.get("url")),
+        )
+
+    def _city_articles(self, city: str) -> Dict[int, InlineQueryResultArticle]:
+        articles = self._cities.get(city)
+        if articles is None:
+            articles = self._cities[city] = {
+                job_id: self._article(job_id, job, city) for job_id, job in self.jobs_service.get_job_items(city)
+            }
+        return articles
+
+    def resolve_city(self, name: str) -> str | None:
+        if self._city_names is None:
+            self._city_names = {
+                city.casefold(): city for _, city in self.jobs_service.get_city_items()
+            }
+        return self._city_names.get(name.casefold())
+
+    # ==Выдача==
+    def _all(self, offset: int, limit: int) -> Tuple[List[InlineQueryResultArticle], bool]:
+        """Whole catalog in order, without materialising it: skip cities by their job count."""
+        js = self.jobs_service
+        results: List[InlineQueryResultArticle] = []
+        for _, city in js.get_city_items():
+            count = js.count_jobs(city)
+            if offset >= count:
+                offset -= count
+                continue
+            articles = list(self._city_articles(city).values())
+            results.extend(articles[offset:offset + limit - len(results) + 1])
+            offset = 0
+            if len(results) > limit:
+                break
+        return results[:limit], len(results) > limit
+
+    def _matches(self, city: str, words: str) -> List[InlineQueryResultArticle]:
+        """All articles of one city matching `words` (all of them without words), best first."""
+        key = (city, words)
+        cached = self._queries.get(key)
+        if cached is not None:
+            self.hits += 1
+            self._queries.move_to_end(key)
+            return cached
+        self.misses += 1
+        articles = self._city_articles(city)
+        if not words:
+            result = list(articles.values())
+        else:
+            # кандидаты — вакансии города: ранжировать весь каталог ради одного города незачем
+            result = [articles[job_id] for job_id in self.search_index.rank(words, articles)]
+        self._queries[key] = result
+        if len(self._queries) > self.cache_size:
+            self._queries.popitem(last=False)
+        return result
+
+    def _search(self, words: str, offset: int, limit: int) -> Tuple[List[InlineQueryResultArticle], bool]:
+        """Matches over the whole catalog: SearchIndex ranks only up to the requested page."""
+        js = self.jobs_service
+        ids = self.search_index.top(words, offset + limit + 1)
+        results = []
+        for job_id in ids[offset:offset + limit]:
+            city = js.get_job_city(job_id)
+            article = self._city_articles(city).get(job_id) if city is not None else None
+            if article is not None:
+                results.append(article)
+        return results, len(ids) > offset + limit
+
+    def page(self, text: str, offset: str = "") -> Tuple[List[InlineQueryResultArticle], str]:
+        """(articles, next_offset) for an inline query; next_offset is "" on the last page."""
+        self._check_version()
+        try:
+            start = max(int(offset or 0), 0)
+        except ValueError:
+            start = 0
+        city_name, words = parse_inline_query(text)
+        city = ""
+        if city_name:
+            city = self.resolve_city(city_name)
+            if city is None:
+                return [], ""
+        elif words and self.resolve_city(words) is not None:
+            # запрос целиком совпадает с городом — все его вакансии
+            city, words = self.resolve_city(words), ""
+        if not city and not words:
+            results, more = self._all(start, self.page_size)
+        elif not city:
+            results, more = self._search(words, start, self.page_size)
+        else:
+            matches = self._matches(city, words)
+            results = matches[start:start + self.page_size]
+            more = start + self.page_size < len(matches)
+        return results, str(start + len(results)) if more else ""
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "cities": len(self._cities),
+            "articles": sum(len(a) for a in self._cities.values()),
+            "queries": len(self._queries),
+            "hits": self.hits,
+            "misses": self.misses,
+        }
@@ -1,48 +1,98 @@
 from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton, ReplyKeyboardMarkup, KeyboardButton
-from urllib.parse import urlparse
+from services import encode_id, is_valid_http_url
+
+# Сколько городов/вакансий показывать на одной странице клавиатуры
+PAGE_SIZE = 8
+
+
+def page_count(total: int, page_size: int = PAGE_SIZE) -> int:
+    return max(1, -(-total // page_size))
+
+
+def clamp_page(page: int, total: int, page_size: int = PAGE_SIZE) -> int:
+    return min(max(page, 0), page_count(total, page_size) - 1)
+
 
 class Keyboards:
 
     @staticmethod
-    def cities(cities: list[str]):
+    def pager(callback_prefix: str, page: int, pages: int) -> list[InlineKeyboardButton]:
+        """Row "◀ N/M ▶"; empty when everything fits on one page."""
+        if pages <= 1:
+            return []
+        row = []
+        if page > 0:
+            row.append(InlineKeyboardButton(text="◀", callback_data=f"{callback_prefix}:{page - 1}"))
+        row.append(InlineKeyboardButton(text=f"{page + 1}/{pages}", callback_data="noop"))
+        if page < pages - 1:
+            row.append(InlineKeyboardButton(text="▶", callback_data=f"{callback_prefix}:{page + 1}"))
+        return row
+
+    @staticmethod
+    def cities(cities: list[tuple[int, str]], page: int = 0, pages: int = 1):
         buttons = []
-        for city in cities:
-            buttons.append([InlineKeyboardButton(text=city, callback_data=f"city:{city}")])
+        for city_id, city in cities:
+            buttons.append([InlineKeyboardButton(text=city, callback_data=f"city:{encode_id(city_id)}")])
+        pager = Keyboards.pager("cities", page, pages)
+        if pager:
+            buttons.append(pager)
         return InlineKeyboardMarkup(inline_keyboard=buttons)
 
     @staticmethod
-    def jobs(city, vacancies):
+    def jobs(city_id: int, vacancies: list[tuple[int, dict]], page: int = 0, pages: int = 1):
         buttons = []
-        for i, vacancy in enumerate(vacancies):
-            buttons.append([InlineKeyboardButton(text=vacancy["title"], callback_data=f"job:{city}:{i}")])
+        for job_id, vacancy in vacancies:
+            buttons.append([InlineKeyboardButton(text=vacancy["title"], callback_data=f"job:{encode_id(job_id)}:{page}")])
+        pager = Keyboards.pager(f"jobs:{encode_id(city_id)}", page, pages)
+        if pager:
+            buttons.append(pager)
         buttons.append([InlineKeyboardButton(text="⬅ Назад", callback_data="back:cities")])
         return InlineKeyboardMarkup(inline_keyboard=buttons)
 
     @staticmethod
-    def job_detail(city, index, url):
-        def _is_valid_http_url(u: str) -> bool:
-            try:
-                parsed = urlparse(u)
-                return parsed.scheme in ("http", "https") and bool(parsed.netloc)
-            except Exception:
-                return False
+    def search_results(results: list[tuple[int, dict, str]], page: int = 0, pages: int = 1):
+        buttons = []
+        for job_id, vacancy, city in results:
+            buttons.append([InlineKeyboardButton(text=f"{vacancy['title']} · {city}", callback_data=f"job:{encode_id(job_id)}:0")])
+        pager = Keyboards.pager("search", page, pages)
+        if pager:
+            buttons.append(pager)
+        return InlineKeyboardMarkup(inline_keyboard=buttons)
 
+    @staticmethod
+    def job_detail(city_id: int, url, page: int = 0):
         buttons = []
-        if _is_valid_http_url(url):
+        if is_valid_http_url(url):
             buttons.append([InlineKeyboardButton(text="🔗 Перейти к вакансиям", url=url)])
-        buttons.append([InlineKeyboardButton(text="⬅ К списку работ", callback_data=f"back:jobs:{city}")])
+        buttons.append([InlineKeyboardButton(text="⬅ К списку работ", callback_data=f"back:jobs:{encode_id(city_id)}:{page}")])
         buttons.append([InlineKeyboardButton(text="⬅ К городам", callback_data=f"back:cities")])
         return InlineKeyboardMarkup(inline_keyboard=buttons)
 
     @staticmethod
-    def admin(cities, can_manage_roles: bool = False, can_manage_bot: bool = False):
+    def job_share(url):
+        """Vacancy shared through inline mode: link only, menu callbacks need a message in the bot's chat."""
+        if not is_valid_http_url(url):
+            return None
+        return InlineKeyboardMarkup(inline_keyboard=[[InlineKeyboardButton(text="🔗 Перейти к вакансиям", url=url)]])
+
+    @staticmethod
+    def admin(cities: list[tuple[int, str]], can_manage_roles: bool = False, can_manage_bot: bool = False,
+              page: int = 0, pages: int = 1):
         buttons = []
-        for city in cities:
+        for city_id, city in cities:
+            cid = encode_id(city_id)
             buttons.append([
-                InlineKeyboardButton(text=f"📋 {city}", callback_data=f"manage_city:{city}"),
-                InlineKeyboardButton(text="➕ Добавить работу", callback_data=f"admin_city:{city}")
+                InlineKeyboardButton(text=f"📋 {city}", callback_data=f"manage_city:{cid}"),
+                InlineKeyboardButton(text="➕ Добавить работу", callback_data=f"admin_city:{cid}")
             ])
-        buttons.append([InlineKeyboardButton(text="➕ Добавить новый город", callback_data="admin_city:new")])
+        pager = Keyboards.pager("admin_cities", page, pages)
+        if pager:
+            buttons.append(pager)
+        buttons.append([InlineKeyboardButton(text="➕ Добавить новый город", callback_data="admin_city_new")])
+        buttons.append([
+            InlineKeyboardButton(text="📥 Импорт", callback_data="admin_import"),
+            InlineKeyboardButton(text="📤 Экспорт", callback_data="admin_export:csv"),
+        ])
         if can_manage_roles:
             buttons.append([InlineKeyboardButton(text="👤 Управление ролями", callback_data="roles_menu")])
         if can_manage_bot:
@@ -51,30 +101,77 @@ class Keyboards:
         return InlineKeyboardMarkup(inline_keyboard=buttons)
 
     @staticmethod
-    def admin_city_menu(city: str):
+    def admin_city_menu(city_id: int):
+        cid = encode_id(city_id)
         return InlineKeyboardMarkup(inline_keyboard=[
-            [InlineKeyboardButton(text="📝 Переименовать город", callback_data=f"admin_city_rename:{city}")],
-            [InlineKeyboardButton(text="🗑 Удалить город", callback_data=f"admin_city_delete:{city}")],
-            [InlineKeyboardButton(text="📋 Список работ", callback_data=f"admin_jobs:{city}")],
+            [InlineKeyboardButton(text="📝 Переименовать город", callback_data=f"admin_city_rename:{cid}")],
+            [InlineKeyboardButton(text="🗑 Удалить город", callback_data=f"admin_city_delete:{cid}")],
+            [InlineKeyboardButton(text="📋 Список работ", callback_data=f"admin_jobs:{cid}:0")],
             [InlineKeyboardButton(text="⬅ Назад к городам", callback_data="admin_back_to_city")]
         ])
 
     @staticmethod
-    def admin_jobs(city: str, vacancies: list[dict]):
+    def admin_jobs(city_id: int, vacancies: list[tuple[int, dict]], page: int = 0, pages: int = 1):
         buttons = []
-        for i, v in enumerate(vacancies):
-            buttons.append([InlineKeyboardButton(text=v["title"], callback_data=f"admin_job:{city}:{i}")])
-        buttons.append([InlineKeyboardButton(text="⬅ Назад", callback_data=f"manage_city:{city}")])
+        for job_id, v in vacancies:
+            buttons.append([InlineKeyboardButton(text=v["title"], callback_data=f"admin_job:{encode_id(job_id)}:{page}")])
+        pager = Keyboards.pager(f"admin_jobs:{encode_id(city_id)}", page, pages)
+        if pager:
+            buttons.append(pager)
+        if vacancies:
+            buttons.append([InlineKeyboardButton(text="☑️ Выбрать несколько", callback_data=f"bulk:open:{encode_id(city_id)}:{page}")])
+        buttons.append([InlineKeyboardButton(text="⬅ Назад", callback_data=f"manage_city:{encode_id(city_id)}")])
+        return InlineKeyboardMarkup(inline_keyboard=buttons)
+
+    # ===Выбор нескольких вакансий===
+    @staticmethod
+    def bulk_select(city_id: int, vacancies: list[tuple[int, dict]], selected: set, page: int = 0, pages: int = 1):
+        cid = encode_id(city_id)
+        buttons = []
+        for job_id, v in vacancies:
+            mark = "✅" if job_id in selected else "⬜"
+            buttons.append([InlineKeyboardButton(text=f"{mark} {v['title']}", callback_data=f"bulk:t:{encode_id(job_id)}:{page}")])
+        pager = Keyboards.pager(f"bulk:open:{cid}", page, pages)
+        if pager:
+            buttons.append(pager)
+        buttons.append([
+            InlineKeyboardButton(text="☑️ Вся страница", callback_data=f"bulk:page:{page}"),
+            InlineKeyboardButton(text="✖ Снять выбор", callback_data=f"bulk:none:{page}"),
+        ])
+        if selected:
+            buttons.append([InlineKeyboardButton(text=f"🗑 Удалить ({len(selected)})", callback_data="bulk:delete")])
+            buttons.append([
+                InlineKeyboardButton(text="📦 В другой город", callback_data="bulk:move:0"),
+                InlineKeyboardButton(text="🔗 Заменить ссылку", callback_data="bulk:url"),
+            ])
+        buttons.append([InlineKeyboardButton(text="⬅ Готово", callback_data=f"admin_jobs:{cid}:{page}")])
+        return InlineKeyboardMarkup(inline_keyboard=buttons)
+
+    @staticmethod
+    def bulk_confirm_delete(count: int, back: str):
+        return InlineKeyboardMarkup(inline_keyboard=[
+            [InlineKeyboardButton(text=f"🗑 Да, удалить {count}", callback_data="bulk:delete:yes")],
+            [InlineKeyboardButton(text="⬅ Отмена", callback_data=back)],
+        ])
+
+    @staticmethod
+    def bulk_move_targets(cities: list[tuple[int, str]], back: str, page: int = 0, pages: int = 1):
+        buttons = [[InlineKeyboardButton(text=f"📍 {city}", callback_data=f"bulk:move_to:{encode_id(city_id)}")] for city_id, city in cities]
+        pager = Keyboards.pager("bulk:move", page, pages)
+        if pager:
+            buttons.append(pager)
+        buttons.append([InlineKeyboardButton(text="⬅ Отмена", callback_data=back)])
         return InlineKeyboardMarkup(inline_keyboard=buttons)
 
     @staticmethod
-    def admin_job_menu(city: str, index: int):
+    def admin_job_menu(job_id: int, city_id: int, page: int = 0):
+        jid = encode_id(job_id)
         return InlineKeyboardMarkup(inline_keyboard=[
-            [InlineKeyboardButton(text="✏️ Название", callback_data=f"admin_job_edit_title:{city}:{index}")],
-            [InlineKeyboardButton(text="📝 Описание", callback_data=f"admin_job_edit_desc:{city}:{index}")],
-            [InlineKeyboardButton(text="🔗 Ссылка", callback_data=f"admin_job_edit_url:{city}:{index}")],
-            [InlineKeyboardButton(text="🗑 Удалить работу", callback_data=f"admin_job_delete:{city}:{index}")],
-            [InlineKeyboardButton(text="⬅ Назад к работам", callback_data=f"admin_jobs:{city}")]
+            [InlineKeyboardButton(text="✏️ Название", callback_data=f"admin_job_edit_title:{jid}")],
+            [InlineKeyboardButton(text="📝 Описание", callback_data=f"admin_job_edit_desc:{jid}")],
+            [InlineKeyboardButton(text="🔗 Ссылка", callback_data=f"admin_job_edit_url:{jid}")],
+            [InlineKeyboardButton(text="🗑 Удалить работу", callback_data=f"admin_job_delete:{jid}")],
+            [InlineKeyboardButton(text="⬅ Назад к работам", callback_data=f"admin_jobs:{encode_id(city_id)}:{page}")]
         ])
 
     @staticmethod
@@ -139,12 +236,27 @@ class Keyboards:
         return InlineKeyboardMarkup(inline_keyboard=[
             [InlineKeyboardButton(text="🔄 Перезапустить", callback_data="dev:restart")],
             [InlineKeyboardButton(text="⏹ Остановить", callback_data="dev:stop")],
-            [InlineKeyboardButton(text="📄 Логи (последние 200)", callback_data="dev:logs_tail")],
+            [InlineKeyboardButton(text="📄 Логи (последние 200)", callback_data="dev:logs_tail:0")],
             [InlineKeyboardButton(text="📥 Скачать лог", callback_data="dev:logs_download")],
             [InlineKeyboardButton(text="🧭 Уровень логов", callback_data="dev:loglevel")],
+            [InlineKeyboardButton(text="📊 Активность", callback_data="dev:stats")],
             [InlineKeyboardButton(text="⬅ Назад", callback_data="admin_back_to_city")],
         ])
 
+    @staticmethod
+    def log_tail_nav(skip: int, older_skip: int | None):
+        rows = []
+        nav = []
+        if older_skip is not None:
+            nav.append(InlineKeyboardButton(text="⏪ Раньше", callback_data=f"dev:logs_tail:{older_skip}"))
+        if skip > 0:
+            nav.append(InlineKeyboardButton(text="⏭ Последние", callback_data="dev:logs_tail:0"))
+        if nav:
+            rows.append(nav)
+        rows.append([InlineKeyboardButton(text="🔄 Обновить", callback_data=f"dev:logs_tail:{skip}")])
+        rows.append([InlineKeyboardButton(text="⬅ Назад", callback_data="dev_menu")])
+        return InlineKeyboardMarkup(inline_keyboard=rows)
+
     @staticmethod
     def log_levels(current: str):
         labels = [
@@ -159,4 +271,73 @@ class Keyboards:
             mark = " ✅" if current.upper() == level else ""
             rows.append([InlineKeyboardButton(text=label + mark, callback_data=f"dev:loglevel:set:{level}")])
         rows.append([InlineKeyboardButton(text="⬅ Назад", callback_data="dev_menu")])
-        return InlineKeyboardMarkup(inline_keyboard=rows)
\ No newline at end of file
+        return InlineKeyboardMarkup(inline_keyboard=rows)
+
+class KeyboardCache:
+    """Memoized catalog markups shared by all users.
+
+    Entries are keyed by (view, city, page, catalog version, role flags); the whole
+    cache is dropped as soon as Jobservice.version moves on.
+    """
+
+    def __init__(self, jobs_service, maxsize: int = 1024):
+        self.jobs_service = jobs_service
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._version = None
+        self._cache: dict = {}
+
+    def _get(self, view: str, city, page: int, flags: tuple, build):
+        version = self.jobs_service.version
+        if version != self._version:
+            self._cache.clear()
+            self._version = version
+        key = (view, city, page, version, flags)
+        markup = self._cache.get(key)
+        if markup is not None:
+            self.hits += 1
+            return markup
+        self.misses += 1
+        markup = build()
+        if len(self._cache) >= self.maxsize:
+            self._cache.pop(next(iter(self._cache)))
+        self._cache[key] = markup
+        return markup
+
+    # Страница строится только из своего среза каталога
+    def cities(self, page: int = 0):
+        total = self.jobs_service.count_cities()
+        page = clamp_page(page, total)
+
+        def build():
+            items = self.jobs_service.get_city_items(page * PAGE_SIZE, PAGE_SIZE)
+            return Keyboards.cities(items, page, page_count(total))
+        return self._get("cities", None, page, (), build)
+
+    def jobs(self, city: str, page: int = 0):
+        total = self.jobs_service.count_jobs(city)
+        page = clamp_page(page, total)
+
+        def build():
+            items = self.jobs_service.get_job_items(city, page * PAGE_SIZE, PAGE_SIZE)
+            return Keyboards.jobs(self.jobs_service.get_city_id(city), items, page, page_count(total))
+        return self._get("jobs", city, page, (), build)
+
+    def admin(self, can_manage_roles: bool = False, can_manage_bot: bool = False, page: int = 0):
+        total = self.jobs_service.count_cities()
+        page = clamp_page(page, total)
+
+        def build():
+            items = self.jobs_service.get_city_items(page * PAGE_SIZE, PAGE_SIZE)
+            return Keyboards.admin(items, can_manage_roles, can_manage_bot, page, page_count(total))
+        return self._get("admin", None, page, (can_manage_roles, can_manage_bot), build)
+
+    def admin_jobs(self, city: str, page: int = 0):
+        total = self.jobs_service.count_jobs(city)
+        page = clamp_page(page, total)
+
+        def build():
+            items = self.jobs_service.get_job_items(city, page * PAGE_SIZE, PAGE_SIZE)
+            return Keyboards.admin_jobs(self.jobs_service.get_city_id(city), items, page, page_count(total))
+        return self._get("admin_jobs", city, page, (), build)
@@ -0,0 +1,102 @@
+import asyncio
+import json
+import logging
+from typing import Any, Awaitable, Callable, Dict
+
+from aiogram import BaseMiddleware, Bot
+from aiogram.methods import GetUpdates
+from aiogram.types import TelegramObject, Update
+
+from persistence import atomic_write_json
+
+logger = logging.getLogger(__name__)
+
+ACTIONS = ("stop", "restart")
+
+
+class Lifecycle(BaseMiddleware):
+    """Graceful stop/restart: handlers ask for it, the entry point carries it out.
+
+    `request()` only records the action and wakes `wait()`; whoever runs the
+    bot then stops taking updates, drains the UpdateScheduler, flushes
+    storages and logs and finally exits or re-execs. As the outermost update
+    middleware it also remembers the last update accepted into the queue,
+    so Telegram can be told which updates are done (`ack`) and the next
+    start does not fetch them again.
+    """
+
+    def __init__(self, offset_file: str | None = None, on_request: Callable[[str], None] | None = None):
+        self.offset_file = offset_file
+        # в режиме шардов решение принимает мастер: воркер только передаёт ему действие
+        self.on_request = on_request
+        self.action: str | None = None
+        self.last_update_id: int | None = None
+        self._requested = asyncio.Event()
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any],
+    ) -> Any:
+        result = await handler(event, data)
+        # апдейт принят в очередь планировщика; при остановке он ещё будет обработан
+        if isinstance(event, Update):
+            self.accepted(event.update_id)
+        return result
+
+    def accepted(self, update_id: int):
+        if self.last_update_id is None or update_id > self.last_update_id:
+            self.last_update_id = update_id
+
+    def request(self, action: str):
+        if action not in ACTIONS:
+            raise ValueError(f"unknown lifecycle action: {action!r}")
+        if self.on_request is not None:
+            self.on_request(action)
+            return
+        if self.action is None:
+            logger.info("Graceful %s requested", action)
+            self.action = action
+            self._requested.set()
+
+    async def wait(self) -> str:
+        await self._requested.wait()
+        return self.action
+
+    # ==Смещение getUpdates==
+    def load_offset(self) -> int | None:
+        if not self.offset_file:
+            return None
+        try:
+            with open(self.offset_file, "r", encoding="utf-8") as f:
+                return int(json.load(f)["offset"])
+        except FileNotFoundError:
+            return None
+        except (ValueError, KeyError, TypeError, json.JSONDecodeError):
+            logger.warning("Ignoring invalid offset file %s", self.offset_file)
+            return None
+
+    @property
+    def offset(self) -> int | None:
+        return self.last_update_id + 1 if self.last_update_id is not None else None
+
+    async def ack(self, bot: Bot, offset: int | None = None):
+        """Confirm everything below `offset` (default: after the last accepted update) and save it."""
+        offset = offset if offset is not None else self.offset
+        if offset is None:
+            return
+        try:
+            # timeout=0: подтверждаем и сразу возвращаемся, ничего не дожидаясь
+            await bot(GetUpdates(offset=offset, limit=1, timeout=0))
+        except Exception as e:
+            logger.warning("Could not confirm updates below %d: %s", offset, e)
+        if self.offset_file:
+            await asyncio.to_thread(atomic_write_json, self.offset_file, {"offset": offset})
+        logger.info("Updates confirmed up to offset %d", offset)
+
+    async def skip_handled(self, bot: Bot):
+        """On start: confirm updates handled before the last stop, in case that ack did not reach Telegram."""
+        offset = self.load_offset()
+        if offset is not None:
+            await self.ack(bot, offset)
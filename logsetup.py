@@ -0,0 +1,109 @@
+import json
+import logging
+import os
+import queue
+from contextvars import ContextVar
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+from typing import Any, Dict
+
+LOG_FORMAT = "%(asctime)s %(levelname)s [%(name)s] %(message)s"
+CONTEXT_FIELDS = ("handler", "user_id", "update_id")
+
+# Поля текущего апдейта (handler, user_id, update_id); задаются middleware и диспетчером колбэков
+log_context: ContextVar[Dict[str, Any]] = ContextVar("log_context", default={})
+
+
+def bind_log_context(**fields):
+    log_context.set({**log_context.get(), **fields})
+
+
+class ContextFilter(logging.Filter):
+    """Copies the current update context onto the record while still on the caller's thread."""
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        ctx = log_context.get()
+        for field in CONTEXT_FIELDS:
+            if not hasattr(record, field):
+                setattr(record, field, ctx.get(field))
+        return True
+
+
+_traceback_formatter = logging.Formatter()
+
+
+class EnqueueOnlyHandler(QueueHandler):
+    """QueueHandler that skips formatting on the caller's thread.
+
+    The stock prepare() runs the full formatter before enqueueing; here only
+    the %-args are merged so later mutation of arguments cannot change the
+    message, and formatting happens in the listener thread. Tracebacks are
+    rendered to exc_text so the record also survives a multiprocessing queue.
+    """
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        if record.args:
+            record.msg = record.getMessage()
+            record.args = None
+        if record.exc_info:
+            record.exc_text = _traceback_formatter.formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line: ts, level, logger, msg + update context and duration_ms when present."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        payload = {
+            "ts": self.formatTime(record),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        for field in CONTEXT_FIELDS + ("duration_ms",):
+            value = getattr(record, field, None)
+            if value is not None:
+                payload[field] = value
+        if record.exc_text or record.exc_info:
+            payload["exc"] = record.exc_text or self.formatException(record.exc_info)
+        return json.dumps(payload, ensure_ascii=False)
+
+
+def _install_queue_handler(log_queue, level: int):
+    queue_handler = EnqueueOnlyHandler(log_queue)
+    queue_handler.addFilter(ContextFilter())
+    root_logger = logging.getLogger()
+    for handler in list(root_logger.handlers):
+        root_logger.removeHandler(handler)
+    root_logger.addHandler(queue_handler)
+    root_logger.setLevel(level)
+
+
+def setup_logging(logs_dir: str, json_logs: bool = False, level: int = logging.INFO, log_queue=None) -> QueueListener:
+    """Route all logging through a queue; file rotation and console output run in a listener thread.
+
+    The root logger's level is still the single switch for verbosity
+    (dev_set_loglevel keeps working). Pass a multiprocessing queue as
+    `log_queue` to also collect records from worker processes (see
+    setup_worker_logging). Call listener.stop() on shutdown to drain the queue.
+    """
+    os.makedirs(logs_dir, exist_ok=True)
+    file_handler = RotatingFileHandler(
+        os.path.join(logs_dir, "bot.log"), maxBytes=1_000_000, backupCount=3, encoding="utf-8"
+    )
+    file_handler.setFormatter(JsonFormatter() if json_logs else logging.Formatter(LOG_FORMAT))
+    console_handler = logging.StreamHandler()
+    console_handler.setFormatter(logging.Formatter(LOG_FORMAT))
+
+    if log_queue is None:
+        log_queue = queue.SimpleQueue()
+    _install_queue_handler(log_queue, level)
+
+    listener = QueueListener(log_queue, file_handler, console_handler)
+    listener.start()
+    return listener
+
+
+def setup_worker_logging(log_queue, level: int = logging.INFO):
+    """Worker process side: send records to the parent's listener instead of opening bot.log again."""
+    _install_queue_handler(log_queue, level)
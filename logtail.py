@@ -0,0 +1,62 @@
+import os
+from typing import Iterator, List, Tuple
+
+BLOCK_SIZE = 8192
+
+
+def rotated_files(path: str) -> List[str]:
+    """bot.log, bot.log.1, bot.log.2, ... (newest first), as RotatingFileHandler names them."""
+    files = [path] if os.path.exists(path) else []
+    n = 1
+    while os.path.exists(f"{path}.{n}"):
+        files.append(f"{path}.{n}")
+        n += 1
+    return files
+
+
+def reverse_lines(path: str, block_size: int = BLOCK_SIZE) -> Iterator[bytes]:
+    """Lines of a file from last to first, reading fixed-size blocks backwards from EOF."""
+    with open(path, "rb") as f:
+        pos = f.seek(0, os.SEEK_END)
+        buffer = b""
+        at_end = True
+        while pos > 0:
+            size = min(block_size, pos)
+            pos -= size
+            f.seek(pos)
+            buffer = f.read(size) + buffer
+            lines = buffer.split(b"\n")
+            buffer = lines[0]
+            for line in reversed(lines[1:]):
+                # пустая "строка" после завершающего \n — не строка лога
+                if at_end and not line:
+                    at_end = False
+                    continue
+                at_end = False
+                yield line
+        if buffer or not at_end:
+            yield buffer
+
+
+def tail(path: str, skip: int = 0, max_lines: int = 200, max_chars: int = 3500) -> Tuple[List[str], bool]:
+    """Up to `max_lines` lines (and `max_chars` characters) ending `skip` lines before the end of the log.
+
+    Continues into rotated files when the current one runs out. Returns the
+    lines in chronological order and whether older lines exist.
+    """
+    collected: List[str] = []
+    chars = 0
+    seen = 0
+    for file_path in rotated_files(path):
+        for raw in reverse_lines(file_path):
+            if seen < skip:
+                seen += 1
+                continue
+            line = raw.decode("utf-8", errors="ignore")
+            if len(collected) >= max_lines or (collected and chars + len(line) + 1 > max_chars):
+                collected.reverse()
+                return collected, True
+            collected.append(line[-max_chars:])
+            chars += len(line) + 1
+    collected.reverse()
+    return collected, False
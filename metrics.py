@@ -0,0 +1,242 @@
+import bisect
+import logging
+import time
+from contextlib import contextmanager
+from typing import Any, Awaitable, Callable, Dict, List, Tuple
+
+from aiogram import BaseMiddleware
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware, NextRequestMiddlewareType
+from aiogram.dispatcher.event.bases import UNHANDLED
+from aiogram.methods import GetUpdates, TelegramMethod
+from aiogram.types import TelegramObject, Update
+from logsetup import log_context
+
+logger = logging.getLogger(__name__)
+
+# секунды; как у prometheus_client по умолчанию
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _labels(names: Tuple[str, ...], values: Tuple[str, ...]) -> str:
+    if not names:
+        return ""
+    escaped = (str(v).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"') for v in values)
+    return "{" + ",".join(f'{n}="{v}"' for n, v in zip(names, escaped)) + "}"
+
+
+class Counter:
+    def __init__(self, name: str, help: str, labels: Tuple[str, ...] = ()):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self.values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, *labels: str, amount: float = 1):
+        self.values[labels] = self.values.get(labels, 0) + amount
+
+    def total(self) -> float:
+        return sum(self.values.values())
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        for labels, value in self.values.items():
+            lines.append(f"{self.name}{_labels(self.labels, labels)} {value:g}")
+        return lines
+
+
+class _Series:
+    __slots__ = ("buckets", "sum", "count")
+
+    def __init__(self, size: int):
+        # последняя ячейка — всё, что больше верхней границы (+Inf)
+        self.buckets = [0] * (size + 1)
+        self.sum = 0.0
+        self.count = 0
+
+
+class Histogram:
+    def __init__(self, name: str, help: str, labels: Tuple[str, ...] = (), buckets: Tuple[float, ...] = DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self.bounds = tuple(sorted(buckets))
+        self.series: Dict[Tuple[str, ...], _Series] = {}
+
+    def observe(self, value: float, *labels: str):
+        series = self.series.get(labels)
+        if series is None:
+            series = self.series[labels] = _Series(len(self.bounds))
+        series.buckets[bisect.bisect_left(self.bounds, value)] += 1
+        series.sum += value
+        series.count += 1
+
+    @contextmanager
+    def time(self, *labels: str):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, *labels)
+
+    def quantile(self, q: float, *labels: str) -> float:
+        """Estimate from the buckets, interpolated like PromQL histogram_quantile()."""
+        series = self.series.get(labels)
+        if series is None or not series.count:
+            return 0.0
+        rank = q * series.count
+        seen = 0
+        for i, n in enumerate(series.buckets):
+            if seen + n >= rank and n:
+                if i == len(self.bounds):
+                    return self.bounds[-1]
+                lower = self.bounds[i - 1] if i else 0.0
+                return lower + (self.bounds[i] - lower) * (rank - seen) / n
+            seen += n
+        return self.bounds[-1]
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        names = self.labels + ("le",)
+        for labels, series in self.series.items():
+            cumulative = 0
+            for bound, n in zip(self.bounds + (float("inf"),), series.buckets):
+                cumulative += n
+                le = "+Inf" if bound == float("inf") else f"{bound:g}"
+                lines.append(f"{self.name}_bucket{_labels(names, labels + (le,))} {cumulative}")
+            lines.append(f"{self.name}_sum{_labels(self.labels, labels)} {series.sum:.6f}")
+            lines.append(f"{self.name}_count{_labels(self.labels, labels)} {series.count}")
+        return lines
+
+
+class Registry:
+    """A few counters and histograms, rendered in the Prometheus text format (no prometheus_client needed)."""
+
+    def __init__(self):
+        self.metrics: Dict[str, Counter | Histogram] = {}
+
+    def _add(self, metric):
+        if metric.name in self.metrics:
+            raise ValueError(f"metric already registered: {metric.name}")
+        self.metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, help: str, labels: Tuple[str, ...] = ()) -> Counter:
+        return self._add(Counter(name, help, labels))
+
+    def histogram(self, name: str, help: str, labels: Tuple[str, ...] = (), buckets: Tuple[float, ...] = DEFAULT_BUCKETS) -> Histogram:
+        return self._add(Histogram(name, help, labels, buckets))
+
+    def render(self) -> str:
+        lines: List[str] = []
+        for metric in self.metrics.values():
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+UPDATES = registry.counter("bot_updates_total", "Updates handled, by update type.", ("type",))
+HANDLER_SECONDS = registry.histogram("bot_handler_seconds", "Time to handle an update, by handler.", ("handler",))
+HANDLER_ERRORS = registry.counter("bot_handler_errors_total", "Updates whose handler raised, by handler and exception.", ("handler", "error"))
+API_SECONDS = registry.histogram("bot_api_request_seconds", "Bot API call latency (without outbound pacing), by method.", ("method",))
+API_ERRORS = registry.counter("bot_api_errors_total", "Failed Bot API calls, by method and exception.", ("method", "error"))
+PERSIST_SECONDS = registry.histogram(
+    "bot_persist_seconds",
+    "Time spent persisting the catalog and roles: JSON file writes (write:<file>) and SQLite transactions (sqlite:<op>).",
+    ("op",),
+)
+
+
+# ==Мидлвари==
+class UpdateMetricsMiddleware(BaseMiddleware):
+    """Outer update middleware: update types, per-handler latency and errors.
+
+    Must sit inside LogContextMiddleware: the handler name is the one the
+    routers put into the log context (for callbacks — the CallbackRouter
+    route), read after the handler returns. Registered after the
+    UpdateScheduler, it times the actual handling, not the queueing.
+    """
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any],
+    ) -> Any:
+        if isinstance(event, Update):
+            UPDATES.inc(event.event_type)
+        started = time.perf_counter()
+        try:
+            result = await handler(event, data)
+        except Exception as e:
+            name = log_context.get().get("handler") or "unknown"
+            HANDLER_ERRORS.inc(name, type(e).__name__)
+            HANDLER_SECONDS.observe(time.perf_counter() - started, name)
+            raise
+        name = "unhandled" if result is UNHANDLED else log_context.get().get("handler") or "unknown"
+        HANDLER_SECONDS.observe(time.perf_counter() - started, name)
+        return result
+
+
+class ApiMetricsMiddleware(BaseRequestMiddleware):
+    """Session middleware: Bot API latency and failures per method.
+
+    Register after OutboundScheduler so that it sits inside it and measures
+    the request itself, not the wait for a rate-limit token.
+    """
+
+    async def __call__(self, make_request: NextRequestMiddlewareType, bot, method: TelegramMethod):
+        name = type(method).__name__
+        started = time.perf_counter()
+        try:
+            result = await make_request(bot, method)
+        except Exception as e:
+            API_ERRORS.inc(name, type(e).__name__)
+            raise
+        # long polling висит до POLL_TIMEOUT — его время ничего не говорит
+        if not isinstance(method, GetUpdates):
+            API_SECONDS.observe(time.perf_counter() - started, name)
+        return result
+
+
+# ==HTTP==
+async def start_metrics_server(host: str, port: int):
+    """Serve GET /metrics on host:port; returns the aiohttp runner (await runner.cleanup() to stop)."""
+    from aiohttp import web
+
+    async def handle(request):
+        return web.Response(text=registry.render(), content_type="text/plain", charset="utf-8",
+                            headers={"X-Content-Type-Options": "nosniff"})
+
+    app = web.Application()
+    app.router.add_get("/metrics", handle)
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    await web.TCPSite(runner, host, port).start()
+    logger.info("Metrics on http://%s:%d/metrics", host, port)
+    return runner
+
+
+# ==Сводка для меню разработчика==
+def _top(histogram: Histogram, limit: int, exclude: Tuple[str, ...] = ()) -> List[Tuple[str, int, float, float]]:
+    """[(label, count, avg ms, p95 ms)] of the slowest series by p95."""
+    rows = []
+    for labels, series in histogram.series.items():
+        if not series.count or labels[0] in exclude:
+            continue
+        rows.append((labels[0], series.count, series.sum / series.count * 1000, histogram.quantile(0.95, *labels) * 1000))
+    rows.sort(key=lambda row: row[3], reverse=True)
+    return rows[:limit]
+
+
+def summary(limit: int = 5) -> str:
+    lines = [f"Апдейтов: {int(UPDATES.total())}, ошибок в хендлерах: {int(HANDLER_ERRORS.total())}, ошибок API: {int(API_ERRORS.total())}"]
+    for title, histogram, exclude in (
+        ("Хендлеры", HANDLER_SECONDS, ("unhandled",)),
+        ("Методы API", API_SECONDS, ()),
+        ("Запись", PERSIST_SECONDS, ()),
+    ):
+        rows = _top(histogram, limit, exclude)
+        if rows:
+            lines.append(f"{title} (p95 / ср., мс):")
+            lines.extend(f"  {name}: {p95:.0f} / {avg:.1f} ×{count}" for name, count, avg, p95 in rows)
+    return "\n".join(lines)
@@ -0,0 +1,83 @@
+import logging
+import time
+from typing import Any, Awaitable, Callable, Dict
+from aiogram import BaseMiddleware
+from aiogram.types import TelegramObject, Update
+from logsetup import bind_log_context, log_context
+from services import Jobservice, Perm
+from profiles import ProfileCache
+
+logger = logging.getLogger(__name__)
+
+
+class PermissionsMiddleware(BaseMiddleware):
+    """Resolves the sender's role bitmask once per update and passes it to handlers as `perms`."""
+
+    def __init__(self, jobs_service: Jobservice):
+        self.jobs_service = jobs_service
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any],
+    ) -> Any:
+        user = data.get("event_from_user")
+        data["perms"] = self.jobs_service.permissions(user.id) if user is not None else Perm.NONE
+        return await handler(event, data)
+
+
+class ProfileObserverMiddleware(BaseMiddleware):
+    """Refreshes the profile cache from `from_user` of every update, so roster renders rarely need get_chat."""
+
+    def __init__(self, profiles: ProfileCache):
+        self.profiles = profiles
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any],
+    ) -> Any:
+        user = data.get("event_from_user")
+        if user is not None:
+            self.profiles.observe(user.id, user.username, user.full_name)
+        return await handler(event, data)
+
+
+class LogContextMiddleware(BaseMiddleware):
+    """Outer update middleware: binds update_id/user_id for log records and logs handling time."""
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any],
+    ) -> Any:
+        user = data.get("event_from_user")
+        token = log_context.set({
+            "update_id": event.update_id if isinstance(event, Update) else None,
+            "user_id": user.id if user is not None else None,
+        })
+        started = time.perf_counter()
+        try:
+            return await handler(event, data)
+        finally:
+            duration_ms = round((time.perf_counter() - started) * 1000, 2)
+            logger.debug("Update handled in %.2f ms", duration_ms, extra={"duration_ms": duration_ms})
+            log_context.reset(token)
+
+
+class HandlerNameMiddleware(BaseMiddleware):
+    """Inner middleware: adds the resolved handler's name to the log context."""
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any],
+    ) -> Any:
+        handler_object = data.get("handler")
+        if handler_object is not None:
+            bind_log_context(handler=getattr(handler_object.callback, "__name__", None))
+        return await handler(event, data)
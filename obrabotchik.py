@@ -1,19 +1,46 @@
 from aiogram import Router, F
-from aiogram.types import Message, CallbackQuery, InlineKeyboardMarkup, InlineKeyboardButton, FSInputFile
+from aiogram.types import Message, CallbackQuery, InlineQuery, InlineKeyboardMarkup, InlineKeyboardButton, FSInputFile, BufferedInputFile
 from aiogram.fsm.state import State, StatesGroup
 from aiogram.fsm.context import FSMContext
-from aiogram.filters import CommandStart
+from aiogram.filters import CommandStart, Command, CommandObject
 from aiogram.exceptions import TelegramBadRequest
-from keyboards import Keyboards
-from services import Jobservice
+from keyboards import Keyboards, KeyboardCache, PAGE_SIZE, page_count, clamp_page
+from services import Jobservice, Perm, encode_id, is_valid_http_url
+from callbacks import CallbackRouter, b36
+from profiles import ProfileCache
+from storage import create_catalog_storage
+from scheduler import UpdateScheduler
+from outbound import OutboundScheduler
+from lifecycle import Lifecycle
+from activity import ActivityLog
+from search import SearchIndex
+from inline import InlineResults
+from catalog_io import detect_format, parse_import, error_report, write_export
+from config import CATALOG_BACKEND, CATALOG_DB, ACTIVITY_LOG, ACTIVITY_FLUSH_INTERVAL, INLINE_PAGE_SIZE, INLINE_CACHE_TIME, IMPORT_MAX_BYTES
 from urllib.parse import urlparse
+import asyncio
 import logging
-import sys
 import os
+import tempfile
+import time
+import logtail
+import metrics
 
 router = Router()
-jobs_service = Jobservice()
+jobs_service = Jobservice(storage=create_catalog_storage(CATALOG_BACKEND, db_file=CATALOG_DB))
+keyboards_cache = KeyboardCache(jobs_service)
+# строится при первом поиске, дальше обновляется по правкам каталога
+search_index = SearchIndex(jobs_service)
+# инлайн-выдача: статьи вакансий по городам, сбрасываются с версией каталога
+inline_results = InlineResults(jobs_service, search_index, INLINE_PAGE_SIZE)
+# Все callback_query идут через один trie-диспетчер вместо цепочки F.data.startswith
+callbacks = CallbackRouter()
+router.callback_query.register(callbacks.dispatch)
+profiles = ProfileCache()
+# какие города и вакансии смотрят; пишется в фоне, bot.py запускает и останавливает
+activity = ActivityLog(ACTIVITY_LOG, flush_interval=ACTIVITY_FLUSH_INTERVAL)
 logger = logging.getLogger(__name__)
+LOG_PATH = os.path.join(os.path.dirname(__file__), "logs", "bot.log")
 
 
 
@@ -25,8 +52,7 @@ async def resolve_to_user_id(text: str, bot) -> int | None:
         return None
     if value.startswith("@"):
         try:
-            chat = await bot.get_chat(value)
-            uid = int(chat.id)
+            uid = await profiles.resolve_username(bot, value)
             logger.debug("resolve_to_user_id: @ resolved username=%s -> uid=%d", value, uid)
             return uid
         except Exception as e:
@@ -41,15 +67,7 @@ async def resolve_to_user_id(text: str, bot) -> int | None:
         return None
 
 async def display_name(bot, uid: int) -> str:
-    try:
-        chat = await bot.get_chat(uid)
-        if getattr(chat, "username", None):
-            return f"@{chat.username}"
-        if getattr(chat, "full_name", None):
-            return f"{chat.full_name} ({uid})"
-    except Exception:
-        pass
-    return str(uid)
+    return await profiles.display_name(bot, uid)
 
 
 async def send_new_and_delete(callback: CallbackQuery, text: str, reply_markup=None):
@@ -72,18 +90,10 @@ class AdminEdit(StatesGroup):
     edit_title = State()
     edit_desc = State()
     edit_url = State()
+    bulk_url = State()
 
-def is_admin(user_id: int) -> bool:
-    return jobs_service.is_admin(user_id)
-
-def is_super_admin(user_id: int) -> bool:
-    return jobs_service.is_super_admin(user_id)
-
-def is_developer(user_id: int) -> bool:
-    return jobs_service.is_developer(user_id)
-
-def has_admin_access(user_id: int) -> bool:
-    return jobs_service.has_admin_access(user_id)
+class CatalogImport(StatesGroup):
+    file = State()
 
 
 class RolesEdit(StatesGroup):
@@ -95,286 +105,527 @@ class RolesEdit(StatesGroup):
 
 #==Пользователь==
 @router.message(CommandStart())
-async def start_cmd(message: Message):
-    cities = jobs_service.get_cities()
-    if not cities:
+async def start_cmd(message: Message, perms: Perm):
+    activity.emit("start", message.from_user.id)
+    if not jobs_service.count_cities():
         return await message.answer("⚠ В базе пока нет городов.")
     await message.answer(
         "Главное меню",
-        reply_markup=Keyboards.reply_menu(has_admin_access(message.from_user.id))
+        reply_markup=Keyboards.reply_menu(perms & Perm.ADMIN_ACCESS)
     )
-    await message.answer("👋Здравствуйте! Это бот по поиску работы. Скорее выбирай город. Выберите город:", reply_markup=Keyboards.cities(cities))
+    await message.answer("👋Здравствуйте! Это бот по поиску работы. Скорее выбирай город. Выберите город:", reply_markup=keyboards_cache.cities())
 
 @router.message(F.text.casefold() == "главное меню")
-async def back_to_start(message: Message):
-    await start_cmd(message)
+async def back_to_start(message: Message, perms: Perm):
+    await start_cmd(message, perms)
 
 @router.message(F.text.casefold() == "админка")
-async def open_admin_panel(message: Message, state: FSMContext):
-    if not has_admin_access(message.from_user.id):
+async def open_admin_panel(message: Message, state: FSMContext, perms: Perm):
+    if not perms & Perm.ADMIN_ACCESS:
         return await message.answer("⚠ У вас нет прав администратора.")
     await state.set_state(AddJob.city_choise)
     await message.answer(
         "📍 Выберите город или добавьте новый:",
-        reply_markup=Keyboards.admin(
-            jobs_service.get_cities(),
-            can_manage_roles=(is_super_admin(message.from_user.id) or is_developer(message.from_user.id)),
-            can_manage_bot=is_developer(message.from_user.id)
+        reply_markup=keyboards_cache.admin(
+            can_manage_roles=bool(perms & Perm.MANAGE_ROLES),
+            can_manage_bot=bool(perms & Perm.DEVELOPER)
         )
     )
 
 # == Админ: управление городом и работами ==
-@router.callback_query(F.data.startswith("manage_city:"))
-async def admin_manage_city(callback: CallbackQuery, state: FSMContext):
-    if not has_admin_access(callback.from_user.id):
+@callbacks.route("manage_city", args=(b36,))
+async def admin_manage_city(callback: CallbackQuery, city_id: int, state: FSMContext, perms: Perm):
+    if not perms & Perm.ADMIN_ACCESS:
         return await callback.answer("Нет прав", show_alert=True)
-    city = callback.data.split(":")[1]
-    await state.update_data(city=city)
-    await callback.message.edit_text(f"⚙️ Настройка города: {city}", reply_markup=Keyboards.admin_city_menu(city))
+    city = jobs_service.get_city_by_id(city_id)
+    if city is None:
+        return await callback.answer("⚠ Город не найден", show_alert=True)
+    await state.update_data(city_id=city_id)
+    await callback.message.edit_text(f"⚙️ Настройка города: {city}", reply_markup=Keyboards.admin_city_menu(city_id))
     await callback.answer()
 
-@router.callback_query(F.data.startswith("admin_jobs:"))
-async def admin_list_jobs(callback: CallbackQuery, state: FSMContext):
-    if not has_admin_access(callback.from_user.id):
+@callbacks.route("admin_jobs", args=(b36, int))
+async def admin_list_jobs(callback: CallbackQuery, city_id: int, page: int, state: FSMContext, perms: Perm):
+    if not perms & Perm.ADMIN_ACCESS:
         return await callback.answer("Нет прав", show_alert=True)
-    city = callback.data.split(":")[1]
-    await state.update_data(city=city)
-    vacancies = jobs_service.get_jobs(city)
+    city = jobs_service.get_city_by_id(city_id)
+    if city is None:
+        return await callback.answer("⚠ Город не найден", show_alert=True)
+    await state.update_data(city_id=city_id)
     text = f"📋 Работы в городе: {city}"
-    await callback.message.edit_text(text, reply_markup=Keyboards.admin_jobs(city, vacancies))
+    await callback.message.edit_text(text, reply_markup=keyboards_cache.admin_jobs(city, page))
     await callback.answer()
 
-@router.callback_query(F.data.startswith("admin_job:"))
-async def admin_job_menu(callback: CallbackQuery, state: FSMContext):
-    if not has_admin_access(callback.from_user.id):
+@callbacks.route("admin_job", args=(b36, int))
+async def admin_job_menu(callback: CallbackQuery, job_id: int, page: int, state: FSMContext, perms: Perm):
+    if not perms & Perm.ADMIN_ACCESS:
         return await callback.answer("Нет прав", show_alert=True)
-    _, city, idx = callback.data.split(":")
-    index = int(idx)
-    job = jobs_service.get_job(city, index)
-    await state.update_data(city=city, index=index)
+    job = jobs_service.get_job_by_id(job_id)
+    if job is None:
+        return await callback.answer("⚠ Вакансия не найдена", show_alert=True)
+    city_id = jobs_service.get_city_id(jobs_service.get_job_city(job_id))
+    await state.update_data(city_id=city_id, job_id=job_id)
     text = f"💼 {job['title']}\n\n{job['desc']}\n\n🔗 {job.get('url','-')}"
-    await callback.message.edit_text(text, reply_markup=Keyboards.admin_job_menu(city, index))
+    await callback.message.edit_text(text, reply_markup=Keyboards.admin_job_menu(job_id, city_id, page))
     await callback.answer()
 
-@router.callback_query(F.data.startswith("admin_city_rename:"))
-async def admin_city_rename_start(callback: CallbackQuery, state: FSMContext):
-    if not has_admin_access(callback.from_user.id):
+@callbacks.route("admin_city_rename", args=(b36,))
+async def admin_city_rename_start(callback: CallbackQuery, city_id: int, state: FSMContext, perms: Perm):
+    if not perms & Perm.ADMIN_ACCESS:
         return await callback.answer("Нет прав", show_alert=True)
-    city = callback.data.split(":")[1]
-    await state.update_data(city=city)
+    city = jobs_service.get_city_by_id(city_id)
+    if city is None:
+        return await callback.answer("⚠ Город не найден", show_alert=True)
+    await state.update_data(city_id=city_id)
     await state.set_state(AdminEdit.rename_city)
     await send_new_and_delete(callback, f"✏️ Введите новое название для города '{city}':", reply_markup=Keyboards.admin_back_to_city())
     await callback.answer()
 
 @router.message(AdminEdit.rename_city)
-async def admin_city_rename_finish(message: Message, state: FSMContext):
+async def admin_city_rename_finish(message: Message, state: FSMContext, perms: Perm):
     data = await state.get_data()
-    old_city = data.get("city")
+    old_city = jobs_service.get_city_by_id(data.get("city_id"))
     new_city = message.text.strip()
     if not new_city:
         return await message.answer("⚠ Название не может быть пустым")
-    ok = jobs_service.rename_city(old_city, new_city)
+    ok = old_city is not None and jobs_service.rename_city(old_city, new_city)
     await state.clear()
     if not ok:
         return await message.answer("⚠ Не удалось переименовать (возможно, новое имя уже существует)")
     await message.answer(
         "✅ Город переименован",
-        reply_markup=Keyboards.admin(
-            jobs_service.get_cities(),
-            can_manage_roles=(is_super_admin(message.from_user.id) or is_developer(message.from_user.id)),
-            can_manage_bot=is_developer(message.from_user.id)
+        reply_markup=keyboards_cache.admin(
+            can_manage_roles=bool(perms & Perm.MANAGE_ROLES),
+            can_manage_bot=bool(perms & Perm.DEVELOPER)
         )
     )
 
-@router.callback_query(F.data.startswith("admin_city_delete:"))
-async def admin_city_delete(callback: CallbackQuery, state: FSMContext):
-    if not has_admin_access(callback.from_user.id):
+@callbacks.route("admin_city_delete", args=(b36,))
+async def admin_city_delete(callback: CallbackQuery, city_id: int, state: FSMContext, perms: Perm):
+    if not perms & Perm.ADMIN_ACCESS:
         return await callback.answer("Нет прав", show_alert=True)
-    city = callback.data.split(":")[1]
-    ok = jobs_service.delete_city(city)
+    city = jobs_service.get_city_by_id(city_id)
+    ok = city is not None and jobs_service.delete_city(city)
     text = "✅ Город удалён" if ok else "⚠ Не удалось удалить город"
     await state.set_state(AddJob.city_choise)
     await callback.message.edit_text(
         text,
-        reply_markup=Keyboards.admin(
-            jobs_service.get_cities(),
-            can_manage_roles=(is_super_admin(callback.from_user.id) or is_developer(callback.from_user.id)),
-            can_manage_bot=is_developer(callback.from_user.id)
+        reply_markup=keyboards_cache.admin(
+            can_manage_roles=bool(perms & Perm.MANAGE_ROLES),
+            can_manage_bot=bool(perms & Perm.DEVELOPER)
         )
     )
     await callback.answer()
 
-@router.callback_query(F.data.startswith("admin_job_edit_title:"))
-async def admin_job_edit_title_start(callback: CallbackQuery, state: FSMContext):
-    if not has_admin_access(callback.from_user.id):
+async def admin_job_edit_start(callback: CallbackQuery, job_id: int, state: FSMContext, perms: Perm, next_state: State, prompt: str):
+    if not perms & Perm.ADMIN_ACCESS:
         return await callback.answer("Нет прав", show_alert=True)
-    _, city, idx = callback.data.split(":")
-    await state.update_data(city=city, index=int(idx))
-    await state.set_state(AdminEdit.edit_title)
-    await send_new_and_delete(callback, "✏️ Введите новое название работы:", reply_markup=Keyboards.admin_back_to_desc())
+    if jobs_service.get_job_by_id(job_id) is None:
+        return await callback.answer("⚠ Вакансия не найдена", show_alert=True)
+    await state.update_data(job_id=job_id)
+    await state.set_state(next_state)
+    await send_new_and_delete(callback, prompt, reply_markup=Keyboards.admin_back_to_desc())
     await callback.answer()
 
-@router.message(AdminEdit.edit_title)
-async def admin_job_edit_title_finish(message: Message, state: FSMContext):
+async def admin_job_edit_finish(message: Message, state: FSMContext, done_text: str, **fields):
     data = await state.get_data()
-    city = data["city"]
-    index = int(data["index"])
-    title = message.text.strip()
-    jobs_service.update_job(city, index, title=title)
+    job_id = data.get("job_id")
+    city = jobs_service.get_job_city(job_id)
+    ok = jobs_service.update_job_by_id(job_id, **fields)
     await state.clear()
-    await message.answer("✅ Название обновлено", reply_markup=Keyboards.admin_jobs(city, jobs_service.get_jobs(city)))
+    if not ok:
+        return await message.answer("⚠ Вакансия не найдена (возможно, её уже удалили)")
+    await message.answer(done_text, reply_markup=keyboards_cache.admin_jobs(city))
 
-@router.callback_query(F.data.startswith("admin_job_edit_desc:"))
-async def admin_job_edit_desc_start(callback: CallbackQuery, state: FSMContext):
-    if not has_admin_access(callback.from_user.id):
-        return await callback.answer("Нет прав", show_alert=True)
-    _, city, idx = callback.data.split(":")
-    await state.update_data(city=city, index=int(idx))
-    await state.set_state(AdminEdit.edit_desc)
-    await send_new_and_delete(callback, "📝 Введите новое описание:", reply_markup=Keyboards.admin_back_to_desc())
-    await callback.answer()
+@callbacks.route("admin_job_edit_title", args=(b36,))
+async def admin_job_edit_title_start(callback: CallbackQuery, job_id: int, state: FSMContext, perms: Perm):
+    await admin_job_edit_start(callback, job_id, state, perms, AdminEdit.edit_title, "✏️ Введите новое название работы:")
+
+@router.message(AdminEdit.edit_title)
+async def admin_job_edit_title_finish(message: Message, state: FSMContext):
+    await admin_job_edit_finish(message, state, "✅ Название обновлено", title=message.text.strip())
+
+@callbacks.route("admin_job_edit_desc", args=(b36,))
+async def admin_job_edit_desc_start(callback: CallbackQuery, job_id: int, state: FSMContext, perms: Perm):
+    await admin_job_edit_start(callback, job_id, state, perms, AdminEdit.edit_desc, "📝 Введите новое описание:")
 
 @router.message(AdminEdit.edit_desc)
 async def admin_job_edit_desc_finish(message: Message, state: FSMContext):
-    data = await state.get_data()
-    city = data["city"]
-    index = int(data["index"])
-    desc = message.text.strip()
-    jobs_service.update_job(city, index, desc=desc)
-    await state.clear()
-    await message.answer("✅ Описание обновлено", reply_markup=Keyboards.admin_jobs(city, jobs_service.get_jobs(city)))
+    await admin_job_edit_finish(message, state, "✅ Описание обновлено", desc=message.text.strip())
 
-@router.callback_query(F.data.startswith("admin_job_edit_url:"))
-async def admin_job_edit_url_start(callback: CallbackQuery, state: FSMContext):
-    if not has_admin_access(callback.from_user.id):
-        return await callback.answer("Нет прав", show_alert=True)
-    _, city, idx = callback.data.split(":")
-    await state.update_data(city=city, index=int(idx))
-    await state.set_state(AdminEdit.edit_url)
-    await send_new_and_delete(callback, "🔗 Введите новую ссылку (http/https):", reply_markup=Keyboards.admin_back_to_desc())
-    await callback.answer()
+@callbacks.route("admin_job_edit_url", args=(b36,))
+async def admin_job_edit_url_start(callback: CallbackQuery, job_id: int, state: FSMContext, perms: Perm):
+    await admin_job_edit_start(callback, job_id, state, perms, AdminEdit.edit_url, "🔗 Введите новую ссылку (http/https):")
 
 @router.message(AdminEdit.edit_url)
 async def admin_job_edit_url_finish(message: Message, state: FSMContext):
-    data = await state.get_data()
-    city = data["city"]
-    index = int(data["index"])
     url_text = message.text.strip()
     parsed = urlparse(url_text)
     if parsed.scheme not in ("http", "https") or not parsed.netloc:
         return await message.answer("⚠ Некорректная ссылка. Введите корректный URL, начинающийся с http:// или https://")
-    jobs_service.update_job(city, index, url=url_text)
-    await state.clear()
-    await message.answer("✅ Ссылка обновлена", reply_markup=Keyboards.admin_jobs(city, jobs_service.get_jobs(city)))
+    await admin_job_edit_finish(message, state, "✅ Ссылка обновлена", url=url_text)
 
-@router.callback_query(F.data.startswith("admin_job_delete:"))
-async def admin_job_delete(callback: CallbackQuery, state: FSMContext):
-    if not has_admin_access(callback.from_user.id):
+@callbacks.route("admin_job_delete", args=(b36,))
+async def admin_job_delete(callback: CallbackQuery, job_id: int, perms: Perm):
+    if not perms & Perm.ADMIN_ACCESS:
         return await callback.answer("Нет прав", show_alert=True)
-    _, city, idx = callback.data.split(":")
-    index = int(idx)
-    ok = jobs_service.delete_job(city, index)
-    vacancies = jobs_service.get_jobs(city)
+    city = jobs_service.get_job_city(job_id)
+    ok = city is not None and jobs_service.delete_job_by_id(job_id)
     text = "✅ Работа удалена" if ok else "⚠ Не удалось удалить работу"
-    await callback.message.edit_text(text, reply_markup=Keyboards.admin_jobs(city, vacancies))
+    if city is None:
+        await callback.message.edit_text(text, reply_markup=Keyboards.admin_back_to_city())
+    else:
+        await callback.message.edit_text(text, reply_markup=keyboards_cache.admin_jobs(city))
+    await callback.answer()
+
+# == Админ: выбор нескольких вакансий ==
+# В данных FSM: bulk_city — id города, bulk_ids — список отмеченных id, bulk_page — страница
+async def bulk_selection(state: FSMContext):
+    """(city, ids still in that city, page) of the current selection; city is None if it is stale."""
+    data = await state.get_data()
+    city = jobs_service.get_city_by_id(data.get("bulk_city"))
+    ids = [job_id for job_id in data.get("bulk_ids", []) if city is not None and jobs_service.get_job_city(job_id) == city]
+    return city, ids, data.get("bulk_page", 0)
+
+async def render_bulk(callback: CallbackQuery, city: str, selected: list, page: int):
+    total = jobs_service.count_jobs(city)
+    page = clamp_page(page, total)
+    items = jobs_service.get_job_items(city, page * PAGE_SIZE, PAGE_SIZE)
+    markup = Keyboards.bulk_select(jobs_service.get_city_id(city), items, set(selected), page, page_count(total))
+    await callback.message.edit_text(f"☑️ {city}: выбрано {len(selected)}\nОтметьте вакансии и выберите действие.", reply_markup=markup)
+
+async def bulk_done(callback: CallbackQuery, state: FSMContext, city: str, page: int, text: str):
+    await state.update_data(bulk_ids=[])
+    await callback.message.edit_text(text, reply_markup=keyboards_cache.admin_jobs(city, page))
+    await callback.answer()
+
+@callbacks.route("bulk", "open", args=(b36, int))
+async def bulk_open(callback: CallbackQuery, city_id: int, page: int, state: FSMContext, perms: Perm):
+    if not perms & Perm.ADMIN_ACCESS:
+        return await callback.answer("Нет прав", show_alert=True)
+    city = jobs_service.get_city_by_id(city_id)
+    if city is None:
+        return await callback.answer("⚠ Город не найден", show_alert=True)
+    data = await state.get_data()
+    # при листании выбор сохраняется, в другом городе начинается заново
+    selected = data.get("bulk_ids", []) if data.get("bulk_city") == city_id else []
+    await state.set_state(None)
+    await state.update_data(bulk_city=city_id, bulk_ids=selected, bulk_page=page)
+    await render_bulk(callback, city, selected, page)
+    await callback.answer()
+
+@callbacks.route("bulk", "t", args=(b36, int))
+async def bulk_toggle(callback: CallbackQuery, job_id: int, page: int, state: FSMContext, perms: Perm):
+    if not perms & Perm.ADMIN_ACCESS:
+        return await callback.answer("Нет прав", show_alert=True)
+    city, selected, _ = await bulk_selection(state)
+    if city is None:
+        return await callback.answer("⚠ Выбор устарел, откройте список заново", show_alert=True)
+    if job_id in selected:
+        selected.remove(job_id)
+    elif jobs_service.get_job_city(job_id) == city:
+        selected.append(job_id)
+    await state.update_data(bulk_ids=selected, bulk_page=page)
+    await render_bulk(callback, city, selected, page)
+    await callback.answer()
+
+@callbacks.route("bulk", "page", args=(int,))
+async def bulk_toggle_page(callback: CallbackQuery, page: int, state: FSMContext, perms: Perm):
+    if not perms & Perm.ADMIN_ACCESS:
+        return await callback.answer("Нет прав", show_alert=True)
+    city, selected, _ = await bulk_selection(state)
+    if city is None:
+        return await callback.answer("⚠ Выбор устарел, откройте список заново", show_alert=True)
+    on_page = [job_id for job_id, _ in jobs_service.get_job_items(city, page * PAGE_SIZE, PAGE_SIZE)]
+    chosen = set(selected)
+    if all(job_id in chosen for job_id in on_page):
+        # вся страница уже отмечена — повторное нажатие снимает отметки
+        selected = [job_id for job_id in selected if job_id not in set(on_page)]
+    else:
+        selected += [job_id for job_id in on_page if job_id not in chosen]
+    await state.update_data(bulk_ids=selected, bulk_page=page)
+    await render_bulk(callback, city, selected, page)
     await callback.answer()
 
-@router.callback_query(F.data.startswith("city:"))
-async def choose_city(callback: CallbackQuery):
-    city = callback.data.split(":")[1]
-    vacancies = jobs_service.get_jobs(city)
-    if not vacancies:
+@callbacks.route("bulk", "none", args=(int,))
+async def bulk_clear(callback: CallbackQuery, page: int, state: FSMContext, perms: Perm):
+    if not perms & Perm.ADMIN_ACCESS:
+        return await callback.answer("Нет прав", show_alert=True)
+    city, _, _ = await bulk_selection(state)
+    if city is None:
+        return await callback.answer("⚠ Выбор устарел, откройте список заново", show_alert=True)
+    await state.update_data(bulk_ids=[], bulk_page=page)
+    await render_bulk(callback, city, [], page)
+    await callback.answer()
+
+@callbacks.route("bulk", "delete")
+async def bulk_delete_confirm(callback: CallbackQuery, state: FSMContext, perms: Perm):
+    if not perms & Perm.ADMIN_ACCESS:
+        return await callback.answer("Нет прав", show_alert=True)
+    city, selected, page = await bulk_selection(state)
+    if not selected:
+        return await callback.answer("⚠ Ничего не выбрано", show_alert=True)
+    back = f"bulk:open:{encode_id(jobs_service.get_city_id(city))}:{page}"
+    await callback.message.edit_text(f"Удалить {len(selected)} вакансий из города {city}?",
+                                     reply_markup=Keyboards.bulk_confirm_delete(len(selected), back))
+    await callback.answer()
+
+@callbacks.route("bulk", "delete", "yes")
+async def bulk_delete(callback: CallbackQuery, state: FSMContext, perms: Perm):
+    if not perms & Perm.ADMIN_ACCESS:
+        return await callback.answer("Нет прав", show_alert=True)
+    city, selected, page = await bulk_selection(state)
+    if not selected:
+        return await callback.answer("⚠ Ничего не выбрано", show_alert=True)
+    deleted = jobs_service.delete_jobs(selected)
+    logger.info("Bulk delete in %s: %d vacancies", city, deleted)
+    await bulk_done(callback, state, city, page, f"✅ Удалено вакансий: {deleted}")
+
+@callbacks.route("bulk", "move", args=(int,))
+async def bulk_move_choose(callback: CallbackQuery, page: int, state: FSMContext, perms: Perm):
+    if not perms & Perm.ADMIN_ACCESS:
+        return await callback.answer("Нет прав", show_alert=True)
+    city, selected, selection_page = await bulk_selection(state)
+    if not selected:
+        return await callback.answer("⚠ Ничего не выбрано", show_alert=True)
+    total = jobs_service.count_cities()
+    page = clamp_page(page, total)
+    targets = [(cid, name) for cid, name in jobs_service.get_city_items(page * PAGE_SIZE, PAGE_SIZE) if name != city]
+    back = f"bulk:open:{encode_id(jobs_service.get_city_id(city))}:{selection_page}"
+    await callback.message.edit_text(f"📦 Куда перенести {len(selected)} вакансий из города {city}?",
+                                     reply_markup=Keyboards.bulk_move_targets(targets, back, page, page_count(total)))
+    await callback.answer()
+
+@callbacks.route("bulk", "move_to", args=(b36,))
+async def bulk_move(callback: CallbackQuery, city_id: int, state: FSMContext, perms: Perm):
+    if not perms & Perm.ADMIN_ACCESS:
+        return await callback.answer("Нет прав", show_alert=True)
+    city, selected, page = await bulk_selection(state)
+    target = jobs_service.get_city_by_id(city_id)
+    if not selected or target is None:
+        return await callback.answer("⚠ Выбор или город устарели", show_alert=True)
+    moved = jobs_service.move_jobs(selected, target)
+    logger.info("Bulk move %s -> %s: %d vacancies", city, target, moved)
+    await bulk_done(callback, state, city, page, f"✅ Перенесено в {target}: {moved}")
+
+@callbacks.route("bulk", "url")
+async def bulk_url_start(callback: CallbackQuery, state: FSMContext, perms: Perm):
+    if not perms & Perm.ADMIN_ACCESS:
+        return await callback.answer("Нет прав", show_alert=True)
+    city, selected, page = await bulk_selection(state)
+    if not selected:
+        return await callback.answer("⚠ Ничего не выбрано", show_alert=True)
+    await state.set_state(AdminEdit.bulk_url)
+    await send_new_and_delete(
+        callback,
+        f"🔗 Новая ссылка для {len(selected)} вакансий (http/https).\n"
+        "Или две строки через пробел — «что заменить» и «на что», например старый домен и новый.",
+        reply_markup=Keyboards.back(f"bulk:open:{encode_id(jobs_service.get_city_id(city))}:{page}", "⬅ Отмена"),
+    )
+    await callback.answer()
+
+@router.message(AdminEdit.bulk_url)
+async def bulk_url_finish(message: Message, state: FSMContext, perms: Perm):
+    if not perms & Perm.ADMIN_ACCESS:
+        await state.clear()
+        return await message.answer("⚠ У вас нет прав администратора.")
+    city, selected, page = await bulk_selection(state)
+    if not selected:
+        await state.clear()
+        return await message.answer("⚠ Выбранные вакансии уже удалены")
+    parts = (message.text or "").split()
+    if len(parts) == 1:
+        if not is_valid_http_url(parts[0]):
+            return await message.answer("⚠ Некорректная ссылка. Введите корректный URL, начинающийся с http:// или https://")
+        changes = {job_id: {"url": parts[0]} for job_id in selected}
+        skipped = 0
+    elif len(parts) == 2:
+        old, new = parts
+        changes, skipped = {}, 0
+        for job_id in selected:
+            url = jobs_service.get_job_by_id(job_id)["url"]
+            if old not in url:
+                continue
+            replaced = url.replace(old, new)
+            if is_valid_http_url(replaced):
+                changes[job_id] = {"url": replaced}
+            else:
+                skipped += 1
+    else:
+        return await message.answer("⚠ Нужна одна ссылка или две строки через пробел")
+    updated = jobs_service.update_jobs(changes)
+    logger.info("Bulk URL change in %s: %d vacancies", city, updated)
+    await state.clear()
+    text = f"✅ Ссылка обновлена у {updated} из {len(selected)} вакансий"
+    if skipped:
+        text += f"\n⚠ Пропущено {skipped}: после замены ссылка некорректна"
+    await message.answer(text, reply_markup=keyboards_cache.admin_jobs(city, page))
+
+async def show_city_jobs(callback: CallbackQuery, city: str, page: int = 0):
+    if not jobs_service.count_jobs(city):
         await callback.message.edit_text(
             f"📍 В городе {city} пока нет работ.",
             reply_markup=Keyboards.back("back:cities")
         )
     else:
         await callback.message.edit_text(f"📍 Город: {city}\nВыберите работу:",
-                                        reply_markup=Keyboards.jobs(city, vacancies))
+                                        reply_markup=keyboards_cache.jobs(city, page))
+
+@callbacks.route("city", args=(b36,))
+async def choose_city(callback: CallbackQuery, city_id: int):
+    city = jobs_service.get_city_by_id(city_id)
+    if city is None:
+        return await callback.answer("⚠ Город не найден", show_alert=True)
+    activity.emit("city", callback.from_user.id, city, city=city)
+    await show_city_jobs(callback, city)
     await callback.answer()
 
-@router.callback_query(F.data == "back:cities")
-async def back_cities(callback: CallbackQuery):
-    cities = jobs_service.get_cities()
-    if not cities:
-        await callback.message.edit_text("⚠ В базе пока нет городов.")
-    else:
-        await callback.message.edit_text("👋 Выберите город:", reply_markup=Keyboards.cities(cities))
+@callbacks.route("jobs", args=(b36, int))
+async def jobs_page(callback: CallbackQuery, city_id: int, page: int):
+    city = jobs_service.get_city_by_id(city_id)
+    if city is None:
+        return await callback.answer("⚠ Город не найден", show_alert=True)
+    await show_city_jobs(callback, city, page)
     await callback.answer()
 
-
-@router.callback_query(F.data.startswith("job:"))
-async def choose_job(callback: CallbackQuery):
-    _, city, index = callback.data.split(":")
-    index = int(index)
-    job = jobs_service.get_job(city, index)
+@callbacks.route("job", args=(b36, int))
+async def choose_job(callback: CallbackQuery, job_id: int, page: int):
+    job = jobs_service.get_job_by_id(job_id)
+    if job is None:
+        return await callback.answer("⚠ Вакансия не найдена", show_alert=True)
+    city = jobs_service.get_job_city(job_id)
+    city_id = jobs_service.get_city_id(city)
+    activity.emit("job", callback.from_user.id, job_id, job=job_id, city=city, title=job["title"])
     await callback.message.edit_text(f"💼 {job['title']}\n\n{job['desc']}",
-                                    reply_markup=Keyboards.job_detail(city, index, job["url"]))
+                                    reply_markup=Keyboards.job_detail(city_id, job["url"], page))
     await callback.answer()
 
+# ==Поиск==
+def render_search(query: str, page: int):
+    total = search_index.count(query)
+    if not total:
+        return f"🔎 По запросу «{query}» ничего не найдено", None
+    page = clamp_page(page, total)
+    _, items = search_index.page(query, page * PAGE_SIZE, PAGE_SIZE)
+    return f"🔎 «{query}»: найдено {total}", Keyboards.search_results(items, page, page_count(total))
+
+@router.message(Command("search"))
+async def search_cmd(message: Message, command: CommandObject, state: FSMContext):
+    query = (command.args or "").strip()
+    if not query:
+        return await message.answer("Напишите, что искать: /search курьер")
+    # запрос хранится в данных FSM: кнопки страниц несут только номер
+    await state.update_data(search_query=query)
+    activity.emit("search", message.from_user.id, query=query)
+    text, markup = render_search(query, 0)
+    await message.answer(text, reply_markup=markup)
+
+@callbacks.route("search", args=(int,))
+async def search_page(callback: CallbackQuery, page: int, state: FSMContext):
+    query = (await state.get_data()).get("search_query")
+    if not query:
+        return await callback.answer("⚠ Поиск устарел, повторите /search", show_alert=True)
+    text, markup = render_search(query, page)
+    await callback.message.edit_text(text, reply_markup=markup)
+    await callback.answer()
+
+# ==Инлайн-режим==
+@router.inline_query()
+async def inline_vacancies(inline_query: InlineQuery):
+    results, next_offset = inline_results.page(inline_query.query, inline_query.offset)
+    if not inline_query.offset:
+        activity.emit("inline", inline_query.from_user.id, query=inline_query.query)
+    # выдача одинакова для всех: Telegram может отдавать её из своего кэша любому пользователю
+    await inline_query.answer(results, cache_time=INLINE_CACHE_TIME, is_personal=False, next_offset=next_offset)
+
 # ==Навигация назад (пользователь)==
-@router.callback_query(F.data == "back:cities")
+@callbacks.route("back", "cities")
 async def back_to_cities(callback: CallbackQuery):
-    cities = jobs_service.get_cities()
-    if not cities:
+    if not jobs_service.count_cities():
         await callback.message.edit_text("⚠ В базе пока нет городов.")
     else:
-        await callback.message.edit_text("👋 Выберите город:", reply_markup=Keyboards.cities(cities))
+        await callback.message.edit_text("👋 Выберите город:", reply_markup=keyboards_cache.cities())
+    await callback.answer()
+
+@callbacks.route("cities", args=(int,))
+async def cities_page(callback: CallbackQuery, page: int):
+    await callback.message.edit_text("👋 Выберите город:", reply_markup=keyboards_cache.cities(page))
+    await callback.answer()
+
+@callbacks.route("back", "jobs", args=(b36, int))
+async def back_to_jobs(callback: CallbackQuery, city_id: int, page: int):
+    city = jobs_service.get_city_by_id(city_id)
+    if city is None:
+        return await back_to_cities(callback)
+    await show_city_jobs(callback, city, page)
     await callback.answer()
 
-@router.callback_query(F.data.startswith("back:jobs:"))
-async def back_to_jobs(callback: CallbackQuery):
-    _, _, city = callback.data.split(":")
-    vacancies = jobs_service.get_jobs(city)
-    await callback.message.edit_text(f"📍 Город: {city}\nВыберите работу:",
-                                    reply_markup=Keyboards.jobs(city, vacancies))
+@callbacks.route("noop")
+async def noop(callback: CallbackQuery):
     await callback.answer()
 
 
 #==Админка через FSM(не знаешь не лезь)==
 @router.message(F.text == "/addjob")
-async def cmd_addjob(message: Message, state: FSMContext):
-    if not has_admin_access(message.from_user.id):
+async def cmd_addjob(message: Message, state: FSMContext, perms: Perm):
+    if not perms & Perm.ADMIN_ACCESS:
         return await message.answer("⚠ У вас нет прав администратора.")
     await state.set_state(AddJob.city_choise)
     await message.answer(
         "📍 Выберите город или добавьте новый:",
-        reply_markup=Keyboards.admin(
-            jobs_service.get_cities(),
-            can_manage_roles=(is_super_admin(message.from_user.id) or is_developer(message.from_user.id)),
-            can_manage_bot=is_developer(message.from_user.id)
+        reply_markup=keyboards_cache.admin(
+            can_manage_roles=bool(perms & Perm.MANAGE_ROLES),
+            can_manage_bot=bool(perms & Perm.DEVELOPER)
         )
     )
 
-@router.callback_query(F.data.startswith("admin_city:"))
-async def fsm_city(callback: CallbackQuery, state: FSMContext):
-    city = callback.data.split(":")[1]
-    if city == "new":
-        await callback.message.answer(
-            "✍ Введите название нового города:",
-            reply_markup=Keyboards.admin_back_to_city()
+@callbacks.route("admin_cities", args=(int,))
+async def admin_cities_page(callback: CallbackQuery, page: int, perms: Perm):
+    if not perms & Perm.ADMIN_ACCESS:
+        return await callback.answer("Нет прав", show_alert=True)
+    await callback.message.edit_text(
+        "📍 Выберите город или добавьте новый:",
+        reply_markup=keyboards_cache.admin(
+            can_manage_roles=bool(perms & Perm.MANAGE_ROLES),
+            can_manage_bot=bool(perms & Perm.DEVELOPER),
+            page=page
         )
-        try:
-            await callback.message.delete()
-        except TelegramBadRequest:
-            pass
-        await state.set_state(AddJob.new_city_name)
-    else:
-        await state.update_data(city=city)
-        await callback.message.answer(f"Выбран город: {city}")
-        await state.set_state(AddJob.title)
-        await callback.message.answer("Введите название работы:", reply_markup=Keyboards.admin_back_to_city())
-        try:
-            await callback.message.delete()
-        except TelegramBadRequest:
-            pass
-    await callback.answer()    
+    )
+    await callback.answer()
+
+@callbacks.route("admin_city_new")
+async def fsm_new_city(callback: CallbackQuery, state: FSMContext):
+    await callback.message.answer(
+        "✍ Введите название нового города:",
+        reply_markup=Keyboards.admin_back_to_city()
+    )
+    try:
+        await callback.message.delete()
+    except TelegramBadRequest:
+        pass
+    await state.set_state(AddJob.new_city_name)
+    await callback.answer()
+
+@callbacks.route("admin_city", args=(b36,))
+async def fsm_city(callback: CallbackQuery, city_id: int, state: FSMContext):
+    city = jobs_service.get_city_by_id(city_id)
+    if city is None:
+        return await callback.answer("⚠ Город не найден", show_alert=True)
+    await state.update_data(city_id=city_id)
+    await callback.message.answer(f"Выбран город: {city}")
+    await state.set_state(AddJob.title)
+    await callback.message.answer("Введите название работы:", reply_markup=Keyboards.admin_back_to_city())
+    try:
+        await callback.message.delete()
+    except TelegramBadRequest:
+        pass
+    await callback.answer()
 
 @router.message(AddJob.new_city_name)
 async def fsm_new_city_name(message: Message, state: FSMContext):
     city = message.text.strip()
-    jobs_service.add_city(city)
-    await state.update_data(city=city)
+    city_id = jobs_service.add_city(city)
+    await state.update_data(city_id=city_id)
     await message.answer(f"✅ Новый город '{city}' добавлен.")
     await state.set_state(AddJob.title)
     await message.answer("Введите название работы:", reply_markup=Keyboards.admin_back_to_city())
@@ -400,36 +651,141 @@ async def fsm_url(message: Message, state: FSMContext):
         return
 
     data = await state.get_data()
-    city = data["city"]
+    city = jobs_service.get_city_by_id(data.get("city_id"))
+    if city is None:
+        await state.clear()
+        return await message.answer("⚠ Город был удалён, вакансия не добавлена")
     title = data["title"]
     desc = data["desc"]
     jobs_service.add_job(city, title, desc, url_text)
     await state.clear()
     await message.answer(f"✅ Вакансия добавлена!\n📍 {city}\n💼 {title}\n📝 {desc}\n🔗 {url_text}")
 
+# ==Импорт / экспорт каталога==
+IMPORT_HINT = (
+    "📥 Пришлите файл .csv с колонками city, title, desc, url "
+    "или .jsonl — по объекту {\"city\", \"title\", \"desc\", \"url\"} в строке.\n"
+    "Строки с ошибками пропускаются, отчёт придёт файлом."
+)
+
+@router.message(Command("import"))
+async def import_cmd(message: Message, state: FSMContext, perms: Perm):
+    if not perms & Perm.ADMIN_ACCESS:
+        return await message.answer("⚠ У вас нет прав администратора.")
+    await state.set_state(CatalogImport.file)
+    await message.answer(IMPORT_HINT, reply_markup=Keyboards.admin_back_to_city())
+
+@callbacks.route("admin_import")
+async def import_start(callback: CallbackQuery, state: FSMContext, perms: Perm):
+    if not perms & Perm.ADMIN_ACCESS:
+        return await callback.answer("Нет прав", show_alert=True)
+    await state.set_state(CatalogImport.file)
+    await callback.message.edit_text(IMPORT_HINT, reply_markup=Keyboards.admin_back_to_city())
+    await callback.answer()
+
+@router.message(CatalogImport.file, F.document)
+async def import_file(message: Message, state: FSMContext, perms: Perm):
+    if not perms & Perm.ADMIN_ACCESS:
+        await state.clear()
+        return await message.answer("⚠ У вас нет прав администратора.")
+    document = message.document
+    fmt = detect_format(document.file_name)
+    if fmt is None:
+        return await message.answer("⚠ Нужен файл .csv или .jsonl")
+    if document.file_size and document.file_size > IMPORT_MAX_BYTES:
+        return await message.answer(f"⚠ Файл больше {IMPORT_MAX_BYTES // (1024 * 1024)} МБ")
+    await state.clear()
+    # что уже есть в каталоге — повторная загрузка того же файла ничего не задвоит
+    existing = {(city, job["title"], job["url"]) for city, vacancies in jobs_service.jobs.items() for job in vacancies}
+    fd, path = tempfile.mkstemp(prefix="import-", suffix=f".{fmt}")
+    os.close(fd)
+    try:
+        await message.bot.download(document, destination=path)
+        result = await asyncio.to_thread(parse_import, path, fmt, existing)
+    except Exception as e:
+        logger.exception("Import of %s failed: %s", document.file_name, e)
+        return await message.answer("⚠ Не удалось прочитать файл")
+    finally:
+        os.unlink(path)
+    # одна пачка: одна транзакция / одна запись файла, один сброс кэшей
+    try:
+        jobs_service.add_jobs(result.items)
+    except Exception as e:
+        # add_jobs откатывает каталог в памяти — ничего из файла не добавлено
+        logger.exception("Import of %s was not applied: %s", document.file_name, e)
+        return await message.answer("⚠ Не удалось сохранить вакансии, импорт не применён. Попробуйте ещё раз.")
+    logger.info("Imported %s: added=%d duplicates=%d errors=%d",
+                document.file_name, len(result.items), result.duplicates, result.failed)
+    await message.answer(
+        f"✅ Импорт завершён\n"
+        f"Добавлено вакансий: {len(result.items)}\n"
+        f"Пропущено дубликатов: {result.duplicates}\n"
+        f"Строк с ошибками: {result.failed}"
+    )
+    if result.errors:
+        caption = "Ошибки по строкам"
+        if result.failed > len(result.errors):
+            caption += f" (первые {len(result.errors)})"
+        await message.answer_document(BufferedInputFile(error_report(result.errors), filename="import-errors.csv"), caption=caption)
+
+@router.message(CatalogImport.file)
+async def import_not_document(message: Message):
+    await message.answer(IMPORT_HINT, reply_markup=Keyboards.admin_back_to_city())
+
+async def send_export(message: Message, fmt: str):
+    # вакансии копируются сразу: файл пишется в потоке, пока хендлеры правят каталог
+    # (update_job меняет словари вакансий на месте)
+    catalog = [(city, [dict(job) for job in vacancies]) for city, vacancies in jobs_service.jobs.items()]
+    fd, path = tempfile.mkstemp(prefix="export-", suffix=f".{fmt}")
+    os.close(fd)
+    try:
+        count = await asyncio.to_thread(write_export, path, catalog, fmt)
+        filename = f"catalog-{time.strftime('%Y%m%d-%H%M')}.{fmt}"
+        await message.answer_document(FSInputFile(path, filename=filename), caption=f"📤 Вакансий: {count}")
+    finally:
+        os.unlink(path)
+
+@router.message(Command("export"))
+async def export_cmd(message: Message, command: CommandObject, perms: Perm):
+    if not perms & Perm.ADMIN_ACCESS:
+        return await message.answer("⚠ У вас нет прав администратора.")
+    fmt = (command.args or "csv").strip().lower()
+    if fmt not in ("csv", "jsonl"):
+        return await message.answer("Формат: /export csv или /export jsonl")
+    await send_export(message, fmt)
+
+@callbacks.route("admin_export", args=(str,))
+async def export_button(callback: CallbackQuery, fmt: str, perms: Perm):
+    if not perms & Perm.ADMIN_ACCESS:
+        return await callback.answer("Нет прав", show_alert=True)
+    if fmt not in ("csv", "jsonl"):
+        return await callback.answer("⚠ Неизвестный формат", show_alert=True)
+    await callback.answer("Готовлю файл…")
+    await send_export(callback.message, fmt)
+
+
 # === Управление ролями ===
-@router.callback_query(F.data == "roles_menu")
-async def open_roles_menu(callback: CallbackQuery):
+@callbacks.route("roles_menu")
+async def open_roles_menu(callback: CallbackQuery, perms: Perm):
     uid = callback.from_user.id
-    if not (is_super_admin(uid) or is_developer(uid)):
+    if not perms & Perm.MANAGE_ROLES:
         logger.warning("open_roles_menu: no permissions uid=%d", uid)
         return await callback.answer("Нет прав", show_alert=True)
     await callback.message.edit_text(
         "👤 Управление ролями",
-        reply_markup=Keyboards.roles_menu(is_dev=is_developer(uid))
+        reply_markup=Keyboards.roles_menu(is_dev=bool(perms & Perm.DEVELOPER))
     )
     logger.debug("open_roles_menu shown to uid=%d", uid)
     await callback.answer()
 
-@router.callback_query(F.data.startswith("role:"))
-async def role_action_start(callback: CallbackQuery, state: FSMContext):
-    action = callback.data.split(":")[1]
+@callbacks.route("role", args=(str,))
+async def role_action_start(callback: CallbackQuery, action: str, state: FSMContext, perms: Perm):
     uid = callback.from_user.id
     if action in ("add_admin", "remove_admin"):
-        if not (is_super_admin(uid) or is_developer(uid)):
+        if not perms & Perm.MANAGE_ROLES:
             return await callback.answer("Нет прав", show_alert=True)
     elif action in ("add_sadmin", "remove_sadmin"):
-        if not is_developer(uid):
+        if not perms & Perm.DEVELOPER:
             return await callback.answer("Нет прав", show_alert=True)
 
     mapping = {
@@ -438,6 +794,8 @@ async def role_action_start(callback: CallbackQuery, state: FSMContext):
         "add_sadmin": (RolesEdit.add_sadmin, "Введите @username или user_id для добавления в Супер Админы:"),
         "remove_sadmin": (RolesEdit.remove_sadmin, "Введите @username или user_id для удаления из Супер Админов:"),
     }
+    if action not in mapping:
+        return await callback.answer("Неизвестное действие", show_alert=True)
     state_to_set, prompt = mapping[action]
     await state.set_state(state_to_set)
     await send_new_and_delete(callback, f"{prompt}", reply_markup=Keyboards.admin_back_to_city())
@@ -445,10 +803,10 @@ async def role_action_start(callback: CallbackQuery, state: FSMContext):
 
 
 # == Список администраторов ==
-@router.callback_query(F.data == "roles:list_admins")
-async def list_admins(callback: CallbackQuery):
+@callbacks.route("roles", "list_admins")
+async def list_admins(callback: CallbackQuery, perms: Perm):
     uid = callback.from_user.id
-    if not (is_super_admin(uid) or is_developer(uid)):
+    if not perms & Perm.MANAGE_ROLES:
         logger.warning("list_admins: no permissions uid=%d", uid)
         return await callback.answer("Нет прав", show_alert=True)
     roles = jobs_service.roles
@@ -457,16 +815,18 @@ async def list_admins(callback: CallbackQuery):
         uid, len(roles.get("admins", [])), len(roles.get("super_admins", [])), len(roles.get("developers", []))
     )
     text = "👥 Выберите пользователя для управления ролями"
-    all_ids = set(roles.get("admins", [])) | set(roles.get("super_admins", [])) | set(roles.get("developers", []))
+    all_ids = sorted(roles["admins"] | roles["super_admins"] | roles["developers"])
+    names = await profiles.display_names(callback.message.bot, all_ids)
     buttons = []
-    for tid in sorted(all_ids):
-        name = await display_name(callback.message.bot, tid)
+    for tid in all_ids:
+        name = names[tid]
+        target = jobs_service.permissions(tid)
         tags = []
-        if tid in roles.get("admins", []):
+        if target & Perm.ADMIN:
             tags.append("Админ")
-        if tid in roles.get("super_admins", []):
+        if target & Perm.SUPER_ADMIN:
             tags.append("Супер-Админ")
-        if tid in roles.get("developers", []):
+        if target & Perm.DEVELOPER:
             tags.append("Разработчик")
         tag_str = ",".join(tags)
         label = f"{name} — {tag_str}" if tag_str else name
@@ -477,48 +837,46 @@ async def list_admins(callback: CallbackQuery):
     await callback.answer()
 
 
-@router.callback_query(F.data.startswith("roles:manage_user:"))
-async def manage_user(callback: CallbackQuery):
+@callbacks.route("roles", "manage_user", args=(int,))
+async def manage_user(callback: CallbackQuery, target_id: int, perms: Perm):
     actor = callback.from_user.id
-    if not (is_super_admin(actor) or is_developer(actor)):
+    if not perms & Perm.MANAGE_ROLES:
         logger.warning("manage_user: no permissions actor=%d data=%s", actor, callback.data)
         return await callback.answer("Нет прав", show_alert=True)
-    target_id = int(callback.data.split(":")[2])
     logger.debug("manage_user: actor=%d target=%d", actor, target_id)
-    await render_manage_user(callback.message, actor, target_id)
+    await render_manage_user(callback.message, actor, perms, target_id)
     await callback.answer()
 
 
-@router.callback_query(F.data.startswith("roles:toggle:"))
-async def toggle_role(callback: CallbackQuery):
+@callbacks.route("roles", "toggle", args=(str, int))
+async def toggle_role(callback: CallbackQuery, role: str, target_id: int, perms: Perm):
     actor = callback.from_user.id
-    _, _, role, uid_str = callback.data.split(":")
-    target_id = int(uid_str)
+    target = jobs_service.permissions(target_id)
     if role == "admin":
-        if not (is_super_admin(actor) or is_developer(actor)):
+        if not perms & Perm.MANAGE_ROLES:
             logger.warning("toggle_role: deny actor=%d role=%s target=%d", actor, role, target_id)
             return await callback.answer("Нет прав", show_alert=True)
-        if jobs_service.is_admin(target_id):
+        if target & Perm.ADMIN:
             jobs_service.remove_admin(target_id)
             logger.info("toggle_role: removed admin actor=%d target=%d", actor, target_id)
         else:
             jobs_service.add_admin(target_id)
             logger.info("toggle_role: added admin actor=%d target=%d", actor, target_id)
     elif role == "sadmin":
-        if not is_developer(actor):
+        if not perms & Perm.DEVELOPER:
             logger.warning("toggle_role: deny actor=%d role=%s target=%d", actor, role, target_id)
             return await callback.answer("Нет прав", show_alert=True)
-        if jobs_service.is_super_admin(target_id):
+        if target & Perm.SUPER_ADMIN:
             jobs_service.remove_super_admin(target_id)
             logger.info("toggle_role: removed sadmin actor=%d target=%d", actor, target_id)
         else:
             jobs_service.add_super_admin(target_id)
             logger.info("toggle_role: added sadmin actor=%d target=%d", actor, target_id)
     elif role == "dev":
-        if not is_developer(actor):
+        if not perms & Perm.DEVELOPER:
             logger.warning("toggle_role: deny actor=%d role=%s target=%d", actor, role, target_id)
             return await callback.answer("Нет прав", show_alert=True)
-        if jobs_service.is_developer(target_id):
+        if target & Perm.DEVELOPER:
             jobs_service.remove_developer(target_id)
             logger.info("toggle_role: removed dev actor=%d target=%d", actor, target_id)
         else:
@@ -528,36 +886,38 @@ async def toggle_role(callback: CallbackQuery):
         logger.error("toggle_role: unknown role=%s by actor=%d data=%s", role, actor, callback.data)
         return await callback.answer("Неизвестная роль", show_alert=True)
 
-    await render_manage_user(callback.message, actor, target_id)
+    # актор мог поменять роли самому себе — берём актуальную маску
+    await render_manage_user(callback.message, actor, jobs_service.permissions(actor), target_id)
     await callback.answer()
 
 
-async def render_manage_user(message: Message, actor: int, target_id: int):
+async def render_manage_user(message: Message, actor: int, perms: Perm, target_id: int):
     logger.debug("render_manage_user: actor=%d target=%d", actor, target_id)
     name = await display_name(message.bot, target_id)
+    target = jobs_service.permissions(target_id)
     tags = []
-    if jobs_service.is_admin(target_id):
+    if target & Perm.ADMIN:
         tags.append("Админ")
-    if jobs_service.is_super_admin(target_id):
+    if target & Perm.SUPER_ADMIN:
         tags.append("Супер Админ")
-    if jobs_service.is_developer(target_id):
+    if target & Perm.DEVELOPER:
         tags.append("Разработчик")
     info = ", ".join(tags) if tags else "без ролей"
     text = f"👤 {name}\nТекущие роли: {info}"
 
     kb_rows = []
-    if is_super_admin(actor) or is_developer(actor):
-        if jobs_service.is_admin(target_id):
+    if perms & Perm.MANAGE_ROLES:
+        if target & Perm.ADMIN:
             kb_rows.append([InlineKeyboardButton(text="➖ Удалить из Админов", callback_data=f"roles:toggle:admin:{target_id}")])
         else:
             kb_rows.append([InlineKeyboardButton(text="➕ Добавить в Админы", callback_data=f"roles:toggle:admin:{target_id}")])
 
-    if is_developer(actor):
-        if jobs_service.is_super_admin(target_id):
+    if perms & Perm.DEVELOPER:
+        if target & Perm.SUPER_ADMIN:
             kb_rows.append([InlineKeyboardButton(text="➖ Удалить из Супер Админов", callback_data=f"roles:toggle:sadmin:{target_id}")])
         else:
             kb_rows.append([InlineKeyboardButton(text="➕ Добавить в Супер Админы", callback_data=f"roles:toggle:sadmin:{target_id}")])
-        if jobs_service.is_developer(target_id):
+        if target & Perm.DEVELOPER:
             kb_rows.append([InlineKeyboardButton(text="➖ Удалить из Разработчиков", callback_data=f"roles:toggle:dev:{target_id}")])
         else:
             kb_rows.append([InlineKeyboardButton(text="➕ Добавить в Разработчики", callback_data=f"roles:toggle:dev:{target_id}")])
@@ -565,8 +925,8 @@ async def render_manage_user(message: Message, actor: int, target_id: int):
     await message.edit_text(text, reply_markup=InlineKeyboardMarkup(inline_keyboard=kb_rows))
 
 @router.message(RolesEdit.add_admin)
-async def add_admin_finish(message: Message, state: FSMContext):
-    if not (is_super_admin(message.from_user.id) or is_developer(message.from_user.id)):
+async def add_admin_finish(message: Message, state: FSMContext, perms: Perm):
+    if not perms & Perm.MANAGE_ROLES:
         return await message.answer("Нет прав")
     uid = await resolve_to_user_id(message.text, message.bot)
     if uid is None:
@@ -575,16 +935,15 @@ async def add_admin_finish(message: Message, state: FSMContext):
     await state.clear()
     await message.answer(
         "✅ Администратор добавлен",
-        reply_markup=Keyboards.admin(
-            jobs_service.get_cities(),
-            can_manage_roles=(is_super_admin(message.from_user.id) or is_developer(message.from_user.id)),
-            can_manage_bot=is_developer(message.from_user.id)
+        reply_markup=keyboards_cache.admin(
+            can_manage_roles=bool(perms & Perm.MANAGE_ROLES),
+            can_manage_bot=bool(perms & Perm.DEVELOPER)
         )
     )
 
 @router.message(RolesEdit.remove_admin)
-async def remove_admin_finish(message: Message, state: FSMContext):
-    if not (is_super_admin(message.from_user.id) or is_developer(message.from_user.id)):
+async def remove_admin_finish(message: Message, state: FSMContext, perms: Perm):
+    if not perms & Perm.MANAGE_ROLES:
         return await message.answer("Нет прав")
     uid = await resolve_to_user_id(message.text, message.bot)
     if uid is None:
@@ -593,16 +952,15 @@ async def remove_admin_finish(message: Message, state: FSMContext):
     await state.clear()
     await message.answer(
         "✅ Администратор удалён",
-        reply_markup=Keyboards.admin(
-            jobs_service.get_cities(),
-            can_manage_roles=(is_super_admin(message.from_user.id) or is_developer(message.from_user.id)),
-            can_manage_bot=is_developer(message.from_user.id)
+        reply_markup=keyboards_cache.admin(
+            can_manage_roles=bool(perms & Perm.MANAGE_ROLES),
+            can_manage_bot=bool(perms & Perm.DEVELOPER)
         )
     )
 
 @router.message(RolesEdit.add_sadmin)
-async def add_sadmin_finish(message: Message, state: FSMContext):
-    if not is_developer(message.from_user.id):
+async def add_sadmin_finish(message: Message, state: FSMContext, perms: Perm):
+    if not perms & Perm.DEVELOPER:
         return await message.answer("Нет прав")
     uid = await resolve_to_user_id(message.text, message.bot)
     if uid is None:
@@ -611,16 +969,15 @@ async def add_sadmin_finish(message: Message, state: FSMContext):
     await state.clear()
     await message.answer(
         "✅ Супер администратор добавлен",
-        reply_markup=Keyboards.admin(
-            jobs_service.get_cities(),
-            can_manage_roles=(is_super_admin(message.from_user.id) or is_developer(message.from_user.id)),
-            can_manage_bot=is_developer(message.from_user.id)
+        reply_markup=keyboards_cache.admin(
+            can_manage_roles=bool(perms & Perm.MANAGE_ROLES),
+            can_manage_bot=bool(perms & Perm.DEVELOPER)
         )
     )
 
 @router.message(RolesEdit.remove_sadmin)
-async def remove_sadmin_finish(message: Message, state: FSMContext):
-    if not is_developer(message.from_user.id):
+async def remove_sadmin_finish(message: Message, state: FSMContext, perms: Perm):
+    if not perms & Perm.DEVELOPER:
         return await message.answer("Нет прав")
     uid = await resolve_to_user_id(message.text, message.bot)
     if uid is None:
@@ -629,87 +986,132 @@ async def remove_sadmin_finish(message: Message, state: FSMContext):
     await state.clear()
     await message.answer(
         "✅ Супер администратор удалён",
-        reply_markup=Keyboards.admin(
-            jobs_service.get_cities(),
-            can_manage_roles=(is_super_admin(message.from_user.id) or is_developer(message.from_user.id)),
-            can_manage_bot=is_developer(message.from_user.id)
+        reply_markup=keyboards_cache.admin(
+            can_manage_roles=bool(perms & Perm.MANAGE_ROLES),
+            can_manage_bot=bool(perms & Perm.DEVELOPER)
         )
     )
 
 # === Управление ботом (только разработчик) ===
-@router.callback_query(F.data == "dev_menu")
-async def dev_menu(callback: CallbackQuery):
-    if not is_developer(callback.from_user.id):
+@callbacks.route("dev_menu")
+async def dev_menu(
+    callback: CallbackQuery, perms: Perm,
+    scheduler: UpdateScheduler | None = None, outbound: OutboundScheduler | None = None,
+):
+    if not perms & Perm.DEVELOPER:
+        return await callback.answer("Нет прав", show_alert=True)
+    text = "🛠 Управление ботом"
+    if scheduler is not None:
+        st = scheduler.stats()
+        text += (
+            f"\n\nОчередь апдейтов: {st['backlog']} (макс. {st['max_backlog']}), в работе: {st['running']}, чатов: {st['chats']}"
+            f"\nОжидание: ср. {st['avg_wait_ms']} мс, макс. {st['max_wait_ms']} мс"
+            f"\nОбработано: {st['completed']}, ошибок: {st['failed']}, отброшено: {st['dropped']}"
+        )
+    if outbound is not None:
+        st = outbound.stats()
+        text += (
+            f"\n\nВызовов API: {st['calls']}, ошибок: {st['errors']}, RetryAfter: {st['retry_after']}"
+            f"\nПридержано: {st['paced']} (ср. {st['avg_wait_ms']} мс, макс. {st['max_wait_ms']} мс), ждут сейчас: {st['waiting']}"
+        )
+    text += "\n\n" + metrics.summary(limit=3)
+    await callback.message.edit_text(text, reply_markup=Keyboards.dev_controls())
+    await callback.answer()
+
+@callbacks.route("dev", "stats")
+async def dev_stats(callback: CallbackQuery, perms: Perm):
+    if not perms & Perm.DEVELOPER:
         return await callback.answer("Нет прав", show_alert=True)
-    await callback.message.edit_text("🛠 Управление ботом", reply_markup=Keyboards.dev_controls())
+    # в режиме шардов — вместе со счётчиками остальных шардов
+    await activity.load_peers()
+    lines = [
+        "📊 Активность за 24 ч" + (f" (шарды: {activity.shards} из {len(activity.peer_paths) + 1})" if activity.peer_paths else ""),
+        f"/start: {activity.count('start')}, городов открыто: {activity.count('city')}, вакансий: {activity.count('job')}",
+        "",
+        "Вакансии по часам:",
+    ]
+    lines += [f"  {time.strftime('%H:00', time.localtime(hour))} — {n}" for hour, n in activity.hourly("job")]
+    top_cities = activity.top("city")
+    if top_cities:
+        lines += ["", "Топ городов:"] + [f"  {i}. {city} — {n}" for i, (city, n) in enumerate(top_cities, 1)]
+    top_jobs = activity.top("job")
+    if top_jobs:
+        lines += ["", "Топ вакансий:"]
+        for i, (job_id, n) in enumerate(top_jobs, 1):
+            job = jobs_service.get_job_by_id(job_id)
+            title = f"{job['title']} ({jobs_service.get_job_city(job_id)})" if job is not None else f"#{job_id} (удалена)"
+            lines.append(f"  {i}. {title} — {n}")
+    st = activity.total_stats()
+    lines += ["", f"Событий с запуска: {st['emitted']}, записано: {st['written']}, потеряно: {st['dropped']}"]
+    await callback.message.edit_text("\n".join(lines), reply_markup=Keyboards.back("dev_menu"))
     await callback.answer()
 
-@router.callback_query(F.data == "dev:restart")
-async def dev_restart(callback: CallbackQuery):
-    if not is_developer(callback.from_user.id):
+@callbacks.route("dev", "restart")
+async def dev_restart(callback: CallbackQuery, perms: Perm, lifecycle: Lifecycle):
+    if not perms & Perm.DEVELOPER:
         return await callback.answer("Нет прав", show_alert=True)
     await callback.message.answer("🔄 Перезапуск бота...")
     await callback.answer()
-    try:
-        os.execl(sys.executable, sys.executable, *sys.argv)
-    except Exception:
-        os._exit(0)
+    # сам перезапуск — после того, как очередь апдейтов обработана и всё записано
+    lifecycle.request("restart")
 
-@router.callback_query(F.data == "dev:stop")
-async def dev_stop(callback: CallbackQuery):
-    if not is_developer(callback.from_user.id):
+@callbacks.route("dev", "stop")
+async def dev_stop(callback: CallbackQuery, perms: Perm, lifecycle: Lifecycle):
+    if not perms & Perm.DEVELOPER:
         return await callback.answer("Нет прав", show_alert=True)
     await callback.message.answer("⏹ Остановка бота...")
     await callback.answer()
-    os._exit(0)
+    lifecycle.request("stop")
 
 # === Логи и уровни логирования (только разработчик) ===
-@router.callback_query(F.data == "dev:logs_tail")
-async def dev_logs_tail(callback: CallbackQuery):
-    if not is_developer(callback.from_user.id):
+@callbacks.route("dev", "logs_tail", args=(int,))
+async def dev_logs_tail(callback: CallbackQuery, skip: int, perms: Perm):
+    """Tail page ending `skip` lines before the end of the log (rotated files included)."""
+    if not perms & Perm.DEVELOPER:
         return await callback.answer("Нет прав", show_alert=True)
-    log_path = os.path.join(os.path.dirname(__file__), "logs", "bot.log")
-    if not os.path.exists(log_path):
+    if not os.path.exists(LOG_PATH):
         return await callback.answer("Файл логов ещё не создан", show_alert=True)
     try:
-        with open(log_path, "r", encoding="utf-8", errors="ignore") as f:
-            lines = f.readlines()
-        tail = "".join(lines[-200:])
-        if len(tail) > 3500:
-            tail = tail[-3500:]
-        text = "Последние строки логов:\n" + ("```\n" + tail + "\n```")
-        await callback.message.edit_text(text, reply_markup=Keyboards.dev_controls(), parse_mode="Markdown")
+        lines, has_more = await asyncio.to_thread(logtail.tail, LOG_PATH, skip, 200, 3500)
+        tail = "\n".join(lines)
+        title = "Последние строки логов:" if skip == 0 else f"Строки логов (пропущено последних: {skip}):"
+        text = title + "\n" + ("```\n" + tail + "\n```")
+        await callback.message.edit_text(
+            text,
+            reply_markup=Keyboards.log_tail_nav(skip, skip + len(lines) if has_more else None),
+            parse_mode="Markdown"
+        )
+        await callback.answer()
     except Exception as e:
         logger.exception("Failed to read logs: %s", e)
         await callback.answer("Не удалось прочитать логи", show_alert=True)
 
-@router.callback_query(F.data == "dev:logs_download")
-async def dev_logs_download(callback: CallbackQuery):
-    if not is_developer(callback.from_user.id):
+@callbacks.route("dev", "logs_download")
+async def dev_logs_download(callback: CallbackQuery, perms: Perm):
+    if not perms & Perm.DEVELOPER:
         return await callback.answer("Нет прав", show_alert=True)
-    log_path = os.path.join(os.path.dirname(__file__), "logs", "bot.log")
-    if not os.path.exists(log_path):
+    if not os.path.exists(LOG_PATH):
         return await callback.answer("Файл логов ещё не создан", show_alert=True)
     try:
-        await callback.message.answer_document(FSInputFile(log_path), caption="Файл логов")
+        await callback.message.answer_document(FSInputFile(LOG_PATH), caption="Файл логов")
         await callback.answer()
     except Exception as e:
         logger.exception("Failed to send log file: %s", e)
         await callback.answer("Не удалось отправить файл логов", show_alert=True)
 
-@router.callback_query(F.data == "dev:loglevel")
-async def dev_loglevel(callback: CallbackQuery):
-    if not is_developer(callback.from_user.id):
+@callbacks.route("dev", "loglevel")
+async def dev_loglevel(callback: CallbackQuery, perms: Perm):
+    if not perms & Perm.DEVELOPER:
         return await callback.answer("Нет прав", show_alert=True)
     current_level = logging.getLevelName(logging.getLogger().level)
     await callback.message.edit_text(f"Текущий уровень логирования: {current_level}", reply_markup=Keyboards.log_levels(current_level))
     await callback.answer()
 
-@router.callback_query(F.data.startswith("dev:loglevel:set:"))
-async def dev_set_loglevel(callback: CallbackQuery):
-    if not is_developer(callback.from_user.id):
+@callbacks.route("dev", "loglevel", "set", args=(str,))
+async def dev_set_loglevel(callback: CallbackQuery, level_name: str, perms: Perm):
+    if not perms & Perm.DEVELOPER:
         return await callback.answer("Нет прав", show_alert=True)
-    level_name = callback.data.split(":")[-1].upper()
+    level_name = level_name.upper()
     if level_name not in ("DEBUG", "INFO", "WARNING", "ERROR", "CRITICAL"):
         return await callback.answer("Неизвестный уровень", show_alert=True)
     lvl = getattr(logging, level_name)
@@ -721,16 +1123,15 @@ async def dev_set_loglevel(callback: CallbackQuery):
     await callback.answer()
 
 # ==Навигация назад (админ FSM)==
-@router.callback_query(F.data == "admin_back_to_city")
-async def admin_back_city(callback: CallbackQuery, state: FSMContext):
+@callbacks.route("admin_back_to_city")
+async def admin_back_city(callback: CallbackQuery, state: FSMContext, perms: Perm):
     await state.set_state(AddJob.city_choise)
     try:
         await callback.message.edit_text(
             "📍 Выберите город или добавьте новый:",
-            reply_markup=Keyboards.admin(
-                jobs_service.get_cities(),
-                can_manage_roles=(is_super_admin(callback.from_user.id) or is_developer(callback.from_user.id)),
-                can_manage_bot=is_developer(callback.from_user.id)
+            reply_markup=keyboards_cache.admin(
+                can_manage_roles=bool(perms & Perm.MANAGE_ROLES),
+                can_manage_bot=bool(perms & Perm.DEVELOPER)
             )
         )
     except TelegramBadRequest as e:
@@ -738,7 +1139,7 @@ async def admin_back_city(callback: CallbackQuery, state: FSMContext):
             raise
     await callback.answer()
 
-@router.callback_query(F.data == "admin_back_to_title")
+@callbacks.route("admin_back_to_title")
 async def admin_back_title(callback: CallbackQuery, state: FSMContext):
     await state.set_state(AddJob.title)
     try:
@@ -748,7 +1149,7 @@ async def admin_back_title(callback: CallbackQuery, state: FSMContext):
             raise
     await callback.answer()
 
-@router.callback_query(F.data == "admin_back_to_desc")
+@callbacks.route("admin_back_to_desc")
 async def admin_back_desc(callback: CallbackQuery, state: FSMContext):
     await state.set_state(AddJob.desc)
     try:
@@ -758,13 +1159,13 @@ async def admin_back_desc(callback: CallbackQuery, state: FSMContext):
             raise
     await callback.answer()
 
-@router.callback_query(F.data == "admin_back")
+@callbacks.route("admin_back")
 async def admin_back(callback: CallbackQuery, state: FSMContext):
     await state.clear()
     try:
         await callback.message.edit_text(
             "📍 Выберите город или добавьте новый:",
-            reply_markup=Keyboards.admin(jobs_service.get_cities())
+            reply_markup=keyboards_cache.admin()
         )
     except TelegramBadRequest as e:
         if "message is not modified" not in str(e).lower():
@@ -0,0 +1,192 @@
+import asyncio
+import heapq
+import itertools
+import logging
+import time
+from collections import OrderedDict, defaultdict
+from typing import Any, Dict, List, Tuple
+
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware, NextRequestMiddlewareType
+from aiogram.exceptions import TelegramRetryAfter
+from aiogram.methods import AnswerCallbackQuery, AnswerInlineQuery, SendDocument, TelegramMethod
+
+logger = logging.getLogger(__name__)
+
+# меньше — раньше: ответ на нажатие кнопки снимает "часики", его нельзя держать за рассылкой
+PRIORITY_CALLBACK = 0
+PRIORITY_INTERACTIVE = 1
+PRIORITY_BULK = 2
+METHOD_PRIORITY = {
+    AnswerCallbackQuery: PRIORITY_CALLBACK,
+    AnswerInlineQuery: PRIORITY_CALLBACK,
+    SendDocument: PRIORITY_BULK,
+}
+
+
+class TokenBucket:
+    """Token bucket whose waiters are served by priority, then in arrival order."""
+
+    def __init__(self, rate: float, burst: float):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = float(burst)
+        self._updated = time.monotonic()
+        self._waiters: List[Tuple[int, int, asyncio.Future]] = []
+        self._seq = itertools.count()
+        self._timer: asyncio.TimerHandle | None = None
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    @property
+    def idle(self) -> bool:
+        """Full and nobody waiting: can be forgotten without changing behaviour."""
+        self._refill()
+        return not self._waiters and self.tokens >= self.burst
+
+    @property
+    def waiting(self) -> int:
+        return len(self._waiters)
+
+    async def acquire(self, priority: int = PRIORITY_INTERACTIVE):
+        self._refill()
+        if not self._waiters and self.tokens >= 1:
+            self.tokens -= 1
+            return
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiters, (priority, next(self._seq), future))
+        self._schedule()
+        await future
+
+    def pause(self, seconds: float):
+        """No tokens for `seconds` (Telegram said RetryAfter)."""
+        self._refill()
+        self.tokens = min(self.tokens, 0.0) - seconds * self.rate
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        self._schedule()
+
+    def _schedule(self):
+        if self._timer is not None or not self._waiters:
+            return
+        delay = max(0.0, (1 - self.tokens) / self.rate)
+        self._timer = asyncio.get_running_loop().call_later(delay, self._release)
+
+    def _release(self):
+        self._timer = None
+        self._refill()
+        while self._waiters and self.tokens >= 1:
+            _, _, future = heapq.heappop(self._waiters)
+            if future.done():
+                # ожидающий отменён — токен не тратим
+                continue
+            self.tokens -= 1
+            future.set_result(None)
+        self._schedule()
+
+
+class OutboundScheduler(BaseRequestMiddleware):
+    """Session middleware: paces Bot API calls against Telegram's limits.
+
+    Every sending/editing call takes a token from its chat's bucket
+    (`chat_rate`/s, bursts of `chat_burst`; groups — `group_rate`) and from
+    the global bucket (`global_rate`/s, kept under Telegram's ~30/s), where
+    callback answers go first and documents last. Read-only Get* calls are
+    not paced. TelegramRetryAfter pauses the chat (or everything, for
+    chat-less calls) for the requested
+    time and the call is retried up to `max_retries` times.
+    """
+
+    def __init__(
+        self,
+        global_rate: float = 25.0,
+        global_burst: float = 5.0,
+        chat_rate: float = 1.0,
+        chat_burst: float = 3.0,
+        group_rate: float = 20 / 60,
+        max_retries: int = 3,
+        max_retry_wait: float = 60.0,
+        max_chats: int = 10000,
+    ):
+        self.global_bucket = TokenBucket(global_rate, global_burst)
+        self.chat_rate = chat_rate
+        self.chat_burst = chat_burst
+        self.group_rate = group_rate
+        self.max_retries = max_retries
+        self.max_retry_wait = max_retry_wait
+        self.max_chats = max_chats
+        self._chats: "OrderedDict[Any, TokenBucket]" = OrderedDict()
+        # метрики
+        self.calls: Dict[str, int] = defaultdict(int)
+        self.errors: Dict[str, int] = defaultdict(int)
+        self.retry_after = 0
+        self.waited = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+
+    def _chat_bucket(self, chat_id: Any) -> TokenBucket:
+        bucket = self._chats.get(chat_id)
+        if bucket is None:
+            is_group = isinstance(chat_id, str) or chat_id < 0
+            bucket = TokenBucket(self.group_rate if is_group else self.chat_rate, self.chat_burst)
+            self._chats[chat_id] = bucket
+            if len(self._chats) > self.max_chats:
+                self._forget_idle()
+        else:
+            self._chats.move_to_end(chat_id)
+        return bucket
+
+    def _forget_idle(self):
+        for chat_id in [c for c, b in itertools.islice(self._chats.items(), len(self._chats) // 2) if b.idle]:
+            del self._chats[chat_id]
+
+    async def _acquire(self, method: TelegramMethod, chat_id: Any):
+        started = time.monotonic()
+        if chat_id is not None:
+            await self._chat_bucket(chat_id).acquire()
+        await self.global_bucket.acquire(METHOD_PRIORITY.get(type(method), PRIORITY_INTERACTIVE))
+        wait = time.monotonic() - started
+        if wait > 0.001:
+            self.waited += 1
+            self.total_wait += wait
+            self.max_wait = max(self.max_wait, wait)
+
+    async def __call__(self, make_request: NextRequestMiddlewareType, bot, method: TelegramMethod):
+        name = type(method).__name__
+        self.calls[name] += 1
+        if name.startswith("Get"):
+            return await make_request(bot, method)
+        chat_id = getattr(method, "chat_id", None)
+        attempt = 0
+        while True:
+            await self._acquire(method, chat_id)
+            try:
+                return await make_request(bot, method)
+            except TelegramRetryAfter as e:
+                self.retry_after += 1
+                bucket = self._chat_bucket(chat_id) if chat_id is not None else self.global_bucket
+                bucket.pause(e.retry_after)
+                attempt += 1
+                if attempt > self.max_retries or e.retry_after > self.max_retry_wait:
+                    self.errors[name] += 1
+                    raise
+                logger.warning("RetryAfter %ss on %s chat=%s, retry %d/%d", e.retry_after, name, chat_id, attempt, self.max_retries)
+            except Exception:
+                self.errors[name] += 1
+                raise
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "calls": sum(self.calls.values()),
+            "errors": sum(self.errors.values()),
+            "retry_after": self.retry_after,
+            "waiting": self.global_bucket.waiting + sum(b.waiting for b in self._chats.values()),
+            "chats": len(self._chats),
+            "paced": self.waited,
+            "avg_wait_ms": round(self.total_wait / self.waited * 1000, 1) if self.waited else 0.0,
+            "max_wait_ms": round(self.max_wait * 1000, 1),
+            "by_method": dict(self.calls),
+        }
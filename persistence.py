@@ -0,0 +1,158 @@
+import asyncio
+import json
+import logging
+import os
+import tempfile
+from typing import Any, Callable, Optional, Tuple
+from metrics import PERSIST_SECONDS
+
+logger = logging.getLogger(__name__)
+
+# после неудачной записи пауза удваивается до этого предела (диск полон, нет прав и т.п.)
+MAX_RETRY_DELAY = 60.0
+
+
+def file_signature(path: str) -> Optional[Tuple[int, int, int]]:
+    """(mtime_ns, size, inode) of `path`, None if it does not exist; changes on every rewrite."""
+    try:
+        st = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return st.st_mtime_ns, st.st_size, st.st_ino
+
+
+def write_label(path: str) -> str:
+    """bot_persist_seconds label of a file write: write:jobs.json, write:admins.json."""
+    return f"write:{os.path.basename(path)}"
+
+
+def atomic_write_json(path: str, data: Any) -> Optional[Tuple[int, int, int]]:
+    """Write JSON to a temp file next to `path`, then os.replace it over the original.
+
+    Returns the signature of the written file, so watchers can tell our own writes apart.
+    """
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, tmp_path = tempfile.mkstemp(prefix=".tmp-", suffix=".json", dir=directory)
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            json.dump(data, f, indent=4, ensure_ascii=False)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        try:
+            os.unlink(tmp_path)
+        except OSError:
+            pass
+        raise
+    return file_signature(path)
+
+
+class WriteBehindPersister:
+    """Coalesces mutations into one debounced, atomic write done in a worker thread.
+
+    `snapshot` is called on the event loop thread and must return a copy that is
+    safe to serialize while handlers keep mutating the live data.
+    """
+
+    def __init__(self, path: str, snapshot: Callable[[], Any], delay: float = 0.5):
+        self.path = path
+        self.snapshot = snapshot
+        self.delay = delay
+        self.writes = 0
+        self.label = write_label(path)
+        # подпись последнего файла, записанного нами (см. watcher.py)
+        self.signature: Optional[Tuple[int, int, int]] = None
+        self._dirty = False
+        # неудачных записей подряд: от них зависит пауза перед следующей попыткой
+        self._failures = 0
+        self._event: Optional[asyncio.Event] = None
+        self._lock: Optional[asyncio.Lock] = None
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    @property
+    def dirty(self) -> bool:
+        return self._dirty
+
+    @property
+    def busy(self) -> bool:
+        """Unwritten changes or a write in progress: the file on disk is about to be replaced by us."""
+        return self._dirty or (self._lock is not None and self._lock.locked())
+
+    def start(self):
+        if self.running:
+            return
+        self._event = asyncio.Event()
+        self._lock = asyncio.Lock()
+        self._task = asyncio.create_task(self._run(), name=f"persist:{os.path.basename(self.path)}")
+        if self._dirty:
+            self._event.set()
+
+    def mark_dirty(self):
+        self._dirty = True
+        if self.running:
+            self._event.set()
+        else:
+            # фоновая задача не запущена (скрипты, миграции) — пишем сразу
+            self.write_now()
+
+    def write_now(self):
+        self._dirty = False
+        with PERSIST_SECONDS.time(self.label):
+            self.signature = atomic_write_json(self.path, self.snapshot())
+        self.writes += 1
+
+    async def _write(self):
+        async with self._lock:
+            if not self._dirty:
+                return
+            self._dirty = False
+            data = self.snapshot()
+            try:
+                with PERSIST_SECONDS.time(self.label):
+                    self.signature = await asyncio.to_thread(atomic_write_json, self.path, data)
+                self.writes += 1
+                self._failures = 0
+                logger.debug("Persisted %s (writes=%d)", self.path, self.writes)
+            except Exception:
+                self._dirty = True
+                self._failures += 1
+                logger.exception("Failed to persist %s (attempt %d)", self.path, self._failures)
+                # без новой правки фоновая задача иначе так и не повторила бы запись
+                if self._event is not None:
+                    self._event.set()
+
+    async def _run(self):
+        while True:
+            await self._event.wait()
+            await asyncio.sleep(self._retry_delay())
+            self._event.clear()
+            # shield: отмена при остановке не должна обрывать начатую запись
+            await asyncio.shield(self._write())
+
+    def _retry_delay(self) -> float:
+        if not self._failures:
+            return self.delay
+        return min(max(self.delay, 0.5) * 2 ** self._failures, MAX_RETRY_DELAY)
+
+    async def flush(self):
+        if self._lock is None:
+            if self._dirty:
+                self.write_now()
+            return
+        # всегда через блокировку: после stop() ещё может идти запись, начатая под shield
+        await self._write()
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.flush()
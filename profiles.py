@@ -0,0 +1,103 @@
+import asyncio
+import logging
+import time
+from collections import OrderedDict
+from typing import Dict, Iterable, NamedTuple
+
+logger = logging.getLogger(__name__)
+
+
+class Profile(NamedTuple):
+    expires: float
+    username: str | None
+    full_name: str | None
+
+
+class ProfileCache:
+    """TTL + LRU cache of Telegram profiles shared by roster rendering and @username lookups.
+
+    Filled from get_chat results and, for free, from `from_user` of every
+    incoming update (see ProfileObserverMiddleware).
+    """
+
+    def __init__(self, maxsize: int = 4096, ttl: float = 3600.0, failure_ttl: float = 60.0, concurrency: int = 8):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.failure_ttl = failure_ttl
+        self.concurrency = concurrency
+        self.hits = 0
+        self.misses = 0
+        self._by_id: "OrderedDict[int, Profile]" = OrderedDict()
+        self._by_username: Dict[str, int] = {}
+
+    def observe(self, uid: int, username: str | None, full_name: str | None, ttl: float | None = None):
+        uid = int(uid)
+        old = self._by_id.pop(uid, None)
+        if old is not None and old.username and old.username.lower() != (username or "").lower():
+            self._by_username.pop(old.username.lower(), None)
+        self._by_id[uid] = Profile(time.monotonic() + (self.ttl if ttl is None else ttl), username, full_name)
+        if username:
+            self._by_username[username.lower()] = uid
+        while len(self._by_id) > self.maxsize:
+            _, evicted = self._by_id.popitem(last=False)
+            if evicted.username:
+                self._by_username.pop(evicted.username.lower(), None)
+
+    def get(self, uid: int) -> Profile | None:
+        profile = self._by_id.get(uid)
+        if profile is None:
+            return None
+        if profile.expires < time.monotonic():
+            return None
+        self._by_id.move_to_end(uid)
+        return profile
+
+    @staticmethod
+    def format(uid: int, profile: Profile | None) -> str:
+        if profile is not None:
+            if profile.username:
+                return f"@{profile.username}"
+            if profile.full_name:
+                return f"{profile.full_name} ({uid})"
+        return str(uid)
+
+    async def _fetch(self, bot, uid: int):
+        try:
+            chat = await bot.get_chat(uid)
+            self.observe(uid, getattr(chat, "username", None), getattr(chat, "full_name", None))
+        except Exception as e:
+            logger.debug("get_chat failed uid=%d error=%s", uid, e)
+            # запоминаем неудачу ненадолго, чтобы не долбить API на каждом рендере
+            self.observe(uid, None, None, ttl=self.failure_ttl)
+
+    async def display_names(self, bot, uids: Iterable[int]) -> Dict[int, str]:
+        uids = list(uids)
+        missing = [uid for uid in uids if self.get(uid) is None]
+        self.hits += len(uids) - len(missing)
+        self.misses += len(missing)
+        if missing:
+            semaphore = asyncio.Semaphore(self.concurrency)
+
+            async def fetch(uid: int):
+                async with semaphore:
+                    await self._fetch(bot, uid)
+            await asyncio.gather(*(fetch(uid) for uid in missing))
+        return {uid: self.format(uid, self._by_id.get(uid)) for uid in uids}
+
+    async def display_name(self, bot, uid: int) -> str:
+        return (await self.display_names(bot, [uid]))[uid]
+
+    async def resolve_username(self, bot, username: str) -> int | None:
+        """uid for "@name": cached mapping if still fresh, otherwise one get_chat."""
+        key = username.lstrip("@").lower()
+        uid = self._by_username.get(key)
+        if uid is not None:
+            profile = self.get(uid)
+            if profile is not None and profile.username and profile.username.lower() == key:
+                self.hits += 1
+                return uid
+        self.misses += 1
+        chat = await bot.get_chat(username)
+        uid = int(chat.id)
+        self.observe(uid, getattr(chat, "username", None), getattr(chat, "full_name", None))
+        return uid
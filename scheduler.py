@@ -0,0 +1,204 @@
+import asyncio
+import logging
+import time
+from collections import deque
+from typing import Any, Awaitable, Callable, Deque, Dict, Set
+
+from aiogram import BaseMiddleware
+from aiogram.dispatcher.event.bases import UNHANDLED
+from aiogram.types import ErrorEvent, TelegramObject
+
+logger = logging.getLogger(__name__)
+
+OVERFLOW_POLICIES = ("block", "drop_new", "drop_oldest")
+SHUTDOWN_DRAIN_TIMEOUT = 30
+
+
+class _Job:
+    __slots__ = ("handler", "event", "data", "enqueued")
+
+    def __init__(self, handler, event, data, enqueued: float):
+        self.handler = handler
+        self.event = event
+        self.data = data
+        self.enqueued = enqueued
+
+
+class UpdateScheduler(BaseMiddleware):
+    """Outer update middleware: per-chat FIFO, global concurrency limit, bounded backlog.
+
+    The update is queued behind earlier updates of its chat and the call
+    returns at once; a runner task per busy chat feeds its queue through a
+    shared semaphore, so chats run in parallel and each chat in order.
+    When `max_backlog` updates are waiting, `overflow` decides:
+    "block" — the caller waits for space (polling with handle_as_tasks=False
+    and webhook POSTs then slow down), "drop_new" — the incoming update is
+    dropped, "drop_oldest" — the longest-waiting update is dropped.
+
+    The handler runs in the runner task, outside aiogram's ErrorsMiddleware,
+    so its exceptions are passed to the dispatcher's error handlers
+    (dp.errors) here; unhandled ones are logged.
+    """
+
+    def __init__(
+        self, concurrency: int = 32, max_backlog: int = 1000, overflow: str = "block",
+        drain_timeout: float = SHUTDOWN_DRAIN_TIMEOUT,
+    ):
+        if overflow not in OVERFLOW_POLICIES:
+            raise ValueError(f"unknown overflow policy: {overflow!r}")
+        self.concurrency = concurrency
+        self.max_backlog = max_backlog
+        self.overflow = overflow
+        self.drain_timeout = drain_timeout
+        self._slots = asyncio.Semaphore(concurrency)
+        self._space = asyncio.Event()
+        self._queues: Dict[int, Deque[_Job]] = {}
+        self._runners: Set[asyncio.Task] = set()
+        self._idle = asyncio.Event()
+        self._idle.set()
+        self.backlog = 0
+        self.running = 0
+        # статистика с запуска
+        self.received = 0
+        self.started = 0
+        self.completed = 0
+        self.failed = 0
+        self.dropped = 0
+        self.max_backlog_seen = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+
+    @staticmethod
+    def _key(data: Dict[str, Any]) -> int:
+        chat = data.get("event_chat")
+        if chat is not None:
+            return chat.id
+        user = data.get("event_from_user")
+        return user.id if user is not None else 0
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any],
+    ) -> Any:
+        self.received += 1
+        if self.backlog >= self.max_backlog:
+            if self.overflow == "drop_new":
+                self.dropped += 1
+                logger.warning("Backlog full (%d), dropped update %s", self.backlog, getattr(event, "update_id", None))
+                return None
+            if self.overflow == "drop_oldest":
+                self._drop_oldest()
+            else:
+                while self.backlog >= self.max_backlog:
+                    self._space.clear()
+                    await self._space.wait()
+        key = self._key(data)
+        self.backlog += 1
+        self.max_backlog_seen = max(self.max_backlog_seen, self.backlog)
+        job = _Job(handler, event, data, time.monotonic())
+        queue = self._queues.get(key)
+        if queue is not None:
+            queue.append(job)
+            return None
+        self._queues[key] = deque([job])
+        self._idle.clear()
+        runner = asyncio.create_task(self._run_chat(key), name=f"chat:{key}")
+        self._runners.add(runner)
+        runner.add_done_callback(self._runner_done)
+        return None
+
+    def _runner_done(self, runner: asyncio.Task):
+        self._runners.discard(runner)
+        if not self._runners:
+            self._idle.set()
+
+    def _dequeued(self):
+        self.backlog -= 1
+        self._space.set()
+
+    def _drop_oldest(self):
+        key = min(
+            (k for k, q in self._queues.items() if q),
+            key=lambda k: self._queues[k][0].enqueued,
+            default=None,
+        )
+        if key is None:
+            return
+        job = self._queues[key].popleft()
+        self._dequeued()
+        self.dropped += 1
+        logger.warning("Backlog full, dropped oldest update %s (chat %s)", getattr(job.event, "update_id", None), key)
+
+    async def _run_chat(self, key: int):
+        queue = self._queues[key]
+        try:
+            while queue:
+                async with self._slots:
+                    if not queue:
+                        break
+                    job = queue.popleft()
+                    self._dequeued()
+                    self.started += 1
+                    wait = time.monotonic() - job.enqueued
+                    self.total_wait += wait
+                    self.max_wait = max(self.max_wait, wait)
+                    # FSM-мидлварь прочитала состояние при постановке в очередь;
+                    # предыдущий апдейт этого чата мог его сменить
+                    state = job.data.get("state")
+                    if state is not None:
+                        job.data["raw_state"] = await state.get_state()
+                    self.running += 1
+                    try:
+                        await job.handler(job.event, job.data)
+                        self.completed += 1
+                    except Exception as e:
+                        self.failed += 1
+                        if not await self._propagate_error(job, e):
+                            logger.exception("Update %s failed", getattr(job.event, "update_id", None))
+                    finally:
+                        self.running -= 1
+        finally:
+            del self._queues[key]
+
+    async def _propagate_error(self, job: _Job, error: Exception) -> bool:
+        """What ErrorsMiddleware does for inline handlers: True if a dp.errors handler took the error."""
+        dispatcher = job.data.get("dispatcher")
+        if dispatcher is None:
+            return False
+        try:
+            response = await dispatcher.propagate_event(
+                update_type="error", event=ErrorEvent(update=job.event, exception=error), **job.data
+            )
+        except Exception:
+            logger.exception("Error handler failed for update %s", getattr(job.event, "update_id", None))
+            return False
+        return response is not UNHANDLED
+
+    async def drain(self, timeout: float | None = None) -> bool:
+        """Wait until every queued update has been handled. False if `timeout` ran out first."""
+        try:
+            await asyncio.wait_for(self._idle.wait(), timeout)
+            return True
+        except asyncio.TimeoutError:
+            return False
+
+    async def on_shutdown(self):
+        """Called by BotDispatcher.emit_shutdown: let queued updates finish before storages close."""
+        if not await self.drain(self.drain_timeout):
+            logger.warning("Shutdown: %d updates still queued after %ds", self.backlog + self.running, self.drain_timeout)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "backlog": self.backlog,
+            "running": self.running,
+            "chats": len(self._queues),
+            "received": self.received,
+            "completed": self.completed,
+            "failed": self.failed,
+            "dropped": self.dropped,
+            "max_backlog": self.max_backlog_seen,
+            "avg_wait_ms": round(self.total_wait / self.started * 1000, 1) if self.started else 0.0,
+            "max_wait_ms": round(self.max_wait * 1000, 1),
+        }
@@ -0,0 +1,292 @@
+import asyncio
+import heapq
+import logging
+import math
+import re
+import time
+from collections import OrderedDict
+from functools import lru_cache
+from typing import Dict, Iterable, List, Tuple
+
+logger = logging.getLogger(__name__)
+
+_WORD = re.compile(r"\w+")
+STOPWORDS = frozenset("и в во на с со по для не от до за из к ко о об у а но или же ли бы".split())
+# окончания, которые срезаем (длинные раньше коротких): прилагательные, глаголы, существительные
+_ENDINGS = tuple(sorted(set("""
+    иями ями ами ией иям ием иях ого его ому ему ыми ими ать ять ить еть уть ешь ешься ется ются
+    ах ях ам ям ом ем ов ев ей ой ий ый ую юю ая яя ое ее ые ие ых их ым им ою ею ию ью ия ья ье
+    ет ют ут ит ат ят ла ли ло ть
+    а я о е и ы у ю ь й
+""".split()), key=len, reverse=True))
+MIN_STEM = 3
+
+# вес слова по полю: совпадение в названии важнее, чем в описании
+TITLE_WEIGHT = 3
+CITY_WEIGHT = 2
+DESC_WEIGHT = 1
+
+
+@lru_cache(maxsize=65536)
+def stem(word: str) -> str:
+    """Light Russian stemmer: strips one inflectional ending, keeps at least MIN_STEM letters."""
+    for ending in _ENDINGS:
+        if word.endswith(ending) and len(word) - len(ending) >= MIN_STEM:
+            return word[:-len(ending)]
+    return word
+
+
+def tokenize(text: str) -> List[str]:
+    return [
+        stem(word) for word in _WORD.findall(text.casefold().replace("ё", "е"))
+        if len(word) > 1 and word not in STOPWORDS
+    ]
+
+
+class _Matches:
+    """Vacancies containing every token of one query, sorted by score on first use."""
+
+    __slots__ = ("tokens", "idf", "postings", "candidates", "ranked")
+
+    def __init__(self, tokens: Tuple[str, ...], idf: List[float], postings: List[Dict[int, int]]):
+        self.tokens = tokens
+        self.idf = idf
+        self.postings = postings
+        # пересечение, начиная с самого редкого слова
+        common: Iterable[int] = ()
+        if postings:
+            rarest = sorted(postings, key=len)
+            common = rarest[0].keys()
+            for docs in rarest[1:]:
+                common = docs.keys() & common
+        self.candidates = common
+        self.ranked: List[int] | None = None
+
+    def _key(self, job_id: int) -> Tuple[float, int]:
+        # сначала больший счёт, при равном — меньший id
+        return -sum(docs[job_id] * idf for docs, idf in zip(self.postings, self.idf)), job_id
+
+    def count(self) -> int:
+        return len(self.candidates)
+
+    def top(self, n: int) -> List[int]:
+        if self.ranked is None:
+            if n * 4 < len(self.candidates):
+                # первые страницы большого набора — без полной сортировки
+                return heapq.nsmallest(n, self.candidates, key=self._key)
+            self.ranked = sorted(self.candidates, key=self._key)
+        return self.ranked[:n]
+
+    def score(self, doc: Dict[str, int]) -> float | None:
+        """Score of a vacancy by its token weights, None if it does not match."""
+        score = 0.0
+        for token, idf in zip(self.tokens, self.idf):
+            weight = doc.get(token)
+            if weight is None:
+                return None
+            score += weight * idf
+        return score
+
+
+class SearchIndex:
+    """In-memory inverted index over vacancy title, description and city.
+
+    Updated from Jobservice.job_listeners; a replaced catalog is rebuilt in a
+    worker thread. Results are ranked by field weight times idf and cached
+    per query until the index changes.
+    """
+
+    def __init__(self, jobs_service, cache_size: int = 256):
+        self.jobs_service = jobs_service
+        self.cache_size = cache_size
+        # токен -> {job_id: вес}
+        self._postings: Dict[str, Dict[int, int]] = {}
+        self._doc_tokens: Dict[int, Dict[str, int]] = {}
+        self._built = False
+        self._cache: "OrderedDict[Tuple[str, ...], _Matches]" = OrderedDict()
+        # фоновая перестройка: номер последней, правки, пришедшие во время неё
+        self._generation = 0
+        self._rebuilding: asyncio.Task | None = None
+        self._pending: List[Tuple[str, int | str | None]] = []
+        jobs_service.job_listeners.append(self.on_change)
+
+    # ==Построение==
+    @staticmethod
+    def _document(job: Dict, city: str) -> Dict[str, int]:
+        weights: Dict[str, int] = {}
+        for field, weight in ((job.get("title") or "", TITLE_WEIGHT), (city, CITY_WEIGHT), (job.get("desc") or "", DESC_WEIGHT)):
+            for token in set(tokenize(field)):
+                weights[token] = weights.get(token, 0) + weight
+        return weights
+
+    @staticmethod
+    def _insert(postings, doc_tokens, job_id: int, tokens: Dict[str, int]):
+        doc_tokens[job_id] = tokens
+        for token, weight in tokens.items():
+            postings.setdefault(token, {})[job_id] = weight
+
+    def _add(self, job_id: int, job: Dict, city: str):
+        self._insert(self._postings, self._doc_tokens, job_id, self._document(job, city))
+
+    def _remove(self, job_id: int):
+        tokens = self._doc_tokens.pop(job_id, None)
+        if tokens is None:
+            return
+        for token in tokens:
+            docs = self._postings.get(token)
+            if docs is None:
+                continue
+            docs.pop(job_id, None)
+            if not docs:
+                del self._postings[token]
+
+    def _snapshot(self) -> List[Tuple[str, List[int], List[Dict]]]:
+        # копии списков, без кортежа на вакансию: снимается на цикле, пока он стоит
+        js = self.jobs_service
+        return [(city, list(js.get_job_ids(city)), list(js.get_jobs(city))) for _, city in js.get_city_items()]
+
+    @classmethod
+    def _build(cls, snapshot: List[Tuple[str, List[int], List[Dict]]]):
+        postings: Dict[str, Dict[int, int]] = {}
+        doc_tokens: Dict[int, Dict[str, int]] = {}
+        for city, job_ids, jobs in snapshot:
+            for job_id, job in zip(job_ids, jobs):
+                cls._insert(postings, doc_tokens, job_id, cls._document(job, city))
+        return postings, doc_tokens
+
+    def _swap(self, postings, doc_tokens, started: float):
+        self._postings, self._doc_tokens = postings, doc_tokens
+        self._cache.clear()
+        self._built = True
+        logger.info("Search index built: %d vacancies, %d tokens in %.0f ms",
+                    len(self._doc_tokens), len(self._postings), (time.perf_counter() - started) * 1000)
+
+    def rebuild(self):
+        """Build synchronously, on the calling thread."""
+        started = time.perf_counter()
+        self._generation += 1
+        self._pending.clear()
+        self._swap(*self._build(self._snapshot()), started)
+
+    async def _rebuild_in_thread(self, generation: int, snapshot: List[Tuple[str, List[int], List[Dict]]]):
+        started = time.perf_counter()
+        try:
+            built = await asyncio.to_thread(self._build, snapshot)
+        except Exception:
+            logger.exception("Search index rebuild failed")
+            return
+        if generation != self._generation:
+            # пока строили, каталог заменили ещё раз — результат устарел
+            return
+        self._swap(*built, started)
+        # правки, пришедшие во время перестройки, могли не попасть в снимок
+        pending, self._pending = self._pending, []
+        for event, ref in pending:
+            self._apply(event, ref)
+
+    def _schedule_rebuild(self):
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            # без цикла (скрипты, бенчмарки) — лениво, на следующем запросе
+            self._built = False
+            return
+        self._generation += 1
+        self._pending = []
+        # снимок — на цикле: списки каталога меняются только здесь
+        self._rebuilding = loop.create_task(self._rebuild_in_thread(self._generation, self._snapshot()))
+
+    def on_change(self, event: str, ref):
+        """Jobservice.job_listeners hook."""
+        if not self._built:
+            return
+        if event == "reload":
+            self._schedule_rebuild()
+            return
+        if self._rebuilding is not None and not self._rebuilding.done():
+            self._pending.append((event, ref))
+        self._apply(event, ref)
+
+    def _apply(self, event: str, ref):
+        self._cache.clear()
+        js = self.jobs_service
+        if event == "delete":
+            self._remove(ref)
+        elif event in ("add", "update"):
+            self._remove(ref)
+            job, city = js.get_job_by_id(ref), js.get_job_city(ref)
+            if job is not None and city is not None:
+                self._add(ref, job, city)
+        elif event == "city":
+            # у вакансий переименованного города меняется только «городской» вес
+            for job_id, job in js.get_job_items(ref):
+                self._remove(job_id)
+                self._add(job_id, job, ref)
+
+    # ==Поиск==
+    def _query(self, query: str) -> _Matches | None:
+        if not self._built:
+            self.rebuild()
+        tokens = tuple(sorted(set(tokenize(query))))
+        if not tokens:
+            return None
+        cached = self._cache.get(tokens)
+        if cached is not None:
+            self._cache.move_to_end(tokens)
+            return cached
+        result = self._match(tokens)
+        self._cache[tokens] = result
+        if len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+        return result
+
+    def _match(self, tokens: Tuple[str, ...]) -> _Matches:
+        postings = [self._postings.get(token) for token in tokens]
+        if any(p is None for p in postings):
+            return _Matches(tokens, [], [])
+        total = len(self._doc_tokens) or 1
+        idf = [math.log(1 + total / len(p)) for p in postings]
+        return _Matches(tokens, idf, postings)
+
+    def count(self, query: str) -> int:
+        matches = self._query(query)
+        return matches.count() if matches is not None else 0
+
+    def top(self, query: str, n: int) -> List[int]:
+        """The n best matching job ids."""
+        matches = self._query(query)
+        return matches.top(n) if matches is not None else []
+
+    def search(self, query: str) -> List[int]:
+        """All matching job ids, best first (ranks everything: prefer top/page)."""
+        return self.top(query, self.count(query))
+
+    def rank(self, query: str, job_ids: Iterable[int]) -> List[int]:
+        """Those of `job_ids` that match the query, best first (for a small candidate set, e.g. one city)."""
+        matches = self._query(query)
+        if matches is None:
+            return []
+        scored = []
+        for job_id in job_ids:
+            doc = self._doc_tokens.get(job_id)
+            score = matches.score(doc) if doc is not None else None
+            if score is not None:
+                scored.append((score, job_id))
+        scored.sort(key=lambda pair: pair[0], reverse=True)
+        return [job_id for _, job_id in scored]
+
+    def page(self, query: str, offset: int, limit: int) -> Tuple[int, List[Tuple[int, Dict, str]]]:
+        """(total matches, [(job_id, job, city)] for the requested slice)."""
+        matches = self._query(query)
+        if matches is None:
+            return 0, []
+        js = self.jobs_service
+        items = []
+        for job_id in matches.top(offset + limit)[offset:]:
+            job = js.get_job_by_id(job_id)
+            if job is not None:
+                items.append((job_id, job, js.get_job_city(job_id)))
+        return matches.count(), items
+
+    def stats(self) -> Dict[str, int]:
+        return {"vacancies": len(self._doc_tokens), "tokens": len(self._postings), "cached_queries": len(self._cache)}
@@ -1,27 +1,283 @@
+import bisect
 import json
 import logging
-from typing import Dict, List
+from enum import IntFlag
+from urllib.parse import urlparse
+from typing import Callable, Dict, List, Set, Tuple
+from storage import CITIES_KEY, META_KEY, JsonCatalogStorage, split_catalog
+from persistence import WriteBehindPersister, atomic_write_json, write_label
+from metrics import PERSIST_SECONDS
 
 logger = logging.getLogger(__name__)
 
+_ID_ALPHABET = "0123456789abcdefghijklmnopqrstuvwxyz"
+
+
+def encode_id(value: int) -> str:
+    """Compact base36 form of a catalog id for callback_data."""
+    if value == 0:
+        return "0"
+    digits = []
+    while value:
+        value, rem = divmod(value, 36)
+        digits.append(_ID_ALPHABET[rem])
+    return "".join(reversed(digits))
+
+
+def decode_id(value: str) -> int | None:
+    try:
+        return int(value, 36)
+    except (TypeError, ValueError):
+        return None
+
+
+def is_valid_http_url(url) -> bool:
+    try:
+        parsed = urlparse(url)
+        return parsed.scheme in ("http", "https") and bool(parsed.netloc)
+    except Exception:
+        return False
+
+
+class Perm(IntFlag):
+    NONE = 0
+    ADMIN = 1
+    SUPER_ADMIN = 2
+    DEVELOPER = 4
+    # составные маски для частых проверок
+    ADMIN_ACCESS = ADMIN | SUPER_ADMIN | DEVELOPER
+    MANAGE_ROLES = SUPER_ADMIN | DEVELOPER
+
+
+ROLE_FLAGS = {"admins": Perm.ADMIN, "super_admins": Perm.SUPER_ADMIN, "developers": Perm.DEVELOPER}
+
+
+def parse_roles(data) -> Dict[str, Set[int]]:
+    """admins.json contents -> role sets; a plain list is the legacy admins-only format."""
+    try:
+        if isinstance(data, list):
+            return {"admins": set(map(int, data)), "super_admins": set(), "developers": set()}
+        if isinstance(data, dict):
+            return {role: set(map(int, data.get(role, []))) for role in ROLE_FLAGS}
+    except (TypeError, ValueError) as e:
+        raise ValueError(f"bad user id in roles: {e}") from None
+    raise ValueError(f"roles must be a list or an object, got {type(data).__name__}")
+
+
+def validate_catalog(data) -> Dict[str, List[Dict]]:
+    """Check jobs.json contents: {"cities": {city: [{"id", "title", "desc", "url"}, ...]}, META_KEY: {...}}. Raises ValueError."""
+    if not isinstance(data, dict):
+        raise ValueError(f"catalog must be an object, got {type(data).__name__}")
+    cities, meta = split_catalog(data)
+    if not isinstance(meta, dict):
+        raise ValueError(f"{META_KEY} must be an object")
+    if isinstance(data.get(CITIES_KEY), dict):
+        # город, дописанный руками на верхний уровень, иначе молча пропал бы
+        extra = set(data) - {CITIES_KEY, META_KEY}
+        if extra:
+            raise ValueError(f"unexpected top-level keys {sorted(extra)} (cities go under {CITIES_KEY!r})")
+    for city, vacancies in cities.items():
+        if not city.strip():
+            raise ValueError("empty city name")
+        if not isinstance(vacancies, list):
+            raise ValueError(f"{city}: vacancies must be a list")
+        for i, job in enumerate(vacancies):
+            if not isinstance(job, dict):
+                raise ValueError(f"{city}[{i}]: vacancy must be an object")
+            for field in ("title", "desc", "url"):
+                if not isinstance(job.get(field), str):
+                    raise ValueError(f"{city}[{i}]: {field!r} must be a string")
+            # без id можно: вакансия, добавленная руками, получит новый
+            if "id" in job and (not isinstance(job["id"], int) or isinstance(job["id"], bool)):
+                raise ValueError(f"{city}[{i}]: 'id' must be an integer")
+    return data
+
+
 class Jobservice:
-    def __init__(self, jobs_file: str = 'jobs.json', admins_file: str = 'admins.json'):
+    def __init__(self, jobs_file: str = 'jobs.json', admins_file: str = 'admins.json', storage=None):
         self.jobs_file = jobs_file
         self.admins_file = admins_file
+        self.storage = storage if storage is not None else JsonCatalogStorage(jobs_file)
+        # растёт при каждом изменении каталога; по нему сбрасываются производные кэши
+        self.version = 0
+        # вызываются с "catalog" / "roles" после изменений, сделанных этим процессом
+        self.listeners: List[Callable[[str], None]] = []
+        # подробности для инкрементальных индексов: ("add"|"update"|"delete", job_id),
+        # ("city", имя) — город добавлен, переименован (новое имя) или удалён,
+        # ("reload", None) — каталог заменён и поменялся почти весь
+        self.job_listeners: List[Callable[[str, int | str | None], None]] = []
+        # каталог и роли делят несколько процессов: роли перечитываются перед правкой
+        self.shared = False
         self.jobs = self.load_jobs()
         self.roles = self.load_roles()
+        self.roles_persister: WriteBehindPersister | None = None
+
+    # ==Отложенная запись на диск==
+    def start_write_behind(self, delay: float = 0.5):
+        """Batch file writes in a background task. Must be called from a running event loop."""
+        jobs_persister = self.storage.enable_write_behind(delay)
+        if jobs_persister is not None:
+            jobs_persister.start()
+        self.roles_persister = WriteBehindPersister(self.admins_file, self._roles_snapshot, delay)
+        self.roles_persister.start()
+        logger.info("Write-behind persistence enabled (delay=%.2fs)", delay)
+
+    async def flush(self):
+        await self.storage.flush()
+        if self.roles_persister is not None:
+            await self.roles_persister.flush()
+
+    async def close(self):
+        persister = getattr(self.storage, "persister", None)
+        if persister is not None:
+            await persister.stop()
+        if self.roles_persister is not None:
+            await self.roles_persister.stop()
+        self.storage.close()
 
     # ==Вакансии==
     def load_jobs(self) -> Dict[str, List[Dict]]:
-        try:
-            with open(self.jobs_file, "r", encoding="utf-8") as f:
-                return json.load(f)
-        except (FileNotFoundError, json.JSONDecodeError):
-            return {}
+        jobs = self.storage.load()
+        self._index_catalog(jobs)
+        return jobs
 
     def save_jobs(self):
-        with open(self.jobs_file, "w", encoding="utf-8") as f:
-            json.dump(self.jobs, f, indent=4, ensure_ascii=False)
+        """Full rewrite of the catalog. Regular edits go through the per-operation storage methods."""
+        # время записи меряют сами хранилища (bot_persist_seconds)
+        self.storage.save_all(self.jobs)
+
+    def reload_jobs(self):
+        """Re-read the catalog after another process changed it."""
+        self._swap_catalog(self.storage.load())
+        self.version += 1
+
+    def replace_jobs(self, jobs: Dict[str, List[Dict]]):
+        """Swap in a catalog read from a hand-edited jobs_file (already validated).
+
+        Runs synchronously on the event loop, so handlers see either the old
+        catalog or the new one, never a mix. Vacancies keep the ids stored in
+        the file: buttons on old messages still open the same vacancy or, if
+        it was removed, are stale.
+        """
+        self._swap_catalog(self.storage.replace(jobs))
+        self._bump()
+
+    def _swap_catalog(self, jobs: Dict[str, List[Dict]]):
+        """Index `jobs` as the current catalog and tell job_listeners what changed, by id."""
+        old_jobs, old_city, old_names = self._jobs_by_id, self._job_city, self._cities_by_id
+        self._index_catalog(jobs)
+        self.jobs = jobs
+        events = [("delete", job_id) for job_id in old_jobs if job_id not in self._jobs_by_id]
+        for job_id, job in self._jobs_by_id.items():
+            old = old_jobs.get(job_id)
+            if old is None:
+                events.append(("add", job_id))
+            elif old != job or old_names.get(old_city[job_id]) != self.get_job_city(job_id):
+                events.append(("update", job_id))
+        # поменялось больше половины — индексам дешевле перестроиться целиком
+        if len(events) > len(self._jobs_by_id) // 2:
+            self._job_changed("reload")
+            return
+        for event, job_id in events:
+            self._job_changed(event, job_id)
+
+    def _notify(self, kind: str):
+        for listener in self.listeners:
+            try:
+                listener(kind)
+            except Exception:
+                logger.exception("Change listener failed: %s", kind)
+
+    def _bump(self):
+        self.version += 1
+        self._notify("catalog")
+
+    def _job_changed(self, event: str, ref: int | str | None = None):
+        for listener in self.job_listeners:
+            try:
+                listener(event, ref)
+            except Exception:
+                logger.exception("Job listener failed: %s %s", event, ref)
+
+    # ==Реестр ID: короткие числовые id городов и вакансий для callback_data==
+    def _index_catalog(self, jobs: Dict[str, List[Dict]]):
+        # id хранит хранилище (rowid в SQLite, поле "id" в jobs.json): они одинаковы
+        # во всех процессах и после перезапуска
+        city_rowids, job_rowids = self.storage.catalog_ids() or ({}, {})
+        self._next_city_id = 1
+        self._next_job_id = 1
+        self._city_ids: Dict[str, int] = {}
+        self._cities_by_id: Dict[int, str] = {}
+        # порядок городов как в self.jobs, но со срезами без обхода словаря
+        self._city_order: List[str] = []
+        self._job_ids: Dict[str, List[int]] = {}
+        self._jobs_by_id: Dict[int, Dict] = {}
+        self._job_city: Dict[int, int] = {}
+        for city, vacancies in jobs.items():
+            self._register_city(city, city_rowids.get(city))
+            rowids = job_rowids.get(city, [])
+            for i, job in enumerate(vacancies):
+                self._register_job(city, job, rowids[i] if i < len(rowids) else None)
+
+    def _register_city(self, city: str, city_id: int | None = None) -> int:
+        if city_id is None:
+            city_id = self._next_city_id
+        self._next_city_id = max(self._next_city_id, city_id + 1)
+        self._city_ids[city] = city_id
+        self._cities_by_id[city_id] = city
+        self._city_order.append(city)
+        self._job_ids[city] = []
+        return city_id
+
+    def _register_job(self, city: str, job: Dict, job_id: int | None = None) -> int:
+        if job_id is None:
+            job_id = self._next_job_id
+        self._next_job_id = max(self._next_job_id, job_id + 1)
+        self._job_ids[city].append(job_id)
+        self._jobs_by_id[job_id] = job
+        self._job_city[job_id] = self._city_ids[city]
+        return job_id
+
+    def _forget_job(self, job_id: int):
+        del self._jobs_by_id[job_id]
+        del self._job_city[job_id]
+
+    def get_city_id(self, city: str) -> int | None:
+        return self._city_ids.get(city)
+
+    def get_city_by_id(self, city_id: int) -> str | None:
+        return self._cities_by_id.get(city_id)
+
+    def get_job_by_id(self, job_id: int) -> Dict | None:
+        return self._jobs_by_id.get(job_id)
+
+    def get_job_city(self, job_id: int) -> str | None:
+        city_id = self._job_city.get(job_id)
+        return self._cities_by_id.get(city_id) if city_id is not None else None
+
+    def count_cities(self) -> int:
+        return len(self._city_order)
+
+    def count_jobs(self, city: str) -> int:
+        return len(self.jobs.get(city, []))
+
+    def get_city_items(self, offset: int = 0, limit: int | None = None) -> List[Tuple[int, str]]:
+        end = None if limit is None else offset + limit
+        return [(self._city_ids[city], city) for city in self._city_order[offset:end]]
+
+    def get_job_items(self, city: str, offset: int = 0, limit: int | None = None) -> List[Tuple[int, Dict]]:
+        end = None if limit is None else offset + limit
+        return list(zip(self._job_ids.get(city, [])[offset:end], self.jobs.get(city, [])[offset:end]))
+
+    def get_job_ids(self, city: str) -> List[int]:
+        """Ids of the city's vacancies, aligned with get_jobs(city). Do not mutate."""
+        return self._job_ids.get(city, [])
+
+    def _job_position(self, job_id: int) -> Tuple[str, int] | None:
+        city = self.get_job_city(job_id)
+        if city is None:
+            return None
+        return city, self._job_ids[city].index(job_id)
 
     def get_cities(self) -> List[str]:
         return list(self.jobs.keys())
@@ -32,17 +288,52 @@ class Jobservice:
     def get_job(self, city: str, index: int) -> Dict:
         return self.jobs[city][index]
 
-    def add_city(self, city: str):
+    def add_city(self, city: str) -> int:
         if city not in self.jobs:
             self.jobs[city] = []
-            self.save_jobs()
+            self._register_city(city, self.storage.add_city(city))
+            self._job_changed("city", city)
+            self._bump()
+        return self._city_ids[city]
 
-    def add_job(self, city: str, title: str, desc: str, url: str):
+    def add_job(self, city: str, title: str, desc: str, url: str) -> int:
+        job = {"title": title, "desc": desc, "url": url}
         if city not in self.jobs:
+            self.add_city(city)
+        self.jobs[city].append(job)
+        job_id = self._register_job(city, job, self.storage.add_job(city, job))
+        self._job_changed("add", job_id)
+        self._bump()
+        return job_id
+
+    def add_jobs(self, items: List[Tuple[str, Dict]]) -> List[int]:
+        """Append many (city, job) pairs at once: one storage transaction or file write, one version bump."""
+        if not items:
+            return []
+        new_cities = [city for city in dict.fromkeys(city for city, _ in items) if city not in self.jobs]
+        for city in new_cities:
             self.jobs[city] = []
-            self.save_jobs()
-        self.jobs[city].append({"title": title, "desc": desc, "url": url})
-        self.save_jobs()
+        for city, job in items:
+            self.jobs[city].append(job)
+        try:
+            rowids = self.storage.add_jobs(items)
+        except Exception:
+            for city, _ in reversed(items):
+                self.jobs[city].pop()
+            for city in new_cities:
+                del self.jobs[city]
+            raise
+        city_rowids = (self.storage.catalog_ids() or ({}, {}))[0]
+        for city in new_cities:
+            self._register_city(city, city_rowids.get(city))
+        job_ids = [
+            self._register_job(city, job, rowids[i] if rowids else None)
+            for i, (city, job) in enumerate(items)
+        ]
+        for job_id in job_ids:
+            self._job_changed("add", job_id)
+        self._bump()
+        return job_ids
 
     #==Расширенные операции (админка)==
     def rename_city(self, old_city: str, new_city: str) -> bool:
@@ -50,14 +341,37 @@ class Jobservice:
             return False
         if new_city in self.jobs and new_city != old_city:
             return False
-        self.jobs[new_city] = self.jobs.pop(old_city)
-        self.save_jobs()
+        if new_city == old_city:
+            return True
+        self._rename_local(old_city, new_city)
+        self.storage.rename_city(old_city, new_city)
+        self._job_changed("city", new_city)
+        self._bump()
         return True
 
+    def _rename_local(self, old_city: str, new_city: str):
+        self.jobs[new_city] = self.jobs.pop(old_city)
+        city_id = self._city_ids.pop(old_city)
+        self._city_ids[new_city] = city_id
+        self._cities_by_id[city_id] = new_city
+        self._city_order.remove(old_city)
+        self._city_order.append(new_city)
+        self._job_ids[new_city] = self._job_ids.pop(old_city)
+
+    def _drop_city_local(self, city: str):
+        del self.jobs[city]
+        for job_id in self._job_ids.pop(city):
+            self._forget_job(job_id)
+            self._job_changed("delete", job_id)
+        del self._cities_by_id[self._city_ids.pop(city)]
+        self._city_order.remove(city)
+
     def delete_city(self, city: str) -> bool:
         if city in self.jobs:
-            del self.jobs[city]
-            self.save_jobs()
+            self._drop_city_local(city)
+            self.storage.delete_city(city)
+            self._job_changed("city", city)
+            self._bump()
             return True
         return False
 
@@ -71,7 +385,9 @@ class Jobservice:
             jobs[index]["desc"] = desc
         if url is not None:
             jobs[index]["url"] = url
-        self.save_jobs()
+        self.storage.update_job(city, index, {"title": title, "desc": desc, "url": url})
+        self._job_changed("update", self._job_ids[city][index])
+        self._bump()
         return True
 
     def delete_job(self, city: str, index: int) -> bool:
@@ -79,11 +395,187 @@ class Jobservice:
         if jobs is None or not (0 <= index < len(jobs)):
             return False
         jobs.pop(index)
-        self.save_jobs()
+        job_id = self._job_ids[city].pop(index)
+        self._forget_job(job_id)
+        self.storage.delete_job(city, index)
+        self._job_changed("delete", job_id)
+        self._bump()
+        return True
+
+    def update_job_by_id(self, job_id: int, title: str | None = None, desc: str | None = None, url: str | None = None) -> bool:
+        position = self._job_position(job_id)
+        if position is None:
+            return False
+        return self.update_job(*position, title=title, desc=desc, url=url)
+
+    def delete_job_by_id(self, job_id: int) -> bool:
+        position = self._job_position(job_id)
+        if position is None:
+            return False
+        return self.delete_job(*position)
+
+    #==Пакетные операции (выбор нескольких вакансий в админке)==
+    def _positions(self, job_ids) -> Dict[str, List[int]]:
+        """job ids -> {city: sorted list indices}; unknown ids are ignored."""
+        wanted: Dict[str, Set[int]] = {}
+        for job_id in job_ids:
+            city = self.get_job_city(job_id)
+            if city is not None:
+                wanted.setdefault(city, set()).add(job_id)
+        return {
+            city: [i for i, job_id in enumerate(self._job_ids[city]) if job_id in ids]
+            for city, ids in wanted.items()
+        }
+
+    def delete_jobs(self, job_ids) -> int:
+        """Delete many vacancies: one storage transaction or file write, one version bump."""
+        positions = self._positions(job_ids)
+        if not positions:
+            return 0
+        deleted = []
+        for city, indices in positions.items():
+            drop = set(indices)
+            ids = self._job_ids[city]
+            deleted.extend(ids[i] for i in indices)
+            self.jobs[city] = [job for i, job in enumerate(self.jobs[city]) if i not in drop]
+            self._job_ids[city] = [job_id for i, job_id in enumerate(ids) if i not in drop]
+        self.storage.delete_jobs(positions)
+        for job_id in deleted:
+            self._forget_job(job_id)
+            self._job_changed("delete", job_id)
+        self._bump()
+        return len(deleted)
+
+    def move_jobs(self, job_ids, target_city: str) -> int:
+        """Move many vacancies to `target_city` (must exist), keeping their ids.
+
+        Lists stay ordered by id, as both storages load them, so the order
+        survives a reload.
+        """
+        if target_city not in self.jobs:
+            return 0
+        positions = self._positions(job_ids)
+        positions.pop(target_city, None)
+        if not positions:
+            return 0
+        moved = []
+        target_id = self._city_ids[target_city]
+        for city, indices in positions.items():
+            take = set(indices)
+            ids, jobs = self._job_ids[city], self.jobs[city]
+            for i in indices:
+                self.jobs[target_city].append(jobs[i])
+                self._job_ids[target_city].append(ids[i])
+                self._job_city[ids[i]] = target_id
+                moved.append(ids[i])
+            self.jobs[city] = [job for i, job in enumerate(jobs) if i not in take]
+            self._job_ids[city] = [job_id for i, job_id in enumerate(ids) if i not in take]
+        merged = sorted(zip(self._job_ids[target_city], self.jobs[target_city]), key=lambda pair: pair[0])
+        self._job_ids[target_city] = [job_id for job_id, _ in merged]
+        self.jobs[target_city] = [job for _, job in merged]
+        self.storage.move_jobs(positions, target_city)
+        for job_id in moved:
+            self._job_changed("update", job_id)
+        self._bump()
+        return len(moved)
+
+    def update_jobs(self, changes: Dict[int, Dict[str, str]]) -> int:
+        """Apply {job_id: {"title"/"desc"/"url": value}} in one storage transaction, one version bump."""
+        updates, updated = [], []
+        for job_id, fields in changes.items():
+            position = self._job_position(job_id)
+            fields = {k: v for k, v in fields.items() if k in ("title", "desc", "url") and v is not None}
+            if position is None or not fields:
+                continue
+            city, index = position
+            self.jobs[city][index].update(fields)
+            updates.append((city, index, fields))
+            updated.append(job_id)
+        if not updates:
+            return 0
+        self.storage.update_jobs(updates)
+        for job_id in updated:
+            self._job_changed("update", job_id)
+        self._bump()
+        return len(updates)
+
+    #==Правки другого процесса (шарды)==
+    def refresh(self, job_ids: List[int] | None, cities: bool = False):
+        """Re-read only these vacancies (and, if `cities`, the city list) after another process changed them.
+
+        Reads the current rows, so a late or repeated notification is harmless.
+        None, a large batch or a storage without row reads means reload_jobs().
+        """
+        storage = self.storage
+        if job_ids is None or not hasattr(storage, "load_rows") or len(job_ids) > len(self._jobs_by_id) // 2:
+            self.reload_jobs()
+            return
+        if cities and not self._refresh_cities(storage.load_cities()):
+            self.reload_jobs()
+            return
+        rows = storage.load_rows(job_ids)
+        if any(city_id not in self._cities_by_id for city_id, _ in rows.values()):
+            # город, о котором мы ещё не знаем: его добавление придёт позже — проще перечитать всё
+            self.reload_jobs()
+            return
+        for job_id in job_ids:
+            row = rows.get(job_id)
+            known = job_id in self._jobs_by_id
+            if known:
+                self._drop_row(job_id)
+            if row is not None:
+                self._put_row(job_id, self._cities_by_id[row[0]], row[1])
+            if known or row is not None:
+                self._job_changed("delete" if row is None else "update" if known else "add", job_id)
+        self.version += 1
+
+    def _refresh_cities(self, rows: List[Tuple[int, str]]) -> bool:
+        """Apply the city list read from the storage; False if renames collide (caller reloads)."""
+        current = dict(rows)
+        for city_id, name in rows:
+            if self._city_ids.get(name, city_id) != city_id and self._city_ids[name] in current:
+                return False
+        for city_id in [city_id for city_id in self._cities_by_id if city_id not in current]:
+            city = self._cities_by_id[city_id]
+            self._drop_city_local(city)
+            self.storage.forget_city(city)
+            self._job_changed("city", city)
+        for city_id, name in rows:
+            old = self._cities_by_id.get(city_id)
+            if old is None:
+                self.jobs[name] = []
+                self._register_city(name, city_id)
+                self.storage.remember_city(name, city_id)
+            elif old != name:
+                self._rename_local(old, name)
+                self.storage.rename_cached_city(old, name)
+            else:
+                continue
+            self._job_changed("city", name)
         return True
 
+    def _drop_row(self, job_id: int):
+        city = self.get_job_city(job_id)
+        index = self._job_ids[city].index(job_id)
+        self.jobs[city].pop(index)
+        self._job_ids[city].pop(index)
+        self._forget_job(job_id)
+        self.storage.forget_row(city, index)
+
+    def _put_row(self, job_id: int, city: str, job: Dict):
+        # списки городов упорядочены по id, как после load()
+        index = bisect.bisect_left(self._job_ids[city], job_id)
+        self.jobs[city].insert(index, job)
+        self._job_ids[city].insert(index, job_id)
+        self._jobs_by_id[job_id] = job
+        self._job_city[job_id] = self._city_ids[city]
+        self.storage.remember_row(city, index, job_id)
+
     #==Роли/Админка==
-    def load_roles(self) -> Dict[str, List[int]]:
+    def reload_roles(self):
+        self.roles = self.load_roles()
+
+    def load_roles(self) -> Dict[str, Set[int]]:
         """Load roles from admins_file. Supports old list format for backward compatibility."""
         try:
             with open(self.admins_file, "r", encoding="utf-8") as f:
@@ -92,29 +584,42 @@ class Jobservice:
             logger.warning("Roles file missing or invalid, starting with defaults: %s", self.admins_file)
             data = []
 
-
+        try:
+            roles = parse_roles(data)
+        except ValueError:
+            logger.warning("Unknown roles format, using empty roles")
+            roles = {role: set() for role in ROLE_FLAGS}
         if isinstance(data, list):
             logger.info("Loaded legacy roles format (list of admins), count=%d", len(data))
-            return {"admins": data, "super_admins": [], "developers": []}
-
-        if isinstance(data, dict):
-            roles = {
-                "admins": list(map(int, data.get("admins", []))),
-                "super_admins": list(map(int, data.get("super_admins", []))),
-                "developers": list(map(int, data.get("developers", []))),
-            }
+        else:
             logger.info(
                 "Loaded roles: admins=%d, super_admins=%d, developers=%d",
                 len(roles["admins"]), len(roles["super_admins"]), len(roles["developers"])
             )
-            return roles
+        self._rebuild_permissions(roles)
+        return roles
+
+    def replace_roles(self, roles: Dict[str, Set[int]]):
+        """Swap in roles read from a hand-edited admins_file (already parsed)."""
+        self._rebuild_permissions(roles)
+        self.roles = roles
+
+    def _rebuild_permissions(self, roles: Dict[str, Set[int]]):
+        self._perms: Dict[int, Perm] = {}
+        for role, flag in ROLE_FLAGS.items():
+            for uid in roles[role]:
+                self._perms[uid] = self._perms.get(uid, Perm.NONE) | flag
 
-        logger.warning("Unknown roles format, using empty roles")
-        return {"admins": [], "super_admins": [], "developers": []}
+    def _roles_snapshot(self) -> Dict[str, List[int]]:
+        return {role: sorted(ids) for role, ids in self.roles.items()}
 
     def save_roles(self):
-        with open(self.admins_file, "w", encoding="utf-8") as f:
-            json.dump(self.roles, f, indent=4, ensure_ascii=False)
+        if self.roles_persister is not None:
+            # саму запись меряет persister
+            self.roles_persister.mark_dirty()
+        else:
+            with PERSIST_SECONDS.time(write_label(self.admins_file)):
+                atomic_write_json(self.admins_file, self._roles_snapshot())
         logger.debug(
             "Saved roles to %s (admins=%d, super_admins=%d, developers=%d)",
             self.admins_file,
@@ -122,67 +627,73 @@ class Jobservice:
             len(self.roles.get("super_admins", [])),
             len(self.roles.get("developers", [])),
         )
+        self._notify("roles")
 
+    def permissions(self, user_id: int) -> Perm:
+        """Precomputed role bitmask; every role check is a single bit test on it."""
+        return self._perms.get(int(user_id), Perm.NONE)
 
     def is_admin(self, user_id: int) -> bool:
-        return int(user_id) in self.roles.get("admins", [])
+        return bool(self.permissions(user_id) & Perm.ADMIN)
 
     def is_super_admin(self, user_id: int) -> bool:
-        return int(user_id) in self.roles.get("super_admins", [])
+        return bool(self.permissions(user_id) & Perm.SUPER_ADMIN)
 
     def is_developer(self, user_id: int) -> bool:
-        return int(user_id) in self.roles.get("developers", [])
+        return bool(self.permissions(user_id) & Perm.DEVELOPER)
 
     def has_admin_access(self, user_id: int) -> bool:
         """Any role that can use admin panel (admin, super admin, developer)."""
+        return bool(self.permissions(user_id) & Perm.ADMIN_ACCESS)
+
+    def _add_role(self, role: str, user_id: int) -> bool:
+        if self.shared:
+            self.reload_roles()
         uid = int(user_id)
-        return (
-            uid in self.roles.get("admins", [])
-            or uid in self.roles.get("super_admins", [])
-            or uid in self.roles.get("developers", [])
-        )
+        if uid in self.roles[role]:
+            return False
+        self.roles[role].add(uid)
+        self._perms[uid] = self._perms.get(uid, Perm.NONE) | ROLE_FLAGS[role]
+        self.save_roles()
+        return True
 
+    def _remove_role(self, role: str, user_id: int) -> bool:
+        if self.shared:
+            self.reload_roles()
+        uid = int(user_id)
+        if uid not in self.roles[role]:
+            return False
+        self.roles[role].discard(uid)
+        perms = self._perms.get(uid, Perm.NONE) & ~ROLE_FLAGS[role]
+        if perms:
+            self._perms[uid] = perms
+        else:
+            self._perms.pop(uid, None)
+        self.save_roles()
+        return True
 
     def add_admin(self, user_id: int):
-        uid = int(user_id)
-        if uid not in self.roles["admins"]:
-            self.roles["admins"].append(uid)
-            self.save_roles()
-            logger.info("Added admin uid=%d", uid)
+        if self._add_role("admins", user_id):
+            logger.info("Added admin uid=%d", int(user_id))
 
     def remove_admin(self, user_id: int):
-        uid = int(user_id)
-        if uid in self.roles["admins"]:
-            self.roles["admins"].remove(uid)
-            self.save_roles()
-            logger.info("Removed admin uid=%d", uid)
+        if self._remove_role("admins", user_id):
+            logger.info("Removed admin uid=%d", int(user_id))
 
     def add_super_admin(self, user_id: int):
-        uid = int(user_id)
-        if uid not in self.roles["super_admins"]:
-            self.roles["super_admins"].append(uid)
-            self.save_roles()
-            logger.info("Added super_admin uid=%d", uid)
+        if self._add_role("super_admins", user_id):
+            logger.info("Added super_admin uid=%d", int(user_id))
 
     def remove_super_admin(self, user_id: int):
-        uid = int(user_id)
-        if uid in self.roles["super_admins"]:
-            self.roles["super_admins"].remove(uid)
-            self.save_roles()
-            logger.info("Removed super_admin uid=%d", uid)
+        if self._remove_role("super_admins", user_id):
+            logger.info("Removed super_admin uid=%d", int(user_id))
 
     def add_developer(self, user_id: int):
-        uid = int(user_id)
-        if uid not in self.roles["developers"]:
-            self.roles["developers"].append(uid)
-            self.save_roles()
-            logger.info("Added developer uid=%d", uid)
-            logger.info("Roles updated: admins=%s, super_admins=%s, developers=%s", self.roles.get("admins", []), self.roles.get("super_admins", []), self.roles.get("developers", []))
+        if self._add_role("developers", user_id):
+            logger.info("Added developer uid=%d", int(user_id))
+            logger.info("Roles updated: %s", self._roles_snapshot())
 
     def remove_developer(self, user_id: int):
-        uid = int(user_id)
-        if uid in self.roles["developers"]:
-            self.roles["developers"].remove(uid)
-            self.save_roles()
-            logger.info("Removed developer uid=%d", uid)
-            logger.info("Roles updated: admins=%s, super_admins=%s, developers=%s", self.roles.get("admins", []), self.roles.get("super_admins", []), self.roles.get("developers", []))
\ No newline at end of file
+        if self._remove_role("developers", user_id):
+            logger.info("Removed developer uid=%d", int(user_id))
+            logger.info("Roles updated: %s", self._roles_snapshot())
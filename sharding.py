@@ -0,0 +1,297 @@
+import asyncio
+import logging
+import multiprocessing
+import os
+import queue
+import signal
+import sys
+import time
+from collections import deque
+from typing import Dict, List, Set, Tuple
+
+from aiogram import Bot
+from aiogram.dispatcher.middlewares.user_context import UserContextMiddleware
+from aiogram.methods import GetUpdates
+from aiogram.types import Update
+
+logger = logging.getLogger(__name__)
+
+POLL_TIMEOUT = 30
+INBOX_SIZE = 1000
+SHUTDOWN_TIMEOUT = 30
+# как часто мастер проверяет, живы ли шарды, и сколько раз за окно шард может упасть до остановки бота
+SUPERVISE_INTERVAL = 1.0
+MAX_RESTARTS = 5
+RESTART_WINDOW = 60.0
+# запись в полный inbox ждёт кусками: ожидание можно отменить, поток не зависает навсегда
+PUT_SLICE = 1.0
+
+
+def chat_key(update: Update) -> int:
+    context = UserContextMiddleware.resolve_event_context(update)
+    return context.chat_id or context.user_id or 0
+
+
+# ==Воркер==
+class CatalogChanges:
+    """Ids changed by this shard since its last notification: other shards re-read just those rows."""
+
+    def __init__(self):
+        self.job_ids: Set[int] = set()
+        self.cities = False
+        self.full = False
+
+    def on_change(self, event: str, ref):
+        """Jobservice.job_listeners hook."""
+        if event == "city":
+            self.cities = True
+        elif event == "reload":
+            self.full = True
+        else:
+            self.job_ids.add(ref)
+
+    def take(self) -> Tuple[str, List[int] | None, bool]:
+        """("catalog", job ids or None for "reload everything", cities changed) and reset."""
+        message = ("catalog", None if self.full else sorted(self.job_ids), self.cities)
+        self.clear()
+        return message
+
+    def clear(self):
+        self.job_ids = set()
+        self.cities = self.full = False
+
+
+def worker_main(index: int, workers: int, inbox, events, log_queue, log_level: int):
+    """Process entry point: one Dispatcher fed from `inbox`, changes reported to the master via `events`."""
+    # Ctrl+C получает вся группа процессов; останавливает воркеров мастер
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    from logsetup import setup_worker_logging
+    setup_worker_logging(log_queue, log_level)
+    asyncio.run(_serve(index, workers, inbox, events))
+
+
+async def _serve(index: int, workers: int, inbox, events):
+    from bot import create_bot, create_dispatcher
+    from config import FSM_DB, FSM_TTL, OUT_GLOBAL_RATE, PERSIST_DELAY, METRICS_HOST, METRICS_PORT
+    from fsm_storage import SqliteFSMStorage
+    from lifecycle import Lifecycle
+    from metrics import start_metrics_server
+    from obrabotchik import activity, jobs_service, search_index
+
+    jobs_service.shared = True
+    # у каждого шарда свой журнал активности; счётчики для /dev stats шарды складывают через дампы
+    root, ext = os.path.splitext(activity.path)
+    activity.path = f"{root}-{index}{ext}"
+    activity.share(f"{root}-{index}.counters.json", [f"{root}-{i}.counters.json" for i in range(workers) if i != index])
+    changes = CatalogChanges()
+    jobs_service.job_listeners.append(changes.on_change)
+    jobs_service.listeners.append(
+        lambda kind: events.put(("changed", index, changes.take() if kind == "catalog" else ("roles",)))
+    )
+    # перезапуск/остановку выполняет мастер: воркер передаёт ему "restart" / "stop"
+    lifecycle = Lifecycle(on_request=lambda action: events.put(("control", index, action)))
+    # общий лимит Telegram делится между шардами
+    bot, outbound = create_bot(OUT_GLOBAL_RATE / workers)
+    dp = create_dispatcher(SqliteFSMStorage(FSM_DB, ttl=FSM_TTL, flush_delay=PERSIST_DELAY), lifecycle)
+    dp["outbound"] = outbound
+    await dp.emit_startup(bot=bot)
+    activity.start()
+    search_index.rebuild()
+    metrics_runner = await start_metrics_server(METRICS_HOST, METRICS_PORT + index) if METRICS_PORT else None
+
+    logger.info("Shard %d started (pid=%d)", index, os.getpid())
+    while True:
+        message = await asyncio.to_thread(inbox.get)
+        if message is None:
+            break
+        if message[0] == "catalog":
+            jobs_service.refresh(message[1], message[2])
+            # события от refresh — чужие правки, пересылать их обратно не нужно
+            changes.clear()
+            continue
+        if message[0] == "roles":
+            jobs_service.reload_roles()
+            continue
+        # планировщик ставит апдейт в очередь его чата и сразу возвращает управление;
+        # при заполненной очереди ждём, и inbox копится уже у мастера
+        try:
+            await dp.feed_raw_update(bot, message[2])
+        except Exception:
+            logger.exception("Shard %d failed to queue update %s", index, message[2].get("update_id"))
+
+    # shutdown сначала дожидается очереди планировщика, потом закрывает FSM-хранилище
+    await dp.emit_shutdown(bot=bot)
+    if metrics_runner is not None:
+        await metrics_runner.cleanup()
+    await activity.close()
+    await jobs_service.close()
+    await bot.session.close()
+    logger.info("Shard %d stopped", index)
+
+
+# ==Мастер==
+async def _put(inbox, message):
+    """inbox.put that waits for a slow shard without blocking a thread forever (cancellable)."""
+    while True:
+        try:
+            inbox.put_nowait(message)
+            return
+        except queue.Full:
+            pass
+        try:
+            await asyncio.to_thread(inbox.put, message, True, PUT_SLICE)
+            return
+        except queue.Full:
+            continue
+
+
+async def _poll(bot: Bot, inboxes: List, lifecycle):
+    """getUpdates in the master; every update goes to the shard owning its chat."""
+    # с места, подтверждённого при прошлой остановке
+    offset = lifecycle.load_offset()
+    while True:
+        try:
+            updates = await bot(GetUpdates(offset=offset, timeout=POLL_TIMEOUT), request_timeout=POLL_TIMEOUT + 10)
+        except Exception as e:
+            logger.warning("getUpdates failed: %s", e)
+            await asyncio.sleep(5)
+            continue
+        for update in updates:
+            offset = update.update_id + 1
+            key = chat_key(update)
+            message = ("update", key, update.model_dump(mode="json", exclude_none=True, by_alias=True))
+            inbox = inboxes[key % len(inboxes)]
+            # воркер не успевает — ждём его, а не копим апдейты в памяти мастера
+            # (упавший шард перезапускает _supervise, и очередь снова разбирается)
+            await _put(inbox, message)
+            # в inbox — значит, воркер обработает его до остановки
+            lifecycle.accepted(update.update_id)
+
+
+async def _relay(events, inboxes: List) -> str:
+    """Forwards change notifications to the other shards; returns "restart"/"stop" when a worker asks for it."""
+    while True:
+        message = await asyncio.to_thread(events.get)
+        if message is None:
+            return "stop"
+        kind, origin, value = message
+        if kind == "control":
+            logger.info("Shard %d requested %s", origin, value)
+            return value
+        for i, inbox in enumerate(inboxes):
+            if i != origin:
+                await _put(inbox, value)
+
+
+def _broadcast(inboxes: List, message: Tuple):
+    for inbox in inboxes:
+        try:
+            inbox.put_nowait(message)
+        except queue.Full:
+            asyncio.get_running_loop().create_task(_put(inbox, message))
+
+
+async def _supervise(processes: List, start_worker) -> str:
+    """Restart shards that died; returns "stop" when one keeps crashing."""
+    crashes: Dict[int, deque] = {i: deque() for i in range(len(processes))}
+    while True:
+        await asyncio.sleep(SUPERVISE_INTERVAL)
+        for i, process in enumerate(processes):
+            if process.is_alive():
+                continue
+            logger.error("Shard %d (pid=%s) died with exit code %s", i, process.pid, process.exitcode)
+            now = time.monotonic()
+            recent = crashes[i]
+            recent.append(now)
+            while now - recent[0] > RESTART_WINDOW:
+                recent.popleft()
+            if len(recent) > MAX_RESTARTS:
+                logger.critical("Shard %d crashed %d times in %.0fs, stopping", i, len(recent), RESTART_WINDOW)
+                return "stop"
+            processes[i] = start_worker(i)
+            logger.info("Shard %d restarted (pid=%d)", i, processes[i].pid)
+
+
+async def run_master(workers: int, logs_dir: str, json_logs: bool = False):
+    """Poll Telegram in this process and run `workers` shard processes partitioned by chat id.
+
+    Catalog (SQLite backend), admins.json and the FSM database are shared
+    files; a shard that changes the catalog sends the master the ids it
+    touched, and the other shards re-read just those rows (roles are
+    re-read whole). FSM needs no invalidation: a chat always lands on the
+    same shard. A shard that dies is restarted on the same inbox; one that
+    keeps crashing stops the bot.
+    """
+    from bot import create_bot
+    from config import CATALOG_BACKEND, OFFSET_FILE, WATCH_FILES, WATCH_INTERVAL
+    from lifecycle import Lifecycle
+    from logsetup import setup_logging
+    from obrabotchik import jobs_service
+    from services import parse_roles
+    from watcher import FileWatcher
+
+    if CATALOG_BACKEND != "sqlite":
+        raise RuntimeError('sharded mode needs CATALOG_BACKEND = "sqlite" (jobs.json cannot be shared between processes)')
+    ctx = multiprocessing.get_context("spawn")
+    log_queue = ctx.Queue()
+    listener = setup_logging(logs_dir, json_logs=json_logs, log_queue=log_queue)
+    events = ctx.Queue()
+    inboxes = [ctx.Queue(INBOX_SIZE) for _ in range(workers)]
+
+    def start_worker(i: int):
+        # inbox остаётся прежним: перезапущенный шард дочитывает апдейты упавшего
+        process = ctx.Process(
+            target=worker_main,
+            args=(i, workers, inboxes[i], events, log_queue, logging.getLogger().level),
+            name=f"shard-{i}",
+        )
+        process.start()
+        return process
+
+    processes = [start_worker(i) for i in range(workers)]
+    logger.info("Master started with %d shards", workers)
+
+    bot, _ = create_bot()
+    # admins.json, поправленный руками, перечитывают все шарды; свои записи шарды и так рассылают через _relay
+    watcher = FileWatcher(WATCH_INTERVAL)
+    if WATCH_FILES:
+        watcher.watch(jobs_service.admins_file, parse_roles, lambda _: _broadcast(inboxes, ("roles",)))
+    lifecycle = Lifecycle(OFFSET_FILE)
+    action = "stop"
+    tasks = []
+    try:
+        watcher.start()
+        await bot.delete_webhook()
+        poller = asyncio.create_task(_poll(bot, inboxes, lifecycle))
+        relay = asyncio.create_task(_relay(events, inboxes))
+        supervisor = asyncio.create_task(_supervise(processes, start_worker))
+        tasks = [poller, relay, supervisor]
+        done, _ = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+        for task in (relay, supervisor):
+            if task in done:
+                action = task.result()
+    finally:
+        await watcher.stop()
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        # разбудить поток, ждущий events.get()
+        events.put(None)
+        for inbox, process in zip(inboxes, processes):
+            # мёртвый шард свой inbox уже не разберёт
+            if process.is_alive():
+                try:
+                    await asyncio.wait_for(_put(inbox, None), SHUTDOWN_TIMEOUT)
+                except asyncio.TimeoutError:
+                    pass
+        for process in processes:
+            await asyncio.to_thread(process.join, SHUTDOWN_TIMEOUT)
+            if process.is_alive():
+                logger.warning("Shard %s did not stop in %ds, terminating", process.name, SHUTDOWN_TIMEOUT)
+                process.terminate()
+        await lifecycle.ack(bot)
+        await bot.session.close()
+        logger.info("Master stopped (%s)", action)
+        listener.stop()
+    if action == "restart":
+        os.execv(sys.executable, [sys.executable, *sys.argv])
@@ -0,0 +1,509 @@
+import json
+import logging
+import sqlite3
+import sys
+from contextlib import contextmanager
+from typing import Dict, List, Tuple
+from metrics import PERSIST_SECONDS
+from persistence import WriteBehindPersister, atomic_write_json, write_label
+
+logger = logging.getLogger(__name__)
+
+
+# jobs.json: {"cities": {город: [вакансии]}, "_meta": {id городов и счётчики}} —
+# служебные данные отдельно от городов, так что город может называться как угодно
+CITIES_KEY = "cities"
+META_KEY = "_meta"
+
+
+def _valid_id(value) -> bool:
+    return isinstance(value, int) and not isinstance(value, bool) and value > 0
+
+
+def split_catalog(data: Dict) -> Tuple[Dict, Dict]:
+    """(cities, meta) of jobs.json contents, current or the older flat {city: [...]} format."""
+    if isinstance(data.get(CITIES_KEY), dict):
+        return data[CITIES_KEY], data.get(META_KEY, {})
+    # старый формат: города на верхнем уровне; "_meta" со списком вакансий — обычный город
+    cities = dict(data)
+    meta = cities.pop(META_KEY) if isinstance(cities.get(META_KEY), dict) else {}
+    return cities, meta
+
+
+class JsonCatalogStorage:
+    """Whole catalog in one JSON file, rewritten on every mutation.
+
+    Ids are persisted like SQLite rowids: every vacancy carries an "id",
+    city ids and the next-id counters live under META_KEY, next to the
+    cities under CITIES_KEY (the older flat format is read too). Ids are never
+    reused, so buttons on old messages stay valid or become stale after a
+    restart, but never point to another vacancy.
+    """
+
+    def __init__(self, jobs_file: str = 'jobs.json'):
+        self.jobs_file = jobs_file
+        self._jobs: Dict[str, List[Dict]] = {}
+        self.persister: WriteBehindPersister | None = None
+        # как в SqliteCatalogStorage: город -> id, город -> id вакансий в порядке списка
+        self._city_ids: Dict[str, int] = {}
+        self._rowids: Dict[str, List[int]] = {}
+        self._next_city_id = 1
+        self._next_job_id = 1
+
+    def load(self) -> Dict[str, List[Dict]]:
+        try:
+            with open(self.jobs_file, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            data = {}
+        return self._adopt(data)
+
+    def _adopt(self, data: Dict) -> Dict[str, List[Dict]]:
+        """Split ids off the vacancies of `data` (in place); missing or duplicate ids get fresh ones."""
+        data, meta = split_catalog(data)
+        meta = meta if isinstance(meta, dict) else {}
+        known = meta.get("cities") if isinstance(meta.get("cities"), dict) else {}
+        # счётчики только растут — и после правки руками, потерявшей _meta
+        if _valid_id(meta.get("next_city_id")):
+            self._next_city_id = max(self._next_city_id, meta["next_city_id"])
+        if _valid_id(meta.get("next_job_id")):
+            self._next_job_id = max(self._next_job_id, meta["next_job_id"])
+        # города без записи в _meta (правка руками) сохраняют id, известный по имени
+        previous = self._city_ids
+        self._city_ids = {}
+        self._rowids = {}
+        seen_cities, seen_jobs = set(), set()
+        for city, vacancies in data.items():
+            city_id = known.get(city, previous.get(city))
+            if not _valid_id(city_id) or city_id in seen_cities:
+                city_id = None
+            else:
+                seen_cities.add(city_id)
+            self._city_ids[city] = city_id
+            ids = []
+            for job in vacancies:
+                # скопированная руками вакансия приходит с чужим id — ей нужен новый
+                job_id = job.pop("id", None)
+                if not _valid_id(job_id) or job_id in seen_jobs:
+                    job_id = None
+                else:
+                    seen_jobs.add(job_id)
+                ids.append(job_id)
+            self._rowids[city] = ids
+        self._next_city_id = max(self._next_city_id, max(seen_cities, default=0) + 1)
+        self._next_job_id = max(self._next_job_id, max(seen_jobs, default=0) + 1)
+        self._jobs = data
+        missing = self._assign_ids()
+        if missing:
+            logger.info("Assigned new ids to %d vacancies in %s", missing, self.jobs_file)
+        return data
+
+    def _assign_ids(self) -> int:
+        """Give ids to cities and vacancies of self._jobs that have none yet; returns the number of new vacancy ids."""
+        missing = 0
+        for city in [c for c in self._city_ids if c not in self._jobs]:
+            del self._city_ids[city]
+            del self._rowids[city]
+        for city, vacancies in self._jobs.items():
+            if self._city_ids.get(city) is None:
+                self._city_ids[city] = self._new_city_id()
+            ids = self._rowids.setdefault(city, [])
+            del ids[len(vacancies):]
+            for i, job_id in enumerate(ids):
+                if job_id is None:
+                    ids[i] = self._new_job_id()
+                    missing += 1
+            while len(ids) < len(vacancies):
+                ids.append(self._new_job_id())
+                missing += 1
+        return missing
+
+    def _new_city_id(self) -> int:
+        self._next_city_id += 1
+        return self._next_city_id - 1
+
+    def _new_job_id(self) -> int:
+        self._next_job_id += 1
+        return self._next_job_id - 1
+
+    def _snapshot(self) -> Dict:
+        return {
+            CITIES_KEY: {
+                city: [{"id": job_id, **job} for job_id, job in zip(self._rowids[city], vacancies)]
+                for city, vacancies in self._jobs.items()
+            },
+            META_KEY: {
+                "next_city_id": self._next_city_id,
+                "next_job_id": self._next_job_id,
+                "cities": dict(self._city_ids),
+            },
+        }
+
+    def catalog_ids(self) -> Tuple[Dict[str, int], Dict[str, List[int]]]:
+        """Persisted ids of cities and of vacancies in list order."""
+        return self._city_ids, self._rowids
+
+    def enable_write_behind(self, delay: float = 0.5) -> WriteBehindPersister:
+        self.persister = WriteBehindPersister(self.jobs_file, self._snapshot, delay)
+        return self.persister
+
+    def replace(self, jobs: Dict) -> Dict[str, List[Dict]]:
+        """Adopt a catalog that is already on disk (the file was edited by hand); returns it without ids."""
+        return self._adopt(jobs)
+
+    def save_all(self, jobs: Dict[str, List[Dict]]):
+        self._jobs = jobs
+        self._assign_ids()
+        self._save()
+
+    def _save(self):
+        if self.persister is not None:
+            self.persister.mark_dirty()
+        else:
+            with PERSIST_SECONDS.time(write_label(self.jobs_file)):
+                atomic_write_json(self.jobs_file, self._snapshot())
+
+    # JSON не умеет частичную запись, поэтому каждая операция = полный дамп
+    # (с write-behind — одна отложенная запись на пачку правок); id ведутся как rowid в SQLite
+    def add_city(self, city: str) -> int:
+        if city not in self._city_ids:
+            self._city_ids[city] = self._new_city_id()
+            self._rowids[city] = []
+        self._save()
+        return self._city_ids[city]
+
+    def add_job(self, city: str, job: Dict) -> int:
+        if city not in self._city_ids:
+            self._city_ids[city] = self._new_city_id()
+            self._rowids[city] = []
+        job_id = self._new_job_id()
+        self._rowids[city].append(job_id)
+        self._save()
+        return job_id
+
+    def add_jobs(self, items: List[Tuple[str, Dict]]) -> List[int]:
+        known = {city: len(rowids) for city, rowids in self._rowids.items()}
+        ids = []
+        for city, _ in items:
+            if city not in self._city_ids:
+                self._city_ids[city] = self._new_city_id()
+                self._rowids[city] = []
+            ids.append(self._new_job_id())
+            self._rowids[city].append(ids[-1])
+        try:
+            self._save()
+        except Exception:
+            # Jobservice откатит список — вернуть и id (счётчики не откатываются)
+            for city in [c for c in self._city_ids if c not in known]:
+                del self._city_ids[city]
+                del self._rowids[city]
+            for city, length in known.items():
+                del self._rowids[city][length:]
+            raise
+        return ids
+
+    def update_job(self, city: str, index: int, fields: Dict):
+        self._save()
+
+    def delete_job(self, city: str, index: int):
+        self._rowids[city].pop(index)
+        self._save()
+
+    def delete_jobs(self, positions: Dict[str, List[int]]):
+        for city, indices in positions.items():
+            drop = set(indices)
+            self._rowids[city] = [rowid for i, rowid in enumerate(self._rowids[city]) if i not in drop]
+        self._save()
+
+    def move_jobs(self, positions: Dict[str, List[int]], target_city: str):
+        moved = [self._rowids[city][i] for city, indices in positions.items() for i in indices]
+        for city, indices in positions.items():
+            take = set(indices)
+            self._rowids[city] = [rowid for i, rowid in enumerate(self._rowids[city]) if i not in take]
+        self._rowids[target_city] = sorted(self._rowids[target_city] + moved)
+        self._save()
+
+    def update_jobs(self, updates: List[Tuple[str, int, Dict]]):
+        self._save()
+
+    def rename_city(self, old_city: str, new_city: str):
+        self._city_ids[new_city] = self._city_ids.pop(old_city)
+        self._rowids[new_city] = self._rowids.pop(old_city)
+        self._save()
+
+    def delete_city(self, city: str):
+        del self._city_ids[city]
+        del self._rowids[city]
+        self._save()
+
+    async def flush(self):
+        if self.persister is not None:
+            await self.persister.flush()
+
+    def close(self):
+        pass
+
+
+class SqliteCatalogStorage:
+    """Catalog in SQLite (WAL): one short transaction per mutation, no full rewrites."""
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS cities (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            name TEXT NOT NULL UNIQUE
+        );
+        CREATE TABLE IF NOT EXISTS vacancies (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            city_id INTEGER NOT NULL REFERENCES cities(id) ON DELETE CASCADE,
+            title TEXT NOT NULL,
+            desc TEXT NOT NULL,
+            url TEXT NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS idx_vacancies_city ON vacancies(city_id, id);
+    """
+
+    def __init__(self, db_file: str = 'jobs.db'):
+        self.db_file = db_file
+        self.conn = sqlite3.connect(db_file, isolation_level=None, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute("PRAGMA foreign_keys=ON")
+        self.conn.executescript(self.SCHEMA)
+        # город -> id, город -> rowid вакансий в порядке списка (index -> rowid за O(1))
+        self._city_ids: Dict[str, int] = {}
+        self._rowids: Dict[str, List[int]] = {}
+
+    @contextmanager
+    def _transaction(self, op: str):
+        """One write transaction, timed in bot_persist_seconds as sqlite:<op>."""
+        with PERSIST_SECONDS.time(f"sqlite:{op}"), self.conn:
+            self.conn.execute("BEGIN")
+            yield
+
+    def load(self) -> Dict[str, List[Dict]]:
+        jobs: Dict[str, List[Dict]] = {}
+        self._city_ids = {}
+        self._rowids = {}
+        for city_id, name in self.conn.execute("SELECT id, name FROM cities ORDER BY id"):
+            self._city_ids[name] = city_id
+            self._rowids[name] = []
+            jobs[name] = []
+        by_id = {city_id: name for name, city_id in self._city_ids.items()}
+        rows = self.conn.execute("SELECT id, city_id, title, desc, url FROM vacancies ORDER BY city_id, id")
+        for rowid, city_id, title, desc, url in rows:
+            name = by_id[city_id]
+            self._rowids[name].append(rowid)
+            jobs[name].append({"title": title, "desc": desc, "url": url})
+        logger.info("Loaded catalog from %s: cities=%d", self.db_file, len(jobs))
+        return jobs
+
+    def save_all(self, jobs: Dict[str, List[Dict]], ids: Tuple[Dict[str, int], Dict[str, List[int]]] | None = None):
+        """Full rewrite. Cities and vacancies keep their ids (`ids` as from catalog_ids(), the current ones by default)."""
+        city_ids, job_ids = ids or (self._city_ids, self._rowids)
+        city_ids, job_ids = dict(city_ids), {city: list(rowids) for city, rowids in job_ids.items()}
+        with self._transaction("save_all"):
+            self.conn.execute("DELETE FROM vacancies")
+            self.conn.execute("DELETE FROM cities")
+            self._city_ids = {}
+            self._rowids = {}
+            for city, vacancies in jobs.items():
+                self._insert_city(city, city_ids.get(city))
+                known = job_ids.get(city, [])
+                for i, job in enumerate(vacancies):
+                    self._insert_job(city, job, known[i] if i < len(known) else None)
+
+    def reserve_ids(self, next_city_id: int, next_job_id: int):
+        """Never hand out ids below these (they were used by another storage before a migration)."""
+        with self._transaction("reserve_ids"):
+            for table, next_id in (("cities", next_city_id), ("vacancies", next_job_id)):
+                # AUTOINCREMENT берёт max(seq, max rowid) + 1
+                updated = self.conn.execute(
+                    "UPDATE sqlite_sequence SET seq = MAX(seq, ?) WHERE name = ?", (next_id - 1, table)
+                ).rowcount
+                if not updated:
+                    self.conn.execute("INSERT INTO sqlite_sequence(name, seq) VALUES (?, ?)", (table, next_id - 1))
+
+    def _insert_city(self, city: str, city_id: int | None = None) -> int:
+        cur = self.conn.execute("INSERT INTO cities(id, name) VALUES (?, ?)", (city_id, city))
+        self._city_ids[city] = cur.lastrowid
+        self._rowids[city] = []
+        return cur.lastrowid
+
+    def _insert_job(self, city: str, job: Dict, job_id: int | None = None) -> int:
+        cur = self.conn.execute(
+            "INSERT INTO vacancies(id, city_id, title, desc, url) VALUES (?, ?, ?, ?, ?)",
+            (job_id, self._city_ids[city], job["title"], job["desc"], job["url"]),
+        )
+        self._rowids[city].append(cur.lastrowid)
+        return cur.lastrowid
+
+    def catalog_ids(self) -> Tuple[Dict[str, int], Dict[str, List[int]]]:
+        """rowids of cities and of vacancies in list order, as of the last load/mutation."""
+        return self._city_ids, self._rowids
+
+    def add_city(self, city: str) -> int:
+        if city in self._city_ids:
+            return self._city_ids[city]
+        with self._transaction("add_city"):
+            return self._insert_city(city)
+
+    def add_job(self, city: str, job: Dict) -> int:
+        with self._transaction("add_job"):
+            if city not in self._city_ids:
+                self._insert_city(city)
+            return self._insert_job(city, job)
+
+    def add_jobs(self, items: List[Tuple[str, Dict]]) -> List[int]:
+        """Insert many vacancies (creating missing cities) in one transaction."""
+        known = {city: len(rowids) for city, rowids in self._rowids.items()}
+        rowids = []
+        try:
+            with self._transaction("add_jobs"):
+                for city, job in items:
+                    if city not in self._city_ids:
+                        self._insert_city(city)
+                    rowids.append(self._insert_job(city, job))
+        except Exception:
+            # транзакция откатилась — вернуть и кэш id
+            for city in [c for c in self._city_ids if c not in known]:
+                del self._city_ids[city]
+                del self._rowids[city]
+            for city, length in known.items():
+                del self._rowids[city][length:]
+            raise
+        return rowids
+
+    def update_job(self, city: str, index: int, fields: Dict):
+        fields = {k: v for k, v in fields.items() if k in ("title", "desc", "url") and v is not None}
+        if not fields:
+            return
+        assignments = ", ".join(f"{k} = ?" for k in fields)
+        with self._transaction("update_job"):
+            self.conn.execute(
+                f"UPDATE vacancies SET {assignments} WHERE id = ?",
+                (*fields.values(), self._rowids[city][index]),
+            )
+
+    def delete_job(self, city: str, index: int):
+        rowid = self._rowids[city][index]
+        with self._transaction("delete_job"):
+            self.conn.execute("DELETE FROM vacancies WHERE id = ?", (rowid,))
+        self._rowids[city].pop(index)
+
+    # Пакетные операции: одна транзакция на всю пачку; позиции — индексы до изменения
+    def delete_jobs(self, positions: Dict[str, List[int]]):
+        rowids = [(self._rowids[city][i],) for city, indices in positions.items() for i in indices]
+        with self._transaction("delete_jobs"):
+            self.conn.executemany("DELETE FROM vacancies WHERE id = ?", rowids)
+        for city, indices in positions.items():
+            drop = set(indices)
+            self._rowids[city] = [rowid for i, rowid in enumerate(self._rowids[city]) if i not in drop]
+
+    def move_jobs(self, positions: Dict[str, List[int]], target_city: str):
+        target_id = self._city_ids[target_city]
+        moved = [self._rowids[city][i] for city, indices in positions.items() for i in indices]
+        with self._transaction("move_jobs"):
+            self.conn.executemany("UPDATE vacancies SET city_id = ? WHERE id = ?", [(target_id, rowid) for rowid in moved])
+        for city, indices in positions.items():
+            take = set(indices)
+            self._rowids[city] = [rowid for i, rowid in enumerate(self._rowids[city]) if i not in take]
+        # как в load(): вакансии города по возрастанию rowid
+        self._rowids[target_city] = sorted(self._rowids[target_city] + moved)
+
+    def update_jobs(self, updates: List[Tuple[str, int, Dict]]):
+        with self._transaction("update_jobs"):
+            for city, index, fields in updates:
+                fields = {k: v for k, v in fields.items() if k in ("title", "desc", "url") and v is not None}
+                if fields:
+                    assignments = ", ".join(f"{k} = ?" for k in fields)
+                    self.conn.execute(
+                        f"UPDATE vacancies SET {assignments} WHERE id = ?",
+                        (*fields.values(), self._rowids[city][index]),
+                    )
+
+    def rename_city(self, old_city: str, new_city: str):
+        with self._transaction("rename_city"):
+            self.conn.execute("UPDATE cities SET name = ? WHERE id = ?", (new_city, self._city_ids[old_city]))
+        self._city_ids[new_city] = self._city_ids.pop(old_city)
+        self._rowids[new_city] = self._rowids.pop(old_city)
+
+    def delete_city(self, city: str):
+        with self._transaction("delete_city"):
+            self.conn.execute("DELETE FROM cities WHERE id = ?", (self._city_ids[city],))
+        del self._city_ids[city]
+        del self._rowids[city]
+
+    # ==Правки другого процесса: база уже изменена, догоняем только кэш id==
+    def load_cities(self) -> List[Tuple[int, str]]:
+        return self.conn.execute("SELECT id, name FROM cities ORDER BY id").fetchall()
+
+    def load_rows(self, rowids: List[int]) -> Dict[int, Tuple[int, Dict]]:
+        """{rowid: (city id, vacancy)} for those of `rowids` that still exist."""
+        rows = {}
+        for start in range(0, len(rowids), 500):
+            chunk = rowids[start:start + 500]
+            cur = self.conn.execute(
+                f"SELECT id, city_id, title, desc, url FROM vacancies WHERE id IN ({','.join('?' * len(chunk))})", chunk
+            )
+            for rowid, city_id, title, desc, url in cur:
+                rows[rowid] = (city_id, {"title": title, "desc": desc, "url": url})
+        return rows
+
+    def remember_city(self, city: str, city_id: int):
+        self._city_ids[city] = city_id
+        self._rowids[city] = []
+
+    def rename_cached_city(self, old_city: str, new_city: str):
+        self._city_ids[new_city] = self._city_ids.pop(old_city)
+        self._rowids[new_city] = self._rowids.pop(old_city)
+
+    def forget_city(self, city: str):
+        del self._city_ids[city]
+        del self._rowids[city]
+
+    def remember_row(self, city: str, index: int, rowid: int):
+        self._rowids[city].insert(index, rowid)
+
+    def forget_row(self, city: str, index: int):
+        self._rowids[city].pop(index)
+
+    def enable_write_behind(self, delay: float = 0.5):
+        # каждая мутация и так одна короткая транзакция — откладывать нечего
+        return None
+
+    async def flush(self):
+        pass
+
+    def close(self):
+        self.conn.close()
+
+
+def create_catalog_storage(backend: str = "json", jobs_file: str = 'jobs.json', db_file: str = 'jobs.db'):
+    if backend == "sqlite":
+        return SqliteCatalogStorage(db_file)
+    if backend == "json":
+        return JsonCatalogStorage(jobs_file)
+    raise ValueError(f"Unknown catalog storage backend: {backend}")
+
+
+def migrate_json_to_sqlite(jobs_file: str = 'jobs.json', db_file: str = 'jobs.db') -> int:
+    """One-shot import of jobs.json into SQLite. Replaces whatever the database held. Returns vacancy count."""
+    source = JsonCatalogStorage(jobs_file)
+    jobs = source.load()
+    target = SqliteCatalogStorage(db_file)
+    try:
+        # id из jobs.json переезжают как есть: кнопки и сохранённые шаги FSM продолжают работать
+        target.save_all(jobs, source.catalog_ids())
+        target.reserve_ids(source._next_city_id, source._next_job_id)
+    finally:
+        target.close()
+    count = sum(len(v) for v in jobs.values())
+    logger.info("Migrated %s -> %s: cities=%d, vacancies=%d", jobs_file, db_file, len(jobs), count)
+    return count
+
+
+if __name__ == "__main__":
+    # python storage.py [jobs.json] [jobs.db]
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s [%(name)s] %(message)s")
+    args = sys.argv[1:]
+    migrate_json_to_sqlite(*args[:2])
@@ -0,0 +1,139 @@
+import asyncio
+import json
+import logging
+import os
+from typing import Any, Callable, List
+
+from persistence import WriteBehindPersister, file_signature
+from services import Jobservice, parse_roles, validate_catalog
+
+try:
+    from watchfiles import awatch
+except ImportError:  # необязательная зависимость: без неё опрашиваем mtime
+    awatch = None
+
+logger = logging.getLogger(__name__)
+
+# страховочная перепроверка при watchfiles: событие могло потеряться
+WATCH_RESCAN_MS = 5000
+
+
+class WatchedFile:
+    def __init__(self, path: str, parse: Callable[[Any], Any], apply: Callable[[Any], None],
+                 persister: Callable[[], WriteBehindPersister | None]):
+        self.path = os.path.abspath(path)
+        self.parse = parse
+        self.apply = apply
+        self.persister = persister
+        self.signature = file_signature(self.path)
+
+
+class FileWatcher:
+    """Picks up files edited by hand while the bot runs.
+
+    Changes are noticed through watchfiles (inotify and friends) when it is
+    installed, otherwise by polling mtime every `interval` seconds. The new
+    file is read and validated in a worker thread; `apply` then runs on the
+    event loop in one go. Our own writes are recognised by the signature the
+    persister remembers, and nothing is read while it has unwritten changes —
+    the file is about to be overwritten anyway (last writer wins).
+    """
+
+    def __init__(self, interval: float = 0.5):
+        self.interval = interval
+        self.reloads = 0
+        self._files: List[WatchedFile] = []
+        self._stop: asyncio.Event | None = None
+        self._task: asyncio.Task | None = None
+
+    def watch(self, path: str, parse: Callable[[Any], Any], apply: Callable[[Any], None],
+              persister: Callable[[], WriteBehindPersister | None] = lambda: None):
+        """`parse` gets the decoded JSON and raises ValueError if it is unusable."""
+        self._files.append(WatchedFile(path, parse, apply, persister))
+
+    def start(self):
+        if self._task is not None or not self._files:
+            return
+        self._stop = asyncio.Event()
+        self._task = asyncio.create_task(self._run(), name="file-watcher")
+        logger.info("Watching %s (%s)", ", ".join(f.path for f in self._files),
+                    "watchfiles" if awatch is not None else f"polling every {self.interval}s")
+
+    async def stop(self):
+        if self._task is None:
+            return
+        self._stop.set()
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+
+    async def _run(self):
+        if awatch is not None:
+            # каталог, а не файл: atomic_write_json и редакторы подменяют файл целиком
+            directories = {os.path.dirname(f.path) for f in self._files}
+            names = {f.path for f in self._files}
+            async for _ in awatch(
+                *directories, stop_event=self._stop, debounce=200, rust_timeout=WATCH_RESCAN_MS,
+                yield_on_timeout=True, watch_filter=lambda change, path: os.path.abspath(path) in names,
+            ):
+                await self.check()
+        else:
+            while True:
+                await asyncio.sleep(self.interval)
+                await self.check()
+
+    async def check(self):
+        for watched in self._files:
+            try:
+                await self._check_file(watched)
+            except Exception:
+                logger.exception("Reload of %s failed", watched.path)
+
+    async def _check_file(self, watched: WatchedFile):
+        signature = file_signature(watched.path)
+        if signature is None or signature == watched.signature:
+            return
+        persister = watched.persister()
+        if persister is not None and persister.busy:
+            return
+        if persister is not None and signature == persister.signature:
+            watched.signature = signature
+            return
+        try:
+            data = await asyncio.to_thread(_read, watched.path, watched.parse)
+        except (OSError, ValueError) as e:
+            # битый файл не трогаем, пока его не поправят ещё раз
+            watched.signature = signature
+            logger.warning("Ignoring invalid %s: %s", watched.path, e)
+            return
+        # пока читали, бот мог сам изменить данные — тогда файл всё равно перезапишется
+        if persister is not None and persister.busy:
+            return
+        watched.signature = signature
+        watched.apply(data)
+        self.reloads += 1
+        logger.info("Reloaded %s", watched.path)
+
+
+def _read(path: str, parse: Callable[[Any], Any]) -> Any:
+    with open(path, "r", encoding="utf-8") as f:
+        try:
+            data = json.load(f)
+        except json.JSONDecodeError as e:
+            raise ValueError(f"invalid JSON: {e}") from None
+    return parse(data)
+
+
+def watch_jobservice(watcher: FileWatcher, jobs_service: Jobservice, catalog: bool = True) -> FileWatcher:
+    """Hot reload of admins.json and, with the JSON backend (`catalog`), jobs.json."""
+    if catalog:
+        watcher.watch(
+            jobs_service.jobs_file, validate_catalog, jobs_service.replace_jobs,
+            lambda: getattr(jobs_service.storage, "persister", None),
+        )
+    watcher.watch(jobs_service.admins_file, parse_roles, jobs_service.replace_roles,
+                  lambda: jobs_service.roles_persister)
+    return watcher
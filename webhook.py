@@ -0,0 +1,126 @@
+import asyncio
+import logging
+from typing import Any, Awaitable, List
+
+from aiohttp import web
+from aiogram import Bot, Dispatcher
+from aiogram.webhook.aiohttp_server import SimpleRequestHandler, setup_application
+
+logger = logging.getLogger(__name__)
+
+HANDLING_MODES = ("background", "inline", "workers")
+
+
+class WorkerPoolRequestHandler(SimpleRequestHandler):
+    """Acknowledges the POST at once and feeds updates through a fixed pool of workers.
+
+    The queue is bounded: once `backlog` updates are waiting, new POSTs wait
+    for a free slot, which pushes back on Telegram instead of growing memory.
+    """
+
+    def __init__(self, dispatcher: Dispatcher, bot: Bot, workers: int = 8, backlog: int = 1000, **kwargs: Any):
+        super().__init__(dispatcher, bot, handle_in_background=True, **kwargs)
+        self.workers = workers
+        self._queue: "asyncio.Queue[dict]" = asyncio.Queue(backlog)
+        self._tasks: List[asyncio.Task] = []
+
+    def register(self, app: web.Application, /, path: str, **kwargs: Any) -> None:
+        super().register(app, path=path, **kwargs)
+        app.on_startup.append(self._start_workers)
+
+    async def _start_workers(self, *_: Any) -> None:
+        self._tasks = [asyncio.create_task(self._worker(), name=f"webhook-worker:{i}") for i in range(self.workers)]
+
+    async def _worker(self) -> None:
+        while True:
+            update = await self._queue.get()
+            try:
+                await self._background_feed_update(self.bot, update)
+            except Exception:
+                logger.exception("Webhook update failed")
+            finally:
+                self._queue.task_done()
+
+    async def _handle_request_background(self, bot: Bot, request: web.Request) -> web.Response:
+        await self._queue.put(await request.json(loads=bot.session.json_loads))
+        return web.json_response({}, dumps=bot.session.json_dumps)
+
+    async def close(self) -> None:
+        # обрабатываем уже принятые апдейты, потом гасим воркеров
+        await self._queue.join()
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        await super().close()
+
+
+def build_app(
+    dp: Dispatcher,
+    bot: Bot,
+    path: str = "/webhook",
+    secret: str = "",
+    handling: str = "background",
+    workers: int = 8,
+    backlog: int = 1000,
+) -> web.Application:
+    """aiohttp app that feeds POSTed updates into `dp`.
+
+    handling: "background" — answer 200 at once, one task per update;
+    "inline" — handle inside the request (Telegram waits, at most
+    max_connections updates in flight); "workers" — answer at once, fixed
+    worker pool behind a bounded queue. With bot.create_dispatcher the
+    UpdateScheduler does the actual queueing, so "inline" answers as soon
+    as the update is queued and holds the POST only while the backlog is full.
+    """
+    if handling not in HANDLING_MODES:
+        raise ValueError(f"unknown webhook handling mode: {handling!r}")
+    app = web.Application()
+    if handling == "workers":
+        handler = WorkerPoolRequestHandler(dp, bot, workers=workers, backlog=backlog, secret_token=secret or None)
+    else:
+        handler = SimpleRequestHandler(dp, bot, handle_in_background=handling == "background", secret_token=secret or None)
+    handler.register(app, path=path)
+    # startup/shutdown диспетчера (закрытие FSM-хранилища и т.п.) — вместе с приложением
+    setup_application(app, dp, bot=bot)
+    return app
+
+
+async def run_webhook(
+    dp: Dispatcher,
+    bot: Bot,
+    *,
+    url: str = "",
+    host: str = "0.0.0.0",
+    port: int = 8080,
+    path: str = "/webhook",
+    secret: str = "",
+    handling: str = "background",
+    workers: int = 8,
+    backlog: int = 1000,
+    max_connections: int = 40,
+    until: Awaitable | None = None,
+):
+    """Serve the webhook until cancelled or `until` completes. With `url` set, registers it via setWebhook on startup.
+
+    On exit the server stops accepting POSTs, and the app shutdown drains
+    the accepted updates before storages close.
+    """
+    app = build_app(dp, bot, path=path, secret=secret, handling=handling, workers=workers, backlog=backlog)
+    if url:
+        async def set_webhook(*_: Any):
+            await bot.set_webhook(
+                url.rstrip("/") + path,
+                secret_token=secret or None,
+                allowed_updates=dp.resolve_used_update_types(),
+                max_connections=max_connections,
+            )
+            logger.info("Webhook set to %s%s", url.rstrip("/"), path)
+        app.on_startup.append(set_webhook)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    await web.TCPSite(runner, host, port).start()
+    logger.info("Webhook server on %s:%d%s (handling=%s)", host, port, path, handling)
+    try:
+        await (until if until is not None else asyncio.Event().wait())
+    finally:
+        await runner.cleanup()